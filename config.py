@@ -5,28 +5,71 @@ from environs import Env
 
 @dataclass
 class DbConfig:
+    engine: str
     host: str
     port: str
     password: str
     user: str
     database: str
+    conn_max_age: int
+    health_checks: bool
+    connect_timeout: int
+    pool_size: int
+    pool_timeout: float
+    health_check_interval: int
+    pool_max_age: int
+    replicas: list
+    replica_selection: str
+    primary_pin_seconds: int
+
+
+@dataclass
+class ShopConfig:
+    async_views: bool
+    metrics_dir: str
+    metrics_allowed_ips: list
+    slow_query_ms: int
+    slow_query_log: str
 
 
 @dataclass
 class Config:
     db: DbConfig
+    shop: ShopConfig
 
 
 def load_config(path: str = None):
     env = Env()
     env.read_env(path)
 
+    # SQLite only needs the optional DB_NAME file, MySQL needs all the connection variables
+    engine = env.str('DB_ENGINE', 'mysql')
+    db_default = {'default': ''} if engine == 'sqlite' else {}
+
     return Config(
         db=DbConfig(
-            host=env.str('DB_HOST'),
-            port=env.str('PORT'),
-            password=env.str('DB_PASS'),
-            user=env.str('DB_USER'),
-            database=env.str('DB_NAME')
+            engine=engine,
+            host=env.str('DB_HOST', **db_default),
+            port=env.str('PORT', **db_default),
+            password=env.str('DB_PASS', **db_default),
+            user=env.str('DB_USER', **db_default),
+            database=env.str('DB_NAME', **db_default),
+            conn_max_age=env.int('DB_CONN_MAX_AGE', 60),
+            health_checks=env.bool('DB_HEALTH_CHECKS', True),
+            connect_timeout=env.int('DB_CONNECT_TIMEOUT', 5),
+            pool_size=env.int('DB_POOL_SIZE', 0),
+            pool_timeout=env.float('DB_POOL_TIMEOUT', 10),
+            health_check_interval=env.int('DB_HEALTH_CHECK_INTERVAL', 30),
+            pool_max_age=env.int('DB_POOL_MAX_AGE', 3600),
+            replicas=env.list('DB_REPLICAS', []),
+            replica_selection=env.str('DB_REPLICA_SELECTION', 'round_robin'),
+            primary_pin_seconds=env.int('DB_PRIMARY_PIN_SECONDS', 5)
+        ),
+        shop=ShopConfig(
+            async_views=env.bool('SHOP_ASYNC_VIEWS', False),
+            metrics_dir=env.str('SHOP_METRICS_DIR', ''),
+            metrics_allowed_ips=env.list('SHOP_METRICS_ALLOWED_IPS', []),
+            slow_query_ms=env.int('SHOP_SLOW_QUERY_MS', 200),
+            slow_query_log=env.str('SHOP_SLOW_QUERY_LOG', '')
         )
     )
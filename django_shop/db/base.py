@@ -0,0 +1,55 @@
+"""
+MySQL database backend taking its connections from a pool of the worker process.
+
+Django releases the connection at the end of every request (the pooled settings use CONN_MAX_AGE = 0),
+which returns the raw connection to the pool instead of closing it. The POOL dict of the database settings
+configures the pool: SIZE, TIMEOUT, HEALTH_CHECK_INTERVAL and MAX_AGE (seconds)
+"""
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from django_shop.db.pool import ConnectionPool, get_pool
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    """
+    MySQL DatabaseWrapper checking connections out of a ConnectionPool and back in on close
+    """
+    pooled = None
+
+    def get_pool(self) -> ConnectionPool:
+        options = self.settings_dict.get('POOL', {})
+        return get_pool(self.alias, lambda: ConnectionPool(
+            connect=super(DatabaseWrapper, self).get_new_connection,
+            close=lambda connection: connection.close(),
+            check=lambda connection: connection.ping(),
+            size=options.get('SIZE', 10),
+            timeout=options.get('TIMEOUT', 10),
+            health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 30),
+            max_age=options.get('MAX_AGE', 3600),
+        ))
+
+    def get_new_connection(self, conn_params):
+        self.pooled = self.get_pool().checkout(conn_params)
+        return self.pooled.connection
+
+    def init_connection_state(self):
+        # The session variables survive in the pool, so they are set once per raw connection
+        if not self.pooled.initialized:
+            super().init_connection_state()
+            self.pooled.initialized = True
+
+    def _set_autocommit(self, autocommit):
+        if self.pooled is None or self.pooled.autocommit != autocommit:
+            super()._set_autocommit(autocommit)
+            if self.pooled is not None:
+                self.pooled.autocommit = autocommit
+
+    def _close(self):
+        if self.connection is None or self.pooled is None:
+            return super()._close()
+
+        pooled, self.pooled = self.pooled, None
+        reusable = not self.in_atomic_block and pooled.autocommit is not False and (
+            not self.errors_occurred or self.is_usable()
+        )
+        self.get_pool().checkin(pooled, reusable)
@@ -0,0 +1,57 @@
+"""
+Import required libraries for the middleware pinning the reads of recent writers to the primary
+"""
+import asyncio
+import time
+
+from django.conf import settings
+
+from django_shop.db.router import start_request, finish_request
+
+PIN_COOKIE = 'db_primary_until'
+
+
+class PrimaryPinMiddleware:
+    """
+    Keep the reads of a user on the primary for DATABASE_PRIMARY_PIN_SECONDS after a request that wrote the catalog
+    or the favorites, so the user sees their review, favorite or purchase before the replicas catch up
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = start_request(self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            state = finish_request(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        token = start_request(self.is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = finish_request(token)
+        return self.pin(response, state)
+
+    def is_pinned(self, request) -> bool:
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def pin(self, response, state):
+        seconds = getattr(settings, 'DATABASE_PRIMARY_PIN_SECONDS', 5)
+        if state.written and seconds:
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time() + seconds)), max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,148 @@
+"""
+Import required libraries for the database connection pool
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection of a full pool is returned in time
+    """
+
+
+class PooledConnection:
+    """
+    Raw database connection with the times of its creation and of its last return to the pool
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+        self.initialized = False
+        self.autocommit = None
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of raw database connections of one worker process.
+    Idle connections are checked with `check` before reuse when they idled longer than the health-check interval
+    and replaced once older than the max age
+    """
+
+    def __init__(self, connect, close, check, size: int, timeout: float, health_check_interval: float,
+                 max_age: float):
+        self.connect = connect
+        self.close = close
+        self.check = check
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_age = max_age
+        self.pid = os.getpid()
+
+        self._idle = deque()
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._stats = {'checkouts': 0, 'waits': 0, 'wait_time_s': 0.0, 'timeouts': 0, 'created': 0,
+                       'reconnects': 0, 'expired': 0, 'discarded': 0}
+
+    def checkout(self, conn_params: dict) -> PooledConnection:
+        with self._condition:
+            self._stats['checkouts'] += 1
+            if not self._idle and self._in_use >= self.size:
+                self._stats['waits'] += 1
+                start = time.monotonic()
+                if not self._condition.wait_for(lambda: self._idle or self._in_use < self.size, self.timeout):
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection was released in {self.timeout} seconds')
+                self._stats['wait_time_s'] += time.monotonic() - start
+            pooled = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            return self.prepare(pooled, conn_params)
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def prepare(self, pooled, conn_params: dict) -> PooledConnection:
+        if pooled is not None:
+            now = time.monotonic()
+            if now - pooled.created_at > self.max_age:
+                self._count('expired')
+                self._close(pooled)
+                return self._create(conn_params)
+            if now - pooled.released_at > self.health_check_interval:
+                try:
+                    self.check(pooled.connection)
+                except Exception:
+                    self._count('reconnects')
+                    self._close(pooled)
+                    return self._create(conn_params)
+            return pooled
+        return self._create(conn_params)
+
+    def checkin(self, pooled: PooledConnection, reusable: bool = True) -> None:
+        if not reusable:
+            self._count('discarded')
+            self._close(pooled)
+        with self._condition:
+            self._in_use -= 1
+            if reusable:
+                pooled.released_at = time.monotonic()
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                'pid': self.pid,
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                **self._stats,
+                'wait_time_s': round(self._stats['wait_time_s'], 6),
+            }
+
+    def _create(self, conn_params: dict) -> PooledConnection:
+        pooled = PooledConnection(self.connect(conn_params))
+        self._count('created')
+        return pooled
+
+    def _close(self, pooled: PooledConnection) -> None:
+        try:
+            self.close(pooled.connection)
+        except Exception:
+            pass
+
+    def _count(self, name: str) -> None:
+        with self._condition:
+            self._stats[name] += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, factory) -> ConnectionPool:
+    """
+    Return the pool of the database alias in the current process, pools are never shared with forked workers
+    """
+    key = (os.getpid(), alias)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = factory()
+        return _pools[key]
+
+
+def get_pools_stats() -> dict:
+    pid = os.getpid()
+    with _pools_lock:
+        pools = {alias: pool for (pool_pid, alias), pool in _pools.items() if pool_pid == pid}
+    return {alias: pool.stats() for alias, pool in pools.items()}
@@ -0,0 +1,143 @@
+"""
+Import required libraries for the primary/replica database router
+"""
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRIMARY = 'default'
+CATALOG_MODELS = {'shop.category', 'shop.item', 'shop.productgallery', 'shop.review'}
+# Writes that the replicated reads have to see, favorites are read by joining them to the items
+PINNING_MODELS = CATALOG_MODELS | {'shop.favorite'}
+ROUND_ROBIN = 'round_robin'
+LEAST_LATENCY = 'least_latency'
+LATENCY_WEIGHT = 0.2
+
+_request_state = contextvars.ContextVar('database_request_state', default=None)
+_forced_primary = contextvars.ContextVar('database_forced_primary', default=False)
+
+
+class RequestState:
+    """
+    Routing state of one request: whether its reads are pinned to the primary and whether it wrote
+    rows that the replicated reads depend on
+    """
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.written = False
+
+
+class ReplicaSelector:
+    """
+    Pick the replica of the next read in turn or by the lowest moving average of the query time
+    """
+
+    def __init__(self):
+        self.counter = itertools.count()
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def select(self, replicas: list, strategy: str) -> str:
+        if strategy == LEAST_LATENCY:
+            # Replicas without measures yet are tried first
+            return min(replicas, key=lambda alias: self.latencies.get(alias, 0.0))
+        return replicas[next(self.counter) % len(replicas)]
+
+    def record(self, alias: str, duration: float) -> None:
+        with self.lock:
+            previous = self.latencies.get(alias)
+            self.latencies[alias] = duration if previous is None else previous + LATENCY_WEIGHT * (duration - previous)
+
+
+selector = ReplicaSelector()
+
+
+def get_replicas() -> list:
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def start_request(pinned: bool) -> contextvars.Token:
+    return _request_state.set(RequestState(pinned))
+
+
+def finish_request(token: contextvars.Token) -> RequestState:
+    state = _request_state.get()
+    _request_state.reset(token)
+    return state
+
+
+@contextmanager
+def use_primary():
+    """
+    Send every read of the block to the primary
+    """
+    token = _forced_primary.set(True)
+    try:
+        yield
+    finally:
+        _forced_primary.reset(token)
+
+
+def get_model_label(model) -> str:
+    # The table of a many-to-many field belongs to the model declaring the field
+    opts = model._meta
+    return (opts.auto_created._meta if opts.auto_created else opts).label_lower
+
+
+def is_primary_pinned() -> bool:
+    if _forced_primary.get() or connections[PRIMARY].in_atomic_block:
+        return True
+    state = _request_state.get()
+    return state is not None and (state.pinned or state.written)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send the catalog reads to the replicas and everything else to the primary.
+    Reads go to the primary inside transactions, in use_primary blocks and for the requests of users who wrote recently
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or model._meta.label_lower not in CATALOG_MODELS or is_primary_pinned():
+            return PRIMARY
+        return selector.select(replicas, getattr(settings, 'DATABASE_REPLICA_SELECTION', ROUND_ROBIN))
+
+    def db_for_write(self, model, **hints):
+        # Sessions, last logins and baskets are read from the primary anyway and do not pin the user
+        state = _request_state.get()
+        if state is not None and get_model_label(model) in PINNING_MODELS:
+            state.written = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def record_latency(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        selector.record(context['connection'].alias, time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def measure_replica_latency(sender, connection, **kwargs):
+    """
+    This function is a connection_created signal receiver for measuring the query time of the replicas
+    """
+    if connection.alias in get_replicas() and record_latency not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_latency)
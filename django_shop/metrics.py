@@ -0,0 +1,269 @@
+"""
+Per-view request metrics of the worker processes: latency histogram, SQL queries and time, cache hits and misses.
+
+Every process aggregates its own counters in memory and, when SHOP_METRICS_DIR is set, writes them every
+SHOP_METRICS_FLUSH_INTERVAL seconds to <pid>.json in that directory. The metrics endpoint sums the files of all
+the processes, so the directory has to be shared by the workers and emptied when the server starts
+"""
+import asyncio
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from django_shop.slow_queries import record_slow_query
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_VIEW = 'unmatched'
+
+_request_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+def get_empty_stats() -> dict:
+    return {
+        'count': 0, 'sum': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS), 'statuses': {},
+        'queries': 0, 'sql_seconds': 0.0, 'cache_hits': 0, 'cache_misses': 0,
+    }
+
+
+class RequestMetrics:
+    """
+    Counters of the request being served
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class MetricsRegistry:
+    """
+    Thread-safe aggregate of the request metrics of one process by view name
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.views = {}
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def record(self, view: str, status: int, duration: float, metrics: RequestMetrics) -> None:
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = get_empty_stats()
+            stats['count'] += 1
+            stats['sum'] += duration
+            for number, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][number] += 1
+                    break
+            stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+            stats['queries'] += metrics.queries
+            stats['sql_seconds'] += metrics.sql_time
+            stats['cache_hits'] += metrics.cache_hits
+            stats['cache_misses'] += metrics.cache_misses
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return json.loads(json.dumps(self.views))
+
+    def flush(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.pid}.json')
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f'{path}.tmp', path)
+        self.flushed_at = time.monotonic()
+
+    def flush_if_due(self) -> None:
+        directory = getattr(settings, 'SHOP_METRICS_DIR', None)
+        if directory and time.monotonic() - self.flushed_at >= getattr(settings, 'SHOP_METRICS_FLUSH_INTERVAL', 5):
+            self.flush(directory)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    """
+    Return the registry of the current process, a forked worker starts with an empty one
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.pid != os.getpid():
+            _registry = MetricsRegistry()
+        return _registry
+
+
+@atexit.register
+def flush_on_exit() -> None:
+    directory = getattr(settings, 'SHOP_METRICS_DIR', None)
+    if directory and _registry is not None and _registry.pid == os.getpid():
+        _registry.flush(directory)
+
+
+def record_cache(hit: bool) -> None:
+    metrics = _request_metrics.get()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_time += time.perf_counter() - start
+
+
+def get_current_view():
+    metrics = _request_metrics.get()
+    if metrics is None:
+        return None
+    match = metrics.request.resolver_match
+    return match.view_name if match is not None else UNMATCHED_VIEW
+
+
+def install_query_wrapper(connection) -> None:
+    for wrapper in (record_query, record_slow_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """
+    This function is a connection_created signal receiver for counting the queries of the requests
+    and recording the slow ones
+    """
+    install_query_wrapper(connection)
+
+
+def collect_metrics() -> dict:
+    """
+    Sum the metrics of all the processes flushed to SHOP_METRICS_DIR, or return those of the current process
+    """
+    registry = get_registry()
+    directory = getattr(settings, 'SHOP_METRICS_DIR', None)
+    if not directory:
+        return registry.snapshot()
+    registry.flush(directory)
+
+    totals = {}
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                views = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for view, stats in views.items():
+            total = totals.setdefault(view, get_empty_stats())
+            for key in ('count', 'sum', 'queries', 'sql_seconds', 'cache_hits', 'cache_misses'):
+                total[key] += stats[key]
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+            for status, count in stats['statuses'].items():
+                total['statuses'][status] = total['statuses'].get(status, 0) + count
+    return totals
+
+
+def render_metrics(views: dict) -> str:
+    """
+    Render the metrics in the Prometheus text exposition format
+    """
+    lines = [
+        '# HELP shop_request_duration_seconds Latency of the requests by view.',
+        '# TYPE shop_request_duration_seconds histogram',
+    ]
+    for view, stats in sorted(views.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append(f'shop_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+        lines.append(f'shop_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'shop_request_duration_seconds_sum{{view="{view}"}} {stats["sum"]:.6f}')
+        lines.append(f'shop_request_duration_seconds_count{{view="{view}"}} {stats["count"]}')
+
+    lines += ['# HELP shop_requests_total Requests by view and status.', '# TYPE shop_requests_total counter']
+    for view, stats in sorted(views.items()):
+        for status, count in sorted(stats['statuses'].items()):
+            lines.append(f'shop_requests_total{{view="{view}",status="{status}"}} {count}')
+
+    counters = [
+        ('shop_sql_queries_total', 'queries', 'SQL queries run by the requests of the view.'),
+        ('shop_sql_duration_seconds_total', 'sql_seconds', 'Time spent in SQL queries by the requests of the view.'),
+        ('shop_cache_hits_total', 'cache_hits', 'Cache hits of the requests of the view.'),
+        ('shop_cache_misses_total', 'cache_misses', 'Cache misses of the requests of the view.'),
+    ]
+    for name, key, description in counters:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        for view, stats in sorted(views.items()):
+            lines.append(f'{name}{{view="{view}"}} {round(stats[key], 6)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, SQL queries and cache results of every request under the name of its URL pattern
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(connection)
+        metrics = RequestMetrics(request)
+        token = _request_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_metrics.reset(token)
+        self.record(request, response, time.perf_counter() - start, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics(request)
+        token = _request_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_metrics.reset(token)
+        self.record(request, response, time.perf_counter() - start, metrics)
+        return response
+
+    def record(self, request, response, duration: float, metrics: RequestMetrics) -> None:
+        match = request.resolver_match
+        view = match.view_name if match is not None else UNMATCHED_VIEW
+        registry = get_registry()
+        registry.record(view, response.status_code, duration, metrics)
+        registry.flush_if_due()
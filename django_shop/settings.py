@@ -54,7 +54,9 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'django_shop.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'django_shop.db.middleware.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,20 +96,119 @@ WSGI_APPLICATION = 'django_shop.wsgi.application'
 
 CONFIG = load_config()
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
+# With DB_POOL_SIZE set, connections are taken from a pool of every worker process and returned to it
+# at the end of each request, otherwise every thread keeps its own connection for DB_CONN_MAX_AGE seconds.
+# DB_ENGINE=sqlite runs the shop on the DB_NAME file (db.sqlite3 by default) for local measures
+
+MYSQL_DATABASE = {
+    'ENGINE': 'django_shop.db' if CONFIG.db.pool_size else 'django.db.backends.mysql',
+
+    'NAME': CONFIG.db.database,
+
+    'USER': CONFIG.db.user,
+
+    'PASSWORD': CONFIG.db.password,
 
-        'NAME': CONFIG.db.database,
+    'HOST': CONFIG.db.host,
 
-        'USER': CONFIG.db.user,
+    'PORT': CONFIG.db.port,
 
-        'PASSWORD': CONFIG.db.password,
+    'CONN_MAX_AGE': 0 if CONFIG.db.pool_size else CONFIG.db.conn_max_age,
 
-        'HOST': CONFIG.db.host,
+    'CONN_HEALTH_CHECKS': CONFIG.db.health_checks,
+
+    'OPTIONS': {
+        'connect_timeout': CONFIG.db.connect_timeout,
+    },
+
+    'POOL': {
+        'SIZE': CONFIG.db.pool_size,
+        'TIMEOUT': CONFIG.db.pool_timeout,
+        'HEALTH_CHECK_INTERVAL': CONFIG.db.health_check_interval,
+        'MAX_AGE': CONFIG.db.pool_max_age,
+    },
+}
 
-        'PORT': CONFIG.db.port,
+SQLITE_DATABASE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+
+    'NAME': CONFIG.db.database or BASE_DIR / 'db.sqlite3',
+
+    'OPTIONS': {
+        'timeout': 20,
+    },
+}
+
+DATABASES = {
+    'default': SQLITE_DATABASE if CONFIG.db.engine == 'sqlite' else MYSQL_DATABASE,
+}
+
+# Read replicas of the default database as HOST or HOST:PORT (files with SQLite),
+# the router sends the catalog reads to them
+
+for number, replica in enumerate(CONFIG.db.replicas, start=1):
+    if CONFIG.db.engine == 'sqlite':
+        DATABASES[f'replica_{number}'] = {**SQLITE_DATABASE, 'NAME': replica, 'TEST': {'MIRROR': 'default'}}
+        continue
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **MYSQL_DATABASE,
+        'HOST': host,
+        'PORT': port or CONFIG.db.port,
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_REPLICA_SELECTION = CONFIG.db.replica_selection
+
+DATABASE_PRIMARY_PIN_SECONDS = CONFIG.db.primary_pin_seconds
+
+DATABASE_ROUTERS = ['django_shop.db.router.PrimaryReplicaRouter']
+
+# Serve the JSON endpoints of the shop with the native async views (for ASGI deployments)
+
+SHOP_ASYNC_VIEWS = CONFIG.shop.async_views
+
+# Directory shared by the worker processes to aggregate the request metrics, empty to keep them per process
+
+SHOP_METRICS_DIR = CONFIG.shop.metrics_dir or None
+
+# Addresses of the scrapers allowed to read /metrics besides staff users, none by default.
+# Behind a reverse proxy on the same host every request comes from loopback, so list it only without one
+
+SHOP_METRICS_ALLOWED_IPS = CONFIG.shop.metrics_allowed_ips
+
+# SQL statements slower than SHOP_SLOW_QUERY_MS milliseconds (0 disables the recorder) are written with their
+# EXPLAIN plan to a rotating JSON lines file, summarized by the slow_query_report command
+
+SHOP_SLOW_QUERY_MS = CONFIG.shop.slow_query_ms
+
+SHOP_SLOW_QUERY_LOG = CONFIG.shop.slow_query_log or BASE_DIR / 'logs' / 'slow_queries.jsonl'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'django_shop.slow_queries.SlowQueryFileHandler',
+            'filename': SHOP_SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'shop.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 # Password validation
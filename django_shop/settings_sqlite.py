@@ -0,0 +1,15 @@
+"""
+Settings profile running the shop on SQLite without the MySQL environment variables,
+for the local catalog generator and benchmarks:
+
+    DJANGO_SETTINGS_MODULE=django_shop.settings_sqlite python manage.py migrate
+"""
+import os
+
+os.environ.setdefault('DB_ENGINE', 'sqlite')
+
+from django_shop.settings import *  # noqa: E402,F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver']
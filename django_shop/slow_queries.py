@@ -0,0 +1,121 @@
+"""
+Slow-query recorder: an execute wrapper writing the SQL statements slower than SHOP_SLOW_QUERY_MS to the
+'shop.slow_queries' logger as JSON lines, with the view, the project frame and template line that ran them,
+the fingerprint of the statement and its EXPLAIN plan
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger('shop.slow_queries')
+
+_explaining = contextvars.ContextVar('slow_query_explaining', default=False)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+PLACEHOLDER = re.compile(r'%s|\?')
+WHITESPACE = re.compile(r'\s+')
+
+
+class SlowQueryFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler creating the directory of the log file on first write
+    """
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.baseFilename)), exist_ok=True)
+        return super()._open()
+
+
+def normalize_sql(sql: str) -> str:
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    sql = PLACEHOLDER.sub('?', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def get_fingerprint(sql: str) -> str:
+    return hashlib.md5(normalize_sql(sql).encode()).hexdigest()[:16]
+
+
+def get_call_site() -> tuple:
+    """
+    Return the innermost frame of the project code and the innermost template line running the current query
+    """
+    base_dir = str(settings.BASE_DIR)
+    instrumentation_dir = os.path.dirname(__file__)
+    frame, template = None, None
+    current = sys._getframe(2)
+    while current is not None and (frame is None or template is None):
+        filename = current.f_code.co_filename
+        if frame is None and filename.startswith(base_dir) and 'site-packages' not in filename \
+                and not filename.startswith(instrumentation_dir):
+            frame = f'{os.path.relpath(filename, base_dir)}:{current.f_lineno} in {current.f_code.co_name}'
+        if template is None and current.f_code.co_name == 'render_annotated':
+            node = current.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                template = f'{origin.template_name}:{token.lineno}'
+        current = current.f_back
+    return frame, template
+
+
+def explain(connection, sql: str, params) -> list:
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    token = _explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return [' | '.join(str(value) for value in row) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return [f'EXPLAIN failed: {error}']
+    finally:
+        _explaining.reset(token)
+
+
+def record_slow_query(execute, sql, params, many, context):
+    threshold = getattr(settings, 'SHOP_SLOW_QUERY_MS', 200)
+    if not threshold or _explaining.get():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        if duration >= threshold:
+            log_slow_query(sql, params, many, context['connection'], duration)
+
+
+def log_slow_query(sql: str, params, many: bool, connection, duration: float) -> None:
+    # Imported here as the metrics module installs this wrapper
+    from django_shop.metrics import get_current_view
+
+    frame, template = get_call_site()
+    plan = None
+    if not many and getattr(settings, 'SHOP_SLOW_QUERY_EXPLAIN', True) and not connection.needs_rollback:
+        plan = explain(connection, sql, params)
+    logger.warning(json.dumps({
+        'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'duration_ms': round(duration, 3),
+        'database': connection.alias,
+        'view': get_current_view(),
+        'frame': frame,
+        'template': template,
+        'fingerprint': get_fingerprint(sql),
+        'sql': normalize_sql(sql),
+        'many': many,
+        'explain': plan,
+    }, ensure_ascii=False))
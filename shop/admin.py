@@ -3,7 +3,8 @@ Import required libraries for admin
 """
 from django.contrib import admin
 
-from shop.models import Item, Category, Review, ProductGallery, Favorite, Purchase
+from shop.models import Item, Category, Review, ProductGallery, Favorite, Purchase, PurchaseLine
+from shop.sevices import reset_favorites_cache
 
 
 class Gallery(admin.TabularInline):
@@ -14,11 +15,21 @@ class Gallery(admin.TabularInline):
     model = ProductGallery
 
 
+class PurchaseLines(admin.TabularInline):
+    """
+    Inline class for the PurchaseLine model
+    """
+    model = PurchaseLine
+    raw_id_fields = ['item']
+    extra = 0
+
+
 class ItemAdmin(admin.ModelAdmin):
     """
     ModelAdmin class for the Item model
     """
-    list_display = ['id', 'title', 'created_at']
+    list_display = ['id', 'sku', 'title', 'created_at']
+    search_fields = ['sku']
     inlines = [Gallery, ]
 
 
@@ -29,8 +40,37 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
+class FavoriteAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin class for the Favorite model, it drops the cached favorites of the changed users
+    """
+    list_display = ['id', 'user', 'item']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        reset_favorites_cache(obj.user_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        reset_favorites_cache(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            reset_favorites_cache(user_id)
+
+
+class PurchaseAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin class for the Purchase model
+    """
+    list_display = ['id', 'email', 'total_price', 'created_at']
+    inlines = [PurchaseLines, ]
+
+
 admin.site.register(Item, ItemAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Review)
-admin.site.register(Favorite)
-admin.site.register(Purchase)
+admin.site.register(Favorite, FavoriteAdmin)
+admin.site.register(Purchase, PurchaseAdmin)
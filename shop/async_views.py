@@ -0,0 +1,81 @@
+"""
+The necessary imports for the asynchronous views of the shop JSON endpoints.
+They are served instead of the views of the same names when SHOP_ASYNC_VIEWS is enabled
+"""
+from django.contrib.auth.views import redirect_to_login
+from django.http import JsonResponse, HttpResponseNotAllowed
+
+from shop.sevices import aload_request_state, aadd_favorites, adelete_favorites, acheck_favorite, aadd_to_basket, \
+    adelete_from_basket, acheck_basket
+from shop.views import get_posted_item_ids, get_posted_int
+
+
+async def add_favorite_view(request):
+    """
+    Add one or several Items (repeated `item` fields) to the user's favorite list
+    """
+    await aload_request_state(request)
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if request.method == 'POST':
+        await aadd_favorites(get_posted_item_ids(request), user_id=request.user.pk)
+        return JsonResponse({'success': True})
+
+
+async def delete_favorite_view(request):
+    """
+    Delete one or several Items (repeated `item` fields) from the user's favorite list
+    """
+    await aload_request_state(request)
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if request.method == 'POST':
+        await adelete_favorites(get_posted_item_ids(request), user_id=request.user.pk)
+        return JsonResponse({'success': True})
+
+
+async def check_favorite_view(request, item_pk):
+    """
+    Check if an Item is in the user's favorite list
+    """
+    if request.method == 'GET':
+        await aload_request_state(request)
+        return JsonResponse({'is_favorite': await acheck_favorite(item_pk, request.user.pk)})
+
+
+async def add_to_basket_view(request):
+    """
+    Add an Item to the user's basket or increase its quantity
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    item_id = get_posted_int(request, 'item')
+    if item_id is None:
+        return JsonResponse({'error': 'item must be an integer'}, status=400)
+    await aload_request_state(request)
+    if not await aadd_to_basket(request, item_id):
+        return JsonResponse({'error': f'There is no item {item_id}'}, status=404)
+    return JsonResponse({'success': True})
+
+
+async def delete_from_basket_view(request):
+    """
+    Remove an item from the basket
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    item_id = get_posted_int(request, 'item')
+    if item_id is None:
+        return JsonResponse({'error': 'item must be an integer'}, status=400)
+    await aload_request_state(request)
+    await adelete_from_basket(request, item_id)
+    return JsonResponse({'success': True})
+
+
+async def check_basket_view(request, item_pk):
+    """
+    Check if an item is in the basket
+    """
+    if request.method == 'GET':
+        await aload_request_state(request)
+        return JsonResponse({'in_basket': await acheck_basket(request, item_pk)})
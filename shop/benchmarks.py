@@ -0,0 +1,107 @@
+"""
+Import required libraries for the benchmark helpers
+"""
+import asyncio
+import math
+import statistics
+import time
+
+
+def percentile(values: list, percent: float) -> float:
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(timings: list) -> dict:
+    """
+    Return the statistics in milliseconds of the timings measured in seconds
+    """
+    timings = [timing * 1000 for timing in timings]
+    return {
+        'runs': len(timings),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+    }
+
+
+def measure(func, repeat: int) -> dict:
+    """
+    Call the function the given number of times and return the statistics of its timings
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple:
+    """
+    Read one HTTP/1.1 response and return its status and whether the connection can be reused
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+        return status, headers.get('connection', '').lower() != 'close'
+    await reader.read()
+    return status, False
+
+
+async def run_client(host: str, port: int, paths: list, requests: int, timings: list, errors: list) -> None:
+    reader = writer = None
+    for number in range(requests):
+        path = paths[number % len(paths)]
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: keep-alive\r\n\r\n'.encode())
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as error:
+            errors.append(type(error).__name__)
+            keep_alive = False
+        else:
+            timings.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(str(status))
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load_test(host: str, port: int, paths: list, clients: int, requests: int) -> dict:
+    """
+    Run concurrent keep-alive HTTP clients against the server and return the throughput and the latencies
+    """
+    timings = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(host, port, paths, requests, timings, errors) for _ in range(clients)])
+    duration = time.perf_counter() - start
+    return {
+        'clients': clients,
+        'requests': clients * requests,
+        'errors': len(errors),
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(timings) / duration, 1),
+        **(summarize(timings) if timings else {}),
+    }
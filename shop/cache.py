@@ -0,0 +1,90 @@
+"""
+Import required libraries for the cache versions of the shop
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from django_shop.metrics import record_cache
+
+CATEGORY_VERSION = 'category'
+CATALOG_VERSION = 'catalog'
+# Only the order by purchase_count, so that purchases leave the other cached listings alone
+POPULARITY_VERSION = 'popularity'
+
+
+def get_version_key(name: str) -> str:
+    return f'shop:version:{name}'
+
+
+def get_initial_version() -> int:
+    # Versions start from the clock so that they do not repeat after the cache is flushed
+    return int(time.time() * 1000)
+
+
+def get_version(name: str) -> int:
+    key = get_version_key(name)
+    version = cache.get(key)
+    if version is None:
+        initial = get_initial_version()
+        cache.add(key, initial, timeout=None)
+        version = cache.get(key, initial)
+    return version
+
+
+def bump_version(name: str) -> None:
+    key = get_version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, get_initial_version(), timeout=None)
+
+
+async def aget_version(name: str) -> int:
+    key = get_version_key(name)
+    version = await cache.aget(key)
+    if version is None:
+        initial = get_initial_version()
+        await cache.aadd(key, initial, timeout=None)
+        version = await cache.aget(key, initial)
+    return version
+
+
+async def abump_version(name: str) -> None:
+    key = get_version_key(name)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, get_initial_version(), timeout=None)
+
+
+def bump_version_on_commit(name: str, using: str = None) -> None:
+    """
+    Bump the version once the current transaction commits, for the changes made by queryset updates
+    that send no signals. Bumped earlier, the caches could be filled again with the rows before the change
+    """
+    transaction.on_commit(lambda: bump_version(name), using=using)
+
+
+def get_stats_key(name: str, hit: bool) -> str:
+    return f'shop:stats:{name}:{"hits" if hit else "misses"}'
+
+
+def record_cache_result(name: str, hit: bool) -> None:
+    record_cache(hit)
+    key = get_stats_key(name, hit)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_stats(names: list) -> dict:
+    keys = {get_stats_key(name, hit): (name, hit) for name in names for hit in (True, False)}
+    values = cache.get_many(list(keys))
+    stats = {name: {'hits': 0, 'misses': 0} for name in names}
+    for key, (name, hit) in keys.items():
+        stats[name]['hits' if hit else 'misses'] = values.get(key, 0)
+    return stats
@@ -0,0 +1,163 @@
+"""
+Import required libraries for the category tree lookups
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery, Count, Value
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from mptt.utils import get_cached_trees
+
+from django_shop.db.router import use_primary
+from shop.cache import get_version, CATEGORY_VERSION, CATALOG_VERSION, record_cache_result
+from shop.models import Category, Item
+
+CategoryRange = namedtuple('CategoryRange', ['tree_id', 'lft', 'rght', 'ids'])
+
+_lock = threading.Lock()
+_tree = {'version': None, 'nodes': {}, 'names': {}, 'children': {}, 'lfts': {}, 'ids': {}, 'ranges': {}}
+
+
+def _load_tree(version: int) -> dict:
+    nodes = {}
+    names = {}
+    children = defaultdict(list)
+    slugs = {}
+    lfts = defaultdict(list)
+    ids = defaultdict(list)
+    rows = Category.objects.order_by('tree_id', 'lft').values_list(
+        'slug', 'pk', 'name', 'parent_id', 'tree_id', 'lft', 'rght'
+    )
+
+    for slug, pk, name, parent_id, tree_id, lft, rght in rows:
+        nodes[slug] = (tree_id, lft, rght)
+        names[slug] = name
+        slugs[pk] = slug
+        children[slugs.get(parent_id)].append(slug)
+        lfts[tree_id].append(lft)
+        ids[tree_id].append(pk)
+
+    return {
+        'version': version, 'nodes': nodes, 'names': names, 'children': children,
+        'lfts': lfts, 'ids': ids, 'ranges': {}
+    }
+
+
+def get_category_tree() -> dict:
+    """
+    Return the in-process copy of the category tree, reloading it from the primary when the category version changes.
+    A replica could still miss the change that bumped the version, and the copy is kept until the next change
+    """
+    global _tree
+    version = get_version(CATEGORY_VERSION)
+    if _tree['version'] != version:
+        with _lock:
+            if _tree['version'] != version:
+                with use_primary():
+                    _tree = _load_tree(version)
+    return _tree
+
+
+def get_category_range(slug: str):
+    """
+    Return the MPTT interval of the category and the ids of its whole subtree, or None for an unknown slug
+    """
+    tree = get_category_tree()
+    category_range = tree['ranges'].get(slug)
+    if category_range is not None:
+        return category_range
+
+    node = tree['nodes'].get(slug)
+    if node is None:
+        return None
+
+    tree_id, lft, rght = node
+    lfts = tree['lfts'][tree_id]
+    start, end = bisect_left(lfts, lft), bisect_right(lfts, rght)
+    category_range = CategoryRange(tree_id, lft, rght, tuple(tree['ids'][tree_id][start:end]))
+    tree['ranges'][slug] = category_range
+    return category_range
+
+
+def get_child_categories(slug: str = None) -> list:
+    """
+    Return the slugs and names of the direct children of the category, or of the roots without a slug
+    """
+    tree = get_category_tree()
+    return [(child, tree['names'][child]) for child in tree['children'].get(slug, [])]
+
+
+def show_category_counts() -> bool:
+    return getattr(settings, 'SHOP_CATEGORY_MENU_COUNTS', False)
+
+
+def get_categories(with_counts: bool = False) -> list:
+    """
+    Return all categories, annotated with the number of distinct items of their subtree if requested
+    """
+    categories = Category.objects.all()
+    if with_counts:
+        links = Item.category.through.objects.filter(
+            category__tree_id=OuterRef('tree_id'),
+            category__lft__gte=OuterRef('lft'),
+            category__lft__lte=OuterRef('rght')
+        ).order_by().values('category__tree_id')
+        item_count = links.annotate(count=Count('item_id', distinct=True)).values('count')
+        categories = categories.annotate(item_count=Coalesce(Subquery(item_count), Value(0)))
+    return list(categories)
+
+
+def get_category_menu_key(kind: str) -> str:
+    with_counts = show_category_counts()
+    catalog_version = get_version(CATALOG_VERSION) if with_counts else 0
+    return f'shop:category_menu:{kind}:{get_version(CATEGORY_VERSION)}:{catalog_version}'
+
+
+def get_category_menu_html() -> str:
+    """
+    Return the rendered categories menu, cached until categories (or items, when counts are shown) change
+    """
+    key = get_category_menu_key('html')
+    html = cache.get(key)
+    record_cache_result('category_menu', html is not None)
+    if html is None:
+        with_counts = show_category_counts()
+        # The menu is kept for a day under the current versions, it is built from the primary
+        with use_primary():
+            html = render_to_string('categories_menu.html', {
+                'categories': get_categories(with_counts),
+                'show_counts': with_counts,
+            })
+        cache.set(key, html, getattr(settings, 'SHOP_CATEGORY_MENU_TIMEOUT', 60 * 60 * 24))
+    return html
+
+
+def serialize_category(category: Category) -> dict:
+    data = {
+        'id': category.pk,
+        'name': category.name,
+        'slug': category.slug,
+        'url': category.get_absolute_url(),
+        'children': [serialize_category(child) for child in category.get_children()],
+    }
+    if hasattr(category, 'item_count'):
+        data['item_count'] = category.item_count
+    return data
+
+
+def get_category_menu_tree() -> list:
+    """
+    Return the categories menu as a JSON-serializable tree, cached like the rendered menu
+    """
+    key = get_category_menu_key('json')
+    tree = cache.get(key)
+    if tree is None:
+        with use_primary():
+            roots = get_cached_trees(get_categories(show_category_counts()))
+            tree = [serialize_category(root) for root in roots]
+        cache.set(key, tree, getattr(settings, 'SHOP_CATEGORY_MENU_TIMEOUT', 60 * 60 * 24))
+    return tree
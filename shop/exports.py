@@ -0,0 +1,162 @@
+"""
+Import required libraries for the streaming exports of items, purchases and reviews
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.db.models import Prefetch, QuerySet
+from django.utils import timezone
+
+from shop.models import Item, Category, Purchase, Review
+
+EXPORT_CHUNK_SIZE = 2000
+
+ITEM_FIELDS = ['id', 'sku', 'title', 'description', 'price', 'categories', 'rating_avg', 'review_count',
+               'purchase_count', 'created_at', 'updated_at']
+PURCHASE_FIELDS = ['id', 'created_at', 'user_id', 'email', 'phone', 'is_delivery', 'country', 'city', 'street',
+                   'total_price']
+PURCHASE_LINE_FIELDS = ['line_item_id', 'line_title', 'line_unit_price', 'line_quantity']
+REVIEW_FIELDS = ['id', 'created_at', 'product_id', 'author_id', 'rate', 'text']
+
+
+class Echo:
+    """
+    File-like object returning what is written, to stream the lines of csv.writer
+    """
+
+    def write(self, value):
+        return value
+
+
+def serialize_item(item: Item) -> dict:
+    return {
+        'id': item.pk,
+        'sku': item.sku,
+        'title': item.title,
+        'description': item.description,
+        'price': str(item.price),
+        'categories': '|'.join(category.slug for category in item.category.all()),
+        'rating_avg': item.rating_avg,
+        'review_count': item.review_count,
+        'purchase_count': item.purchase_count,
+        'created_at': item.created_at.isoformat(),
+        'updated_at': item.updated_at.isoformat(),
+    }
+
+
+def serialize_purchase(purchase: Purchase) -> dict:
+    return {
+        'id': purchase.pk,
+        'created_at': purchase.created_at.isoformat(),
+        'user_id': purchase.user_id,
+        'email': purchase.email,
+        'phone': purchase.phone,
+        'is_delivery': purchase.is_delivery,
+        'country': purchase.country,
+        'city': purchase.city,
+        'street': purchase.street,
+        'total_price': str(purchase.total_price),
+        'lines': [
+            {'item_id': line.item_id, 'title': line.title, 'unit_price': str(line.unit_price),
+             'quantity': line.quantity}
+            for line in purchase.lines.all()
+        ],
+    }
+
+
+def flatten_purchase(document: dict) -> list:
+    # In CSV every line of a purchase is a row repeating the columns of the purchase
+    lines = document.pop('lines')
+    return [
+        {**document, **{f'line_{key}': value for key, value in line.items()}} for line in lines
+    ] or [document]
+
+
+def serialize_review(review: Review) -> dict:
+    return {
+        'id': review.pk,
+        'created_at': review.created_at.isoformat(),
+        'product_id': review.product_id,
+        'author_id': review.author_id,
+        'rate': review.rate,
+        'text': review.text,
+    }
+
+
+EXPORTS = {
+    'items': {
+        'queryset': lambda: Item.objects.defer('search_document', 'rating_histogram').prefetch_related(
+            Prefetch('category', queryset=Category.objects.only('pk', 'slug'))
+        ),
+        'serialize': serialize_item,
+        'fields': ITEM_FIELDS,
+    },
+    'purchases': {
+        'queryset': lambda: Purchase.objects.prefetch_related('lines'),
+        'serialize': serialize_purchase,
+        'flatten': flatten_purchase,
+        'fields': PURCHASE_FIELDS + PURCHASE_LINE_FIELDS,
+    },
+    'reviews': {
+        'queryset': lambda: Review.objects.all(),
+        'serialize': serialize_review,
+        'fields': REVIEW_FIELDS,
+    },
+}
+
+
+def get_export_queryset(name: str, since_id: int = None, date_from=None, date_to=None) -> QuerySet:
+    """
+    Return the rows of the export created between the dates (both included) and after the given id
+    """
+    queryset = EXPORTS[name]['queryset']()
+    if since_id:
+        queryset = queryset.filter(pk__gt=since_id)
+    if date_from:
+        queryset = queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        queryset = queryset.filter(
+            created_at__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+        )
+    return queryset
+
+
+def iter_chunks(queryset: QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Yield the objects of the queryset by chunks of primary keys with their prefetched rows.
+    Every chunk is a separate query, so the memory does not depend on the size of the table
+    even where the database driver buffers whole results
+    """
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_id).order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1].pk
+
+
+def iter_documents(name: str, queryset: QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE):
+    serialize = EXPORTS[name]['serialize']
+    for obj in iter_chunks(queryset, chunk_size):
+        yield serialize(obj)
+
+
+def iter_jsonl(documents):
+    for document in documents:
+        yield json.dumps(document, ensure_ascii=False) + '\n'
+
+
+def iter_csv(name: str, documents):
+    export = EXPORTS[name]
+    writer = csv.DictWriter(Echo(), fieldnames=export['fields'])
+    yield writer.writeheader()
+    flatten = export.get('flatten', lambda document: [document])
+    for document in documents:
+        for row in flatten(document):
+            yield writer.writerow(row)
+
+
+def iter_export(name: str, export_format: str, documents):
+    return iter_csv(name, documents) if export_format == 'csv' else iter_jsonl(documents)
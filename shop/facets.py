@@ -0,0 +1,106 @@
+"""
+Import required libraries for the facets of listings
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import QuerySet, Case, When, Value, Count, Min, Max, IntegerField, CharField
+
+from django_shop.db.router import use_primary
+from shop.cache import get_version, CATALOG_VERSION, CATEGORY_VERSION, record_cache_result
+from shop.categories import get_child_categories, get_category_range
+from shop.models import Item
+
+PRICE_BUCKETS = [0, 1000, 5000, 10000, 25000, 50000, 100000]
+MAX_CATEGORY_FACETS = 50
+PRICE_STEP = Decimal(1).scaleb(-Item._meta.get_field('price').decimal_places)
+
+
+def get_price_buckets() -> list:
+    return getattr(settings, 'SHOP_PRICE_BUCKETS', PRICE_BUCKETS)
+
+
+def get_price_facets(items: QuerySet) -> dict:
+    """
+    Return the price range and the histogram of item prices, computed by one grouped query
+    """
+    bounds = get_price_buckets()
+    bucket = Case(
+        *[When(price__lt=upper, then=Value(index)) for index, upper in enumerate(bounds[1:])],
+        default=Value(len(bounds) - 1),
+        output_field=IntegerField()
+    )
+    rows = items.prefetch_related(None).order_by().annotate(bucket=bucket).values('bucket').annotate(
+        count=Count('pk'), min_price=Min('price'), max_price=Max('price')
+    )
+    rows = {row['bucket']: row for row in rows}
+
+    histogram = []
+    for index, lower in enumerate(bounds):
+        upper = bounds[index + 1] if index + 1 < len(bounds) else None
+        histogram.append({'min_price': lower, 'max_price': upper, 'count': rows.get(index, {}).get('count', 0)})
+
+    return {
+        'min_price': min((row['min_price'] for row in rows.values()), default=None),
+        'max_price': max((row['max_price'] for row in rows.values()), default=None),
+        'histogram': histogram,
+    }
+
+
+def get_bucket_filter(bucket: dict) -> dict:
+    """
+    Return the price filter selecting the items of the histogram bucket.
+    The buckets exclude their upper bound and max_price includes it, so the filter ends one cent below the bound
+    """
+    upper = bucket['max_price']
+    return {'min_price': bucket['min_price'], 'max_price': None if upper is None else upper - PRICE_STEP}
+
+
+def get_category_facets(items: QuerySet, category: str = None) -> list:
+    """
+    Return the number of distinct items in the subtree of every child of the category, by one grouped query
+    """
+    children = get_child_categories(category)[:getattr(settings, 'SHOP_MAX_CATEGORY_FACETS', MAX_CATEGORY_FACETS)]
+    if not children:
+        return []
+
+    conditions = []
+    for slug, _ in children:
+        category_range = get_category_range(slug)
+        conditions.append(When(
+            category__tree_id=category_range.tree_id,
+            category__lft__gte=category_range.lft,
+            category__lft__lte=category_range.rght,
+            then=Value(slug)
+        ))
+    rows = Item.category.through.objects.filter(item_id__in=items.prefetch_related(None).order_by().values('pk')) \
+        .annotate(child=Case(*conditions, default=None, output_field=CharField())) \
+        .exclude(child=None).order_by().values('child').annotate(count=Count('item_id', distinct=True))
+    counts = {row['child']: row['count'] for row in rows}
+
+    return [
+        {'slug': slug, 'name': name, 'count': counts[slug]}
+        for slug, name in children if counts.get(slug)
+    ]
+
+
+def get_facets(items: QuerySet, category: str = None, key: str = None) -> dict:
+    """
+    Return the price and category facets of the items, cached per filter key until the catalog changes
+    """
+    if key is not None:
+        key = f'shop:facets:{get_version(CATALOG_VERSION)}:{get_version(CATEGORY_VERSION)}:{key}'
+        facets = cache.get(key)
+        record_cache_result('facets', facets is not None)
+        if facets is not None:
+            return facets
+
+    if key is None:
+        return {**get_price_facets(items), 'categories': get_category_facets(items, category)}
+
+    # Cached facets are computed on the primary, which has every write counted by the versions of the key
+    with use_primary():
+        facets = {**get_price_facets(items), 'categories': get_category_facets(items, category)}
+    cache.set(key, facets, getattr(settings, 'SHOP_FACETS_CACHE_TIMEOUT', 300))
+    return facets
@@ -1,55 +1,87 @@
-from django.db.models import QuerySet
-from django.db.models import Count, Avg
+from decimal import Decimal, InvalidOperation
 
-from shop.models import Item
+from django.db.models import QuerySet, Prefetch, OuterRef, Subquery
+
+from shop.categories import get_category_range
+from shop.models import Item, ProductGallery
+from shop.search import get_search_backend, get_stems
 
 SORT_ORDER = {
     '1': 'price',
     '2': '-price',
-    '3': '-count_purchases',
-    '4': '-count_review',
-    '5': '-rate'
+    '3': '-purchase_count',
+    '4': '-review_count',
+    '5': '-rating_avg'
 }
+SEARCH_SORT = '6'
+POPULARITY_SORT = '3'
+MAX_CATEGORY_IDS = 500
 
 
-def get_item_filter(request) -> dict:
-    try:
-        min_price = int(request.GET.get('min_price'))
-        min_price = min_price if min_price else 0
-    except (ValueError, TypeError):
-        min_price = 0
+def parse_price(value):
     try:
-        max_price = int(request.GET.get('max_price'))
-        max_price = max_price if max_price else 999999
-    except (ValueError, TypeError):
-        max_price = 999999
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    return price if price.is_finite() and price > 0 else None
 
+
+def get_item_filter(request) -> dict:
+    # Prices are decimals, so that the links of the price facets can end just below the bound of their bucket
+    min_price = parse_price(request.GET.get('min_price')) or 0
+    max_price = parse_price(request.GET.get('max_price'))
     sort = request.GET.get('sort')
 
     return {'min_price': min_price, 'max_price': max_price, 'sort': sort}
 
 
-def get_items_by_filter(item_filter: dict) -> QuerySet:
-    items = Item.objects.filter(price__gte=item_filter.get('min_price'), price__lte=item_filter.get('max_price'))
-    sort = item_filter.get('sort')
+def get_card_images_prefetch(lookup: str = 'image') -> Prefetch:
+    first_image = ProductGallery.objects.filter(product=OuterRef('product')).order_by('pk').values('pk')[:1]
+    return Prefetch(
+        lookup,
+        queryset=ProductGallery.objects.filter(pk=Subquery(first_image)),
+        to_attr='card_images'
+    )
 
-    if sort == '3':
-        items = items.annotate(count_purchases=Count('purchase'))
-    elif sort == '4':
-        items = items.annotate(count_review=Count('review'))
-    elif sort == '5':
-        items = items.annotate(rate=Avg('review__rate'))
 
-    return items.order_by(SORT_ORDER.get(item_filter.get('sort'), 'price')).all()
+def prefetch_card_data(items: QuerySet) -> QuerySet:
+    return items.prefetch_related(get_card_images_prefetch())
 
 
-def get_items_by_category(items: QuerySet, category: str) -> QuerySet:
-    return items.filter(category__slug=category).all()
+def get_items_by_filter(item_filter: dict) -> QuerySet:
+    items = Item.objects.filter(price__gte=item_filter.get('min_price', 0))
+    if item_filter.get('max_price') is not None:
+        items = items.filter(price__lte=item_filter['max_price'])
+    items = items.order_by(SORT_ORDER.get(item_filter.get('sort'), 'price'))
+    return prefetch_card_data(items)
 
 
-def get_search_items(items: QuerySet, search: str) -> QuerySet:
-    if search:
-        items = items.filter(title__icontains=search).all()
+def get_items_by_category(items: QuerySet, category: str) -> QuerySet:
+    category_range = get_category_range(category)
+    if category_range is None:
+        return items.none()
+
+    links = Item.category.through.objects.order_by()
+    if len(category_range.ids) <= MAX_CATEGORY_IDS:
+        links = links.filter(category_id__in=category_range.ids)
+    else:
+        links = links.filter(
+            category__tree_id=category_range.tree_id,
+            category__lft__gte=category_range.lft,
+            category__rght__lte=category_range.rght
+        )
+    return items.filter(pk__in=links.values('item_id'))
+
+
+def get_search_items(items: QuerySet, search: str, sort: str = None) -> QuerySet:
+    if not search:
+        return items
+    if not get_stems(search):
+        return items.none()
+
+    items = get_search_backend(items.db).search(items, search)
+    if sort == SEARCH_SORT:
+        items = items.order_by('-search_rank', 'pk')
     return items
 
 
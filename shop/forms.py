@@ -10,7 +10,8 @@ SORT = [
     ('2', 'Сначала дорогие'),
     ('3', 'Сначала популярные'),
     ('4', 'Сначала обсуждаемые'),
-    ('5', 'Сначала с лучшей оценкой')
+    ('5', 'Сначала с лучшей оценкой'),
+    ('6', 'Сначала релевантные')
 ]
 
 
@@ -18,15 +19,17 @@ class FilterProducts(forms.Form):
     """
     Form to filter products based on price and sort
     """
-    min_price = forms.IntegerField(
+    min_price = forms.DecimalField(
+        decimal_places=2,
         label='Минимальная цена',
         required=False,
         widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '0'})
     )
-    max_price = forms.IntegerField(
+    max_price = forms.DecimalField(
+        decimal_places=2,
         label='Максимальная цена',
         required=False,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '999999'})
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
     sort = forms.ChoiceField(
         label='Сортировка',
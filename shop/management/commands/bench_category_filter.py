@@ -0,0 +1,116 @@
+"""
+Import required libraries for the bench_category_filter command
+"""
+import json
+import random
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.benchmarks import measure
+from shop.cache import bump_version, CATEGORY_VERSION
+from shop.categories import get_category_range
+from shop.filters import get_items_by_category
+from shop.models import Category, Item
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the subtree category filter against a JOIN with DISTINCT on a generated deep tree.
+    All generated rows are rolled back at the end
+    """
+    help = 'Benchmark category listings on a generated deep category tree'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=6, help='Depth of the generated tree')
+        parser.add_argument('--categories', type=int, default=5000, help='Number of generated categories')
+        parser.add_argument('--items', type=int, default=20000, help='Number of generated items')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of runs of every measured query')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+
+        with transaction.atomic():
+            levels = self.create_tree(options['depth'], options['categories'])
+            self.create_items(options['items'], levels[-1])
+            report = self.run_benchmark(levels, options['repeat'])
+            transaction.set_rollback(True)
+
+        bump_version(CATEGORY_VERSION)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def create_tree(self, depth: int, count: int) -> list:
+        prefix = uuid.uuid4().hex[:8]
+        branching = max(2, round(count ** (1 / depth)))
+        parents = [None]
+        levels = []
+        total = 0
+
+        for _ in range(depth):
+            nodes = []
+            for parent in parents:
+                for _ in range(branching):
+                    if total >= count:
+                        break
+                    total += 1
+                    nodes.append(Category(
+                        name=f'Bench {total}', slug=f'bench-{prefix}-{total}', parent_id=parent,
+                        lft=0, rght=0, tree_id=0, level=0
+                    ))
+            if not nodes:
+                break
+            Category.objects.bulk_create(nodes, batch_size=1000)
+            slugs = [node.slug for node in nodes]
+            parents = list(Category.objects.filter(slug__in=slugs).values_list('pk', flat=True))
+            levels.append(slugs)
+
+        Category.objects.rebuild()
+        bump_version(CATEGORY_VERSION)
+        return levels
+
+    def create_items(self, count: int, leaves: list) -> None:
+        salesman = CustomUser.objects.create_user(f'bench-{uuid.uuid4().hex}@example.com', None)
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        Item.objects.bulk_create(
+            [Item(title=f'{prefix} {number}', description='', price=number % 1000, salesman=salesman)
+             for number in range(count)],
+            batch_size=1000
+        )
+        leaf_ids = list(Category.objects.filter(slug__in=leaves).values_list('pk', flat=True))
+        links = [
+            Item.category.through(item_id=item_id, category_id=random.choice(leaf_ids))
+            for item_id in Item.objects.filter(title__startswith=prefix).values_list('pk', flat=True)
+        ]
+        Item.category.through.objects.bulk_create(links, batch_size=1000)
+
+    def run_benchmark(self, levels: list, repeat: int) -> dict:
+        report = {'levels': []}
+
+        for depth, slugs in enumerate(levels, start=1):
+            slug = random.choice(slugs)
+            category_range = get_category_range(slug)
+
+            def join_distinct():
+                items = Item.objects.filter(
+                    category__tree_id=category_range.tree_id,
+                    category__lft__gte=category_range.lft,
+                    category__rght__lte=category_range.rght
+                ).distinct().order_by('price')
+                return items.count(), list(items[:10])
+
+            def subtree():
+                items = get_items_by_category(Item.objects.order_by('price'), slug)
+                return items.count(), list(items[:10])
+
+            report['levels'].append({
+                'depth': depth,
+                'slug': slug,
+                'descendants': len(category_range.ids),
+                'items': subtree()[0],
+                'join_distinct': measure(join_distinct, repeat),
+                'subtree': measure(subtree, repeat),
+            })
+        return report
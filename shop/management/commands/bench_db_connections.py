@@ -0,0 +1,92 @@
+"""
+Import required libraries for the bench_db_connections command
+"""
+import json
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+from shop.benchmarks import summarize
+
+POOLED_ENGINE = 'django_shop.db'
+
+
+class Command(BaseCommand):
+    """
+    Measure the connection overhead of cheap requests on the configured database.
+    Every iteration runs what Django does around a request: release the connection if it is obsolete,
+    run one query and release it again, with a new connection per request, a persistent connection
+    of every thread and a connection taken from the pool
+    """
+    help = 'Benchmark per-request database connection overhead with and without pooling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Number of requests of every thread')
+        parser.add_argument('--threads', type=int, default=4, help='Number of concurrent threads')
+        parser.add_argument('--pool-size', type=int, default=4, help='Size of the pool of the pooled mode')
+        parser.add_argument('--database', default='default', help='Alias of the benchmarked database')
+
+    def handle(self, *args, **options):
+        settings_dict = connections[options['database']].settings_dict
+        engine = settings_dict['ENGINE']
+        modes = {
+            'new_connection': {'ENGINE': engine if engine != POOLED_ENGINE else 'django.db.backends.mysql',
+                               'CONN_MAX_AGE': 0},
+            'persistent': {'ENGINE': engine if engine != POOLED_ENGINE else 'django.db.backends.mysql',
+                           'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+        }
+        if connections[options['database']].vendor == 'mysql':
+            modes['pooled'] = {
+                'ENGINE': POOLED_ENGINE, 'CONN_MAX_AGE': 0,
+                'POOL': {**settings_dict.get('POOL', {}), 'SIZE': options['pool_size']},
+            }
+        else:
+            self.stderr.write('The pooled mode needs MySQL, it is skipped')
+
+        report = {}
+        for mode, overrides in modes.items():
+            report[mode] = self.run_mode(mode, {**settings_dict, **overrides}, options)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_mode(self, mode: str, settings_dict: dict, options: dict) -> dict:
+        backend = load_backend(settings_dict['ENGINE'])
+        timings = []
+        errors = []
+        wrappers = []
+
+        def worker():
+            wrapper = backend.DatabaseWrapper(settings_dict, alias=f'bench_{mode}')
+            wrappers.append(wrapper)
+            local = []
+            try:
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    wrapper.close_if_unusable_or_obsolete()
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                        cursor.fetchone()
+                    wrapper.close_if_unusable_or_obsolete()
+                    local.append(time.perf_counter() - start)
+            except Exception as error:
+                errors.append(repr(error))
+            finally:
+                wrapper.close()
+                timings.extend(local)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+
+        if errors:
+            raise CommandError(f'{mode}: {errors[0]}')
+        result = {'requests_per_s': round(len(timings) / duration, 1), **summarize(timings)}
+        if hasattr(wrappers[0], 'get_pool'):
+            result['pool'] = wrappers[0].get_pool().stats()
+        return result
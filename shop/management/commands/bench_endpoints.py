@@ -0,0 +1,110 @@
+"""
+Import required libraries for the bench_endpoints command
+"""
+import asyncio
+import json
+import os
+import resource
+import shlex
+import socket
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from shop.benchmarks import load_test
+from shop.models import Item
+
+WSGI_COMMAND = 'gunicorn django_shop.wsgi:application --bind 127.0.0.1:{port} --workers {workers} --threads {threads}'
+ASGI_COMMAND = 'uvicorn django_shop.asgi:application --host 127.0.0.1 --port {port} --workers {workers}'
+START_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the sync views of the JSON endpoints under WSGI against their async views under ASGI.
+    Both servers are started locally on the current database unless their URLs are given,
+    gunicorn and uvicorn are installed with requirements-dev.txt
+    """
+    help = 'Compare throughput and tail latency of the JSON endpoints under WSGI and ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000, help='Number of concurrent clients')
+        parser.add_argument('--requests', type=int, default=10, help='Number of requests of every client')
+        parser.add_argument('--workers', type=int, default=1, help='Number of server processes')
+        parser.add_argument('--threads', type=int, default=8, help='Number of threads of every WSGI process')
+        parser.add_argument('--port', type=int, default=8765, help='First port of the started servers')
+        parser.add_argument('--path', action='append', help='Requested path, repeat for several paths')
+        parser.add_argument('--wsgi-url', help='URL of a running WSGI server instead of starting one')
+        parser.add_argument('--asgi-url', help='URL of a running ASGI server instead of starting one')
+        parser.add_argument('--wsgi-command', default=WSGI_COMMAND, help='Command starting the WSGI server')
+        parser.add_argument('--asgi-command', default=ASGI_COMMAND, help='Command starting the ASGI server')
+
+    def handle(self, *args, **options):
+        self.raise_open_files_limit()
+        paths = options['path'] or self.get_default_paths()
+
+        report = {}
+        deployments = [
+            ('wsgi', options['wsgi_url'], options['wsgi_command'], False),
+            ('asgi', options['asgi_url'], options['asgi_command'], True),
+        ]
+        for number, (name, url, command, async_views) in enumerate(deployments):
+            port = options['port'] + number
+            server = None if url else self.start_server(command, port, options, async_views)
+            host, port = (urlsplit(url).hostname, urlsplit(url).port or 80) if url else ('127.0.0.1', port)
+            try:
+                report[name] = asyncio.run(
+                    load_test(host, port, paths, options['clients'], options['requests'])
+                )
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+
+        self.stdout.write(json.dumps({'paths': paths, **report}, indent=2))
+
+    def get_default_paths(self) -> list:
+        item_id = Item.objects.values_list('pk', flat=True).first()
+        if item_id is None:
+            raise CommandError('There are no items to request, create some or pass --path')
+        return [
+            reverse('check_basket', kwargs={'item_pk': item_id}),
+            reverse('check_favorite', kwargs={'item_pk': item_id}),
+        ]
+
+    def raise_open_files_limit(self) -> None:
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+    def start_server(self, command: str, port: int, options: dict, async_views: bool) -> subprocess.Popen:
+        args = shlex.split(command.format(port=port, workers=options['workers'], threads=options['threads']))
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE),
+            'SHOP_ASYNC_VIEWS': str(async_views),
+        }
+        try:
+            server = subprocess.Popen(args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            raise CommandError(
+                f'{args[0]} is not installed, install requirements-dev.txt or pass the URL of a running server'
+            )
+
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'The server exited with code {server.returncode}: {command}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'The server did not start in {START_TIMEOUT} seconds: {command}')
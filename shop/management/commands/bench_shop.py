@@ -0,0 +1,148 @@
+"""
+Import required libraries for the bench_shop command
+"""
+import json
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from shop.benchmarks import summarize
+from shop.models import Category, Item, Review, Purchase
+from users.models import CustomUser
+
+BENCH_USER_EMAIL = 'bench@example.com'
+SEARCH_TERMS = ['phone', 'wireless laptop', 'acme', 'smart watch', 'kettle', 'portable speaker']
+
+
+class Command(BaseCommand):
+    """
+    Drive the listing, search, detail and checkout pages and the JSON endpoints through the test client
+    and report the throughput, latency percentiles and query counts of every scenario as JSON.
+    The checkout and favorite scenarios write to the database
+    """
+    help = 'Benchmark the shop pages and JSON endpoints end to end'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests of every scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests of every scenario')
+        parser.add_argument('--scenario', action='append', help='Run only this scenario, repeat for several')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+        parser.add_argument('--output', help='File to write the JSON report to instead of stdout')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.item_ids = list(Item.objects.order_by('pk').values_list('pk', flat=True)[:10000])
+        self.slugs = list(Category.objects.values_list('slug', flat=True)[:10000])
+        if not self.item_ids or not self.slugs:
+            raise CommandError('The catalog is empty, run generate_catalog first')
+
+        self.client = Client()
+        scenarios = self.get_scenarios()
+        names = options['scenario'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        report = {
+            'commit': self.get_commit(),
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'dataset': {
+                'items': Item.objects.count(),
+                'categories': Category.objects.count(),
+                'reviews': Review.objects.count(),
+                'purchases': Purchase.objects.count(),
+            },
+            'options': {key: options[key] for key in ('requests', 'warmup', 'cold', 'seed')},
+            'scenarios': {},
+        }
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self.client.force_login(self.get_user())
+            for name in names:
+                report['scenarios'][name] = self.run_scenario(scenarios[name], options)
+                self.stderr.write(f"{name}: {report['scenarios'][name]['throughput_rps']} rps")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def get_user(self) -> CustomUser:
+        user = CustomUser.objects.filter(email=BENCH_USER_EMAIL).first()
+        return user or CustomUser.objects.create_user(BENCH_USER_EMAIL, 'password')
+
+    def get_item_id(self) -> int:
+        # Popular items are requested more often, as in the generated reviews and purchases
+        return self.item_ids[int(len(self.item_ids) * self.random.random() ** 3)]
+
+    def get_scenarios(self) -> dict:
+        """
+        Return the scenarios by name, every scenario prepares one request and returns the call to measure
+        """
+        get, post = self.client.get, self.client.post
+        return {
+            'product_list': lambda: partial(get, reverse('product_list'), {'sort': self.random.randint(1, 5)}),
+            'shop_category': lambda: partial(get, reverse('shop_category', args=[self.random.choice(self.slugs)])),
+            'search': lambda: partial(get, reverse('search'), {'s': self.random.choice(SEARCH_TERMS)}),
+            'item_detail': lambda: partial(get, reverse('item_detail', args=[self.get_item_id()])),
+            'checkout': self.prepare_checkout,
+            'item_reviews': lambda: partial(get, reverse('item_reviews', args=[self.get_item_id()])),
+            'facets': lambda: partial(get, reverse('facets')),
+            'category_tree': lambda: partial(get, reverse('category_tree')),
+            'items_status': lambda: partial(
+                get, reverse('items_status'), {'ids': ','.join(str(self.get_item_id()) for _ in range(20))}
+            ),
+            'check_basket': lambda: partial(get, reverse('check_basket', args=[self.get_item_id()])),
+            'check_favorite': lambda: partial(get, reverse('check_favorite', args=[self.get_item_id()])),
+            'toggle_favorite': lambda: partial(post, reverse('toggle_favorite'), {'item': self.get_item_id()}),
+            'add_to_basket': lambda: partial(post, reverse('add_to_basket'), {'item': self.get_item_id()}),
+        }
+
+    def prepare_checkout(self):
+        # Only the order is measured, the basket is filled beforehand
+        self.client.post(reverse('add_to_basket'), {'item': self.get_item_id()})
+        return partial(self.client.post, reverse('basket'), {'is_delivery': 'on', 'email': BENCH_USER_EMAIL})
+
+    def run_scenario(self, scenario, options: dict) -> dict:
+        timings, queries, errors = [], [], 0
+        for number in range(options['warmup'] + options['requests']):
+            if options['cold']:
+                cache.clear()
+            request = scenario()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = request()
+                duration = time.perf_counter() - start
+            if number < options['warmup']:
+                continue
+            errors += response.status_code >= 400
+            timings.append(duration)
+            queries.append(len(context.captured_queries))
+        return {
+            **summarize(timings),
+            'throughput_rps': round(len(timings) / sum(timings), 1),
+            'errors': errors,
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
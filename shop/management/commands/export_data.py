@@ -0,0 +1,72 @@
+"""
+Import required libraries for the export_data command
+"""
+import json
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.exports import EXPORTS, EXPORT_CHUNK_SIZE, get_export_queryset, iter_documents, iter_export
+
+
+class Command(BaseCommand):
+    """
+    Stream the items, the purchases with their lines or the reviews to a CSV or JSON lines file.
+    With --state the id of the last exported row is stored per export, and the next run exports the newer rows only
+    """
+    help = 'Export items, purchases or reviews as CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS), help='Exported rows')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='jsonl', help='Format of the export')
+        parser.add_argument('--output', help='Output file, the standard output if unset')
+        parser.add_argument('--since-id', type=int, help='Export the rows with a greater id only')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First creation date')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last creation date')
+        parser.add_argument('--state', help='JSON file keeping the last exported id of every export')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Number of rows per query')
+
+    def handle(self, *args, **options):
+        name = options['name']
+        state = self.load_state(options['state']) if options['state'] else {}
+        since_id = options['since_id'] if options['since_id'] is not None else state.get(name)
+        queryset = get_export_queryset(name, since_id, options['date_from'], options['date_to'])
+
+        exported = {'rows': 0, 'last_id': since_id}
+
+        def documents():
+            for document in iter_documents(name, queryset, options['chunk_size']):
+                exported['rows'] += 1
+                exported['last_id'] = document['id']
+                yield document
+
+        start = time.perf_counter()
+        chunks = iter_export(name, options['format'], documents())
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+        if options['state'] and exported['last_id'] is not None:
+            self.save_state(options['state'], {**state, name: exported['last_id']})
+        self.stderr.write(json.dumps({
+            **exported, 'duration_s': round(time.perf_counter() - start, 3)
+        }))
+
+    def load_state(self, path: str) -> dict:
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except ValueError:
+            raise CommandError(f'The state file {path} is not valid JSON')
+
+    def save_state(self, path: str, state: dict) -> None:
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(state, file)
+        os.replace(f'{path}.tmp', path)
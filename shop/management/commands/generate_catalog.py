@@ -0,0 +1,197 @@
+"""
+Import required libraries for the generate_catalog command
+"""
+import json
+import random
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from shop.cache import bump_version, CATALOG_VERSION, CATEGORY_VERSION
+from shop.models import Category, Item, Review, Purchase, PurchaseLine, Favorite
+from users.models import CustomUser, UserProfile
+
+ADJECTIVES = ['Compact', 'Wireless', 'Smart', 'Portable', 'Classic', 'Ultra', 'Premium', 'Eco', 'Pro', 'Mini',
+              'Digital', 'Silent', 'Rugged', 'Slim', 'Turbo', 'Ergonomic', 'Waterproof', 'Vintage', 'Modular', 'Solar']
+NOUNS = ['phone', 'laptop', 'kettle', 'headphones', 'camera', 'watch', 'speaker', 'backpack', 'lamp', 'chair',
+         'monitor', 'keyboard', 'mouse', 'blender', 'drill', 'jacket', 'sneakers', 'tent', 'router', 'tablet']
+BRANDS = ['Acme', 'Nord', 'Volta', 'Orion', 'Kestrel', 'Lumen', 'Arbor', 'Zenith', 'Pulse', 'Vega']
+WORDS = ['durable', 'battery', 'display', 'steel', 'cotton', 'fast', 'charging', 'light', 'warranty', 'design',
+         'quality', 'comfortable', 'power', 'storage', 'sound', 'colour', 'size', 'fit', 'easy', 'clean']
+CITIES = ['Moscow', 'Kazan', 'Omsk', 'Perm', 'Samara', 'Tver', 'Tula', 'Sochi']
+
+
+class Command(BaseCommand):
+    """
+    Fill the database with a generated catalog: users, a deep category tree, items with skewed popularity,
+    reviews, purchases with their lines and favorites. Rows are appended with explicit primary keys,
+    the tree, the item stats and the search index are rebuilt at the end
+    """
+    help = 'Generate a synthetic catalog of the given scale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplier of every row count')
+        parser.add_argument('--users', type=int, default=50000, help='Number of users')
+        parser.add_argument('--categories', type=int, default=2000, help='Number of categories')
+        parser.add_argument('--depth', type=int, default=6, help='Depth of the category tree')
+        parser.add_argument('--items', type=int, default=200000, help='Number of items')
+        parser.add_argument('--reviews', type=int, default=2000000, help='Number of reviews')
+        parser.add_argument('--purchases', type=int, default=500000, help='Number of purchases')
+        parser.add_argument('--favorites', type=int, default=300000, help='Number of favorites')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows of every bulk insert')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        counts = {
+            name: max(1, int(options[name] * options['scale']))
+            for name in ('users', 'categories', 'items', 'reviews', 'purchases', 'favorites')
+        }
+        report = {'counts': counts, 'stages': {}}
+
+        stages = [
+            ('users', lambda: self.create_users(counts['users'])),
+            ('categories', lambda: self.create_categories(counts['categories'], options['depth'])),
+            ('items', lambda: self.create_items(counts['items'])),
+            ('reviews', lambda: self.create_reviews(counts['reviews'])),
+            ('purchases', lambda: self.create_purchases(counts['purchases'])),
+            ('favorites', lambda: self.create_favorites(counts['favorites'])),
+            ('item_stats', lambda: call_command('recompute_item_stats', stdout=self.stderr)),
+            ('search_index', lambda: call_command('rebuild_search_index', stdout=self.stderr)),
+        ]
+        for name, stage in stages:
+            start = time.perf_counter()
+            stage()
+            report['stages'][name] = {'duration_s': round(time.perf_counter() - start, 3)}
+            self.stderr.write(f"{name}: {report['stages'][name]['duration_s']} s")
+
+        bump_version(CATEGORY_VERSION)
+        bump_version(CATALOG_VERSION)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def get_next_id(self, model) -> int:
+        return (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+    def insert(self, model, rows) -> int:
+        count = 0
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return count
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size, ignore_conflicts=model is Favorite)
+            count += len(batch)
+
+    def pick_popular(self, ids: range) -> int:
+        # A few items get most of the reviews, purchases and favorites
+        return ids[int(len(ids) * self.random.random() ** 3)]
+
+    def create_users(self, count: int) -> None:
+        first = self.get_next_id(CustomUser)
+        password = make_password('password')
+        self.users = range(first, first + count)
+        self.insert(CustomUser, (
+            CustomUser(pk=pk, email=f'user{pk}@example.com', password=password) for pk in self.users
+        ))
+        # bulk_create skips the signal creating the profiles
+        self.insert(UserProfile, (UserProfile(user_id=pk) for pk in self.users))
+
+    def create_categories(self, count: int, depth: int) -> None:
+        next_id = self.get_next_id(Category)
+        branching = max(2, round(count ** (1 / depth)))
+        parents, total, self.leaves = [None], 0, []
+        with Category.objects.disable_mptt_updates():
+            for _ in range(depth):
+                nodes = []
+                for parent in parents:
+                    for _ in range(branching):
+                        if total >= count:
+                            break
+                        nodes.append(Category(
+                            pk=next_id + total, name=f'{self.random.choice(NOUNS).title()} {next_id + total}',
+                            slug=f'category-{next_id + total}', parent_id=parent, lft=0, rght=0, tree_id=0, level=0
+                        ))
+                        total += 1
+                if not nodes:
+                    break
+                self.insert(Category, nodes)
+                parents = [node.pk for node in nodes]
+                self.leaves = parents
+        Category.objects.rebuild()
+
+    def create_items(self, count: int) -> None:
+        first = self.get_next_id(Item)
+        self.items = range(first, first + count)
+        salesmen = self.users[:max(1, len(self.users) // 100)]
+        self.prices = {}
+
+        def items():
+            for pk in self.items:
+                price = Decimal(min(999999, round(self.random.lognormvariate(8, 1.2)))).quantize(Decimal('0.01'))
+                self.prices[pk] = price
+                words = self.random.choices(WORDS, k=12)
+                yield Item(
+                    pk=pk,
+                    title=f'{self.random.choice(BRANDS)} {self.random.choice(ADJECTIVES)} '
+                          f'{self.random.choice(NOUNS)} {pk}',
+                    description=' '.join(words).capitalize() + '.',
+                    price=price,
+                    salesman_id=self.random.choice(salesmen),
+                )
+
+        self.insert(Item, items())
+        self.insert(Item.category.through, (
+            Item.category.through(item_id=pk, category_id=self.random.choice(self.leaves)) for pk in self.items
+        ))
+
+    def create_reviews(self, count: int) -> None:
+        self.insert(Review, (
+            Review(
+                author_id=self.random.choice(self.users),
+                product_id=self.pick_popular(self.items),
+                rate=min(100, max(0, round(self.random.gauss(75, 20)))),
+                text=' '.join(self.random.choices(WORDS, k=8)).capitalize() + '.',
+            )
+            for _ in range(count)
+        ))
+
+    def create_purchases(self, count: int) -> None:
+        first = self.get_next_id(Purchase)
+        for start in range(first, first + count, self.batch_size):
+            purchases, lines, links = [], [], []
+            for pk in range(start, min(start + self.batch_size, first + count)):
+                item_ids = {self.pick_popular(self.items) for _ in range(self.random.randint(1, 4))}
+                quantities = {item_id: self.random.randint(1, 3) for item_id in item_ids}
+                user_id = self.random.choice(self.users) if self.random.random() < 0.9 else None
+                purchases.append(Purchase(
+                    pk=pk,
+                    user_id=user_id,
+                    is_delivery=self.random.random() < 0.6,
+                    email=f'user{user_id or pk}@example.com',
+                    total_price=sum(self.prices[item_id] * quantity for item_id, quantity in quantities.items()),
+                    city=self.random.choice(CITIES),
+                ))
+                for item_id, quantity in quantities.items():
+                    lines.append(PurchaseLine(
+                        purchase_id=pk, item_id=item_id, title=f'Item {item_id}',
+                        unit_price=self.prices[item_id], quantity=quantity
+                    ))
+                    links.append(Purchase.item.through(purchase_id=pk, item_id=item_id))
+            with transaction.atomic():
+                Purchase.objects.bulk_create(purchases)
+                PurchaseLine.objects.bulk_create(lines)
+                Purchase.item.through.objects.bulk_create(links)
+
+    def create_favorites(self, count: int) -> None:
+        self.insert(Favorite, (
+            Favorite(user_id=self.random.choice(self.users), item_id=self.pick_popular(self.items))
+            for _ in range(count)
+        ))
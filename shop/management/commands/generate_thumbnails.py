@@ -0,0 +1,55 @@
+"""
+Import required libraries for the generate_thumbnails command
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from shop.models import ProductGallery
+from shop.thumbnails import generate_variants, set_generated
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """
+    Generate the missing thumbnails of the gallery images in a pool of processes
+    """
+    help = 'Generate the thumbnails of the product gallery images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--all', action='store_true', help='Regenerate the thumbnails of every image')
+
+    def handle(self, *args, **options):
+        galleries = ProductGallery.objects.exclude(image='').order_by('pk')
+        if not options['all']:
+            galleries = galleries.filter(has_thumbnails=False)
+        rows = list(galleries.values_list('pk', 'image'))
+
+        start = time.perf_counter()
+        done, errors = [], 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(generate_variants, name): pk for pk, name in rows}
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    errors += 1
+                    self.stderr.write(f'Gallery image {futures[future]}: {future.exception()}')
+                    continue
+                done.append(futures[future])
+                if len(done) % BATCH_SIZE == 0:
+                    set_generated(done[-BATCH_SIZE:])
+        if len(done) % BATCH_SIZE:
+            set_generated(done[len(done) - len(done) % BATCH_SIZE:])
+
+        duration = time.perf_counter() - start
+        self.stdout.write(json.dumps({
+            'images': len(rows),
+            'generated': len(done),
+            'errors': errors,
+            'duration_s': round(duration, 3),
+            'images_per_s': round(len(done) / duration, 1) if duration else None,
+        }, indent=2))
@@ -0,0 +1,283 @@
+"""
+Import required libraries for the import_catalog command
+"""
+import csv
+import http.client
+import json
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from shop.cache import bump_version, CATALOG_VERSION, CATEGORY_VERSION
+from shop.models import Category, Item, ProductGallery
+from shop.search import build_search_document, get_search_backend
+from shop.thumbnails import schedule_thumbnails
+from users.models import CustomUser
+
+UPDATED_FIELDS = ['title', 'description', 'price', 'search_document', 'updated_at']
+IMAGE_TIMEOUT = 30
+IMAGE_SCHEMES = ('http', 'https')
+
+
+class RowError(ValueError):
+    """
+    Raised for a row of the feed that cannot be imported
+    """
+
+
+class Command(BaseCommand):
+    """
+    Stream a CSV or JSON lines catalog feed and upsert its items by SKU in batches.
+
+    Every row has `sku`, `title`, `description`, `price`, `categories` and `images`. In CSV the categories and images
+    are separated by `|`, in JSON lines they may also be lists. Images are http or https URLs. A category is a path
+    of slugs separated by `/`, the item is put in its last category and the missing ones are created. The category
+    tree is rebuilt once at the end. The number of imported rows is saved to a checkpoint file after every batch,
+    so an interrupted import of an unchanged feed continues after the last committed batch when it is run again
+    """
+    help = 'Import items, categories and images from a CSV or JSON lines feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON lines (.jsonl) file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Format of the file, by its extension if unset')
+        parser.add_argument('--salesman', required=True, help='Email of the salesman of the created items')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows written in one transaction')
+        parser.add_argument('--image-workers', type=int, default=8, help='Number of threads downloading images')
+        parser.add_argument('--checkpoint', help='Checkpoint file, the path of the feed with .checkpoint by default')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and import from the start')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'There is no file {path}')
+        salesman = CustomUser.objects.filter(email=options['salesman']).first()
+        if salesman is None:
+            raise CommandError(f"There is no user {options['salesman']}")
+
+        self.checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        checkpoint = {} if options['restart'] else self.load_checkpoint(path)
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'errors': 0, 'categories': 0, 'images': 0,
+                      'image_errors': 0}
+        self.salesman_id = salesman.pk
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.rebuild_tree = checkpoint.get('rebuild_tree', False)
+        done = checkpoint.get('rows', 0)
+        if done:
+            self.stderr.write(f'Resuming after row {done}')
+
+        start = time.perf_counter()
+        rows = islice(self.read_rows(path, options['format'] or self.get_format(path)), done, None)
+        with ThreadPoolExecutor(max_workers=options['image_workers']) as pool:
+            self.pool = pool
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch, done)
+                done += len(batch)
+                self.save_checkpoint(path, {'rows': done, 'rebuild_tree': self.rebuild_tree})
+                duration = time.perf_counter() - start
+                self.stderr.write(f"{done} rows, {round(self.stats['rows'] / duration, 1)} rows/s")
+
+        if self.rebuild_tree:
+            Category.objects.rebuild()
+        bump_version(CATEGORY_VERSION)
+        bump_version(CATALOG_VERSION)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        duration = time.perf_counter() - start
+        self.stdout.write(json.dumps({
+            **self.stats,
+            'duration_s': round(duration, 3),
+            'rows_per_s': round(self.stats['rows'] / duration, 1) if duration else None,
+        }, indent=2))
+
+    def get_format(self, path: str) -> str:
+        return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    def read_rows(self, path: str, file_format: str):
+        with open(path, newline='', encoding='utf-8') as file:
+            if file_format == 'csv':
+                yield from csv.DictReader(file)
+                return
+            for line in file:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+
+    def get_feed_version(self, path: str) -> dict:
+        # The size alone misses a feed rewritten with rows of the same length
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def load_checkpoint(self, path: str) -> dict:
+        try:
+            with open(self.checkpoint_path) as file:
+                checkpoint = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if checkpoint.get('feed') != self.get_feed_version(path):
+            raise CommandError(f'The checkpoint {self.checkpoint_path} belongs to another version of the feed, '
+                               f'remove it or pass --restart')
+        return checkpoint
+
+    def save_checkpoint(self, path: str, checkpoint: dict) -> None:
+        with open(f'{self.checkpoint_path}.tmp', 'w') as file:
+            json.dump({**checkpoint, 'feed': self.get_feed_version(path)}, file)
+        os.replace(f'{self.checkpoint_path}.tmp', self.checkpoint_path)
+
+    def split(self, value) -> list:
+        if isinstance(value, list):
+            return [part.strip() for part in value if part.strip()]
+        return [part.strip() for part in (value or '').split('|') if part.strip()]
+
+    def parse_row(self, row: dict) -> dict:
+        if not isinstance(row, dict):
+            raise RowError('the row is not an object')
+        sku, title = str(row.get('sku') or '').strip(), str(row.get('title') or '').strip()
+        if not sku or not title:
+            raise RowError('sku and title are required')
+        try:
+            price = Decimal(str(row.get('price') or 0)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise RowError(f"invalid price {row.get('price')!r}")
+        if not 0 <= price < 10 ** 6:
+            raise RowError(f'price {price} out of range')
+        return {
+            'sku': sku[:64],
+            'title': title[:124],
+            'description': row.get('description') or '',
+            'price': price,
+            'categories': [
+                [slugify(slug)[:40] for slug in category.split('/') if slugify(slug)]
+                for category in self.split(row.get('categories'))
+            ],
+            'images': self.split(row.get('images')),
+        }
+
+    def import_batch(self, rows: list, offset: int) -> None:
+        parsed = {}
+        for number, row in enumerate(rows, start=offset + 1):
+            try:
+                row = self.parse_row(row)
+            except RowError as error:
+                self.stats['errors'] += 1
+                self.stderr.write(f'Row {number}: {error}')
+                continue
+            parsed[row['sku']] = row
+
+        # Images are downloaded before the transaction for the items that have none yet,
+        # so that an interrupted batch is imported again with its images
+        with_images = set(ProductGallery.objects.filter(product__sku__in=parsed).values_list('product__sku', flat=True))
+        images = self.fetch_images({sku: row['images'] for sku, row in parsed.items() if sku not in with_images})
+
+        saved = [name for names in images.values() for name in names]
+        try:
+            with transaction.atomic():
+                self.create_categories([path for row in parsed.values() for path in row['categories']])
+                items = self.upsert_items(parsed)
+                self.set_categories(items, parsed)
+                ProductGallery.objects.bulk_create([
+                    ProductGallery(product_id=items[sku].pk, image=name)
+                    for sku, names in images.items() for name in names
+                ])
+                # bulk_create sends no post_save, the thumbnails of the new images are scheduled here
+                # for after the commit. The entries are read back for their primary keys as with the items
+                for gallery in ProductGallery.objects.filter(image__in=saved):
+                    schedule_thumbnails(gallery)
+                get_search_backend().index(items.values())
+        except Exception:
+            # The rows of the batch are rolled back, the images saved for them would be left without entries
+            for name in saved:
+                default_storage.delete(name)
+            raise
+        self.stats['rows'] += len(parsed)
+        self.stats['images'] += sum(len(names) for names in images.values())
+
+    def create_categories(self, paths: list) -> None:
+        # Parents are created one level before their children, the tree fields are filled by the final rebuild
+        for depth in range(max((len(path) for path in paths), default=0)):
+            nodes = {}
+            for path in paths:
+                if depth < len(path) and path[depth] not in self.categories:
+                    slug = path[depth]
+                    parent = self.categories[path[depth - 1]] if depth else None
+                    nodes[slug] = Category(
+                        name=slug.replace('-', ' ').capitalize()[:32], slug=slug[:40], parent_id=parent,
+                        lft=0, rght=0, tree_id=0, level=0
+                    )
+            if nodes:
+                Category.objects.bulk_create(nodes.values())
+                self.categories.update(Category.objects.filter(slug__in=nodes).values_list('slug', 'pk'))
+                self.stats['categories'] += len(nodes)
+                self.rebuild_tree = True
+
+    def upsert_items(self, parsed: dict) -> dict:
+        existing = {item.sku: item for item in Item.objects.filter(sku__in=parsed).only('pk', 'sku')}
+        now = timezone.now()
+        for sku, item in existing.items():
+            row = parsed[sku]
+            item.title, item.description, item.price = row['title'], row['description'], row['price']
+            item.search_document = build_search_document(item.title, item.description)
+            item.updated_at = now
+        Item.objects.bulk_update(existing.values(), UPDATED_FIELDS)
+
+        created = [
+            Item(
+                sku=sku, title=row['title'], description=row['description'], price=row['price'],
+                salesman_id=self.salesman_id, search_document=build_search_document(row['title'], row['description'])
+            )
+            for sku, row in parsed.items() if sku not in existing
+        ]
+        Item.objects.bulk_create(created)
+        # Primary keys are not returned by bulk_create on MySQL, the created items are read back by SKU
+        new_items = {item.sku: item for item in Item.objects.filter(sku__in=[item.sku for item in created])}
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(existing)
+        return {**existing, **new_items}
+
+    def set_categories(self, items: dict, parsed: dict) -> None:
+        # The feed replaces the categories of the items it lists categories for
+        through = Item.category.through
+        through.objects.filter(item_id__in=[items[sku].pk for sku, row in parsed.items() if row['categories']]).delete()
+        through.objects.bulk_create([
+            through(item_id=item.pk, category_id=self.categories[path[-1]])
+            for sku, item in items.items() for path in parsed[sku]['categories']
+        ], ignore_conflicts=True)
+
+    def fetch_image(self, sku: str, url: str) -> str:
+        # urlopen also reads file:// and ftp:// URLs, a feed must not make the import read local files
+        parts = urlsplit(url)
+        if parts.scheme not in IMAGE_SCHEMES:
+            raise ValueError(f'unsupported URL scheme {parts.scheme!r}')
+        with urlopen(url, timeout=IMAGE_TIMEOUT) as response:
+            content = response.read()
+        name = posixpath.basename(parts.path) or 'image.jpg'
+        return default_storage.save(f'gallery_product/{sku}-{name}', ContentFile(content))
+
+    def fetch_images(self, urls: dict) -> dict:
+        futures = [(sku, url, self.pool.submit(self.fetch_image, sku, url)) for sku, items in urls.items()
+                   for url in items]
+        images = {}
+        for sku, url, future in futures:
+            try:
+                images.setdefault(sku, []).append(future.result())
+            except (OSError, ValueError, http.client.HTTPException) as error:
+                self.stats['image_errors'] += 1
+                self.stderr.write(f'Image {url} of {sku}: {error}')
+        return images
@@ -0,0 +1,40 @@
+"""
+Import required libraries for the rebuild_search_index command
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import Item
+from shop.search import build_search_document, get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the stemmed search documents of items and the search index built over them
+    """
+    help = 'Rebuild Item.search_document and the full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of items updated by a single bulk_update',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        count = 0
+
+        with transaction.atomic():
+            for item in Item.objects.only('title', 'description').order_by('pk').iterator(chunk_size=batch_size):
+                item.search_document = build_search_document(item.title, item.description)
+                batch.append(item)
+                if len(batch) == batch_size:
+                    count += Item.objects.bulk_update(batch, ['search_document'])
+                    batch = []
+            count += Item.objects.bulk_update(batch, ['search_document'])
+            get_search_backend().rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search documents of {count} items'))
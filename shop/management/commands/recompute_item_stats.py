@@ -0,0 +1,36 @@
+"""
+Import required libraries for the recompute_item_stats command
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from shop.models import Item
+from shop.sevices import update_items_stats
+
+
+class Command(BaseCommand):
+    """
+    Recompute the stored rating, review and purchase counters of items
+    from the reviews and purchases tables to repair any drift
+    """
+    help = 'Recompute rating_avg, rating_count, review_count and purchase_count of all items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of item ids updated by a single UPDATE statement',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Item.objects.aggregate(Max('pk'))['pk__max'] or 0
+        updated = 0
+
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += update_items_stats(Item.objects.filter(pk__gt=start, pk__lte=start + batch_size))
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed stats of {updated} items'))
@@ -0,0 +1,88 @@
+"""
+Import required libraries for the slow_query_report command
+"""
+import glob
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    """
+    Group the slow queries of the log and its rotated files by fingerprint and rank them by total time
+    """
+    help = 'Rank the fingerprints of the slow-query log by total time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(settings.SHOP_SLOW_QUERY_LOG), help='Slow-query log file')
+        parser.add_argument('--limit', type=int, default=20, help='Number of fingerprints to show')
+        parser.add_argument('--view', help='Only count the queries of this view')
+        parser.add_argument('--json', action='store_true', help='Write the report as JSON')
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(f"{options['path']}*"))
+        if not paths:
+            raise CommandError(f"There is no slow-query log at {options['path']}")
+
+        groups = {}
+        for record in self.read_records(paths):
+            if options['view'] and record.get('view') != options['view']:
+                continue
+            group = groups.setdefault(record['fingerprint'], {
+                'fingerprint': record['fingerprint'], 'sql': record['sql'], 'durations': [],
+                'views': Counter(), 'frames': Counter(), 'templates': Counter(), 'explain': record.get('explain'),
+            })
+            group['durations'].append(record['duration_ms'])
+            group['views'][record.get('view')] += 1
+            group['frames'][record.get('frame')] += 1
+            if record.get('template'):
+                group['templates'][record['template']] += 1
+
+        report = [self.summarize(group) for group in groups.values()]
+        report.sort(key=lambda row: row['total_ms'], reverse=True)
+        report = report[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+        for rank, row in enumerate(report, start=1):
+            self.stdout.write(
+                f"{rank}. {row['fingerprint']} total {row['total_ms']} ms, {row['count']} queries, "
+                f"mean {row['mean_ms']} ms, p95 {row['p95_ms']} ms, max {row['max_ms']} ms"
+            )
+            self.stdout.write(f"   views: {row['views']}")
+            self.stdout.write(f"   frames: {row['frames']}")
+            if row['templates']:
+                self.stdout.write(f"   templates: {row['templates']}")
+            self.stdout.write(f"   {row['sql']}")
+            for line in row['explain'] or []:
+                self.stdout.write(f'     {line}')
+
+    def read_records(self, paths: list):
+        for path in paths:
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def summarize(self, group: dict) -> dict:
+        durations = group['durations']
+        return {
+            'fingerprint': group['fingerprint'],
+            'count': len(durations),
+            'total_ms': round(sum(durations), 3),
+            'mean_ms': round(sum(durations) / len(durations), 3),
+            'p95_ms': round(percentile(durations, 95), 3),
+            'max_ms': round(max(durations), 3),
+            'views': dict(group['views'].most_common(3)),
+            'frames': dict(group['frames'].most_common(3)),
+            'templates': dict(group['templates'].most_common(3)),
+            'sql': group['sql'],
+            'explain': group['explain'],
+        }
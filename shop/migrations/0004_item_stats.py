@@ -0,0 +1,57 @@
+# Generated by Django 4.1.6 on 2026-10-18 16:39
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Avg, Count, FloatField, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_item_stats(apps, schema_editor):
+    Item = apps.get_model('shop', 'Item')
+    Review = apps.get_model('shop', 'Review')
+    Purchase = apps.get_model('shop', 'Purchase')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    purchases = Purchase.item.through.objects.filter(item=OuterRef('pk')).order_by().values('item')
+    Item.objects.update(
+        rating_avg=Coalesce(
+            Subquery(reviews.annotate(avg=Avg('rate')).values('avg')), Value(0.0), output_field=FloatField()
+        ),
+        rating_count=Coalesce(Subquery(reviews.annotate(count=Count('rate')).values('count')), Value(0)),
+        review_count=Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), Value(0)),
+        purchase_count=Coalesce(Subquery(purchases.annotate(count=Count('pk')).values('count')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_alter_favorite_user_purchase'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='purchase',
+            options={'ordering': ('-created_at',)},
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='purchase_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Purchases count'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='rating_avg',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Average rate'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Rates count'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='review_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Reviews count'),
+        ),
+        migrations.RunPython(fill_item_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.6 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+from shop.search import build_search_document, FTS_TABLE, FULLTEXT_INDEX
+
+
+def fill_search_documents(apps, schema_editor):
+    Item = apps.get_model('shop', 'Item')
+    items = list(Item.objects.only('title', 'description'))
+    for item in items:
+        item.search_document = build_search_document(item.title, item.description)
+    Item.objects.bulk_update(items, ['search_document'], batch_size=1000)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(f'ALTER TABLE shop_item ADD FULLTEXT INDEX {FULLTEXT_INDEX} (search_document)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(document)')
+        schema_editor.execute(f'INSERT INTO {FTS_TABLE} (rowid, document) SELECT id, search_document FROM shop_item')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(f'ALTER TABLE shop_item DROP INDEX {FULLTEXT_INDEX}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_item_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Search document'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
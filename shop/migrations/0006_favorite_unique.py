@@ -0,0 +1,28 @@
+# Generated by Django 4.1.6 on 2026-10-18 16:48
+
+from django.db import migrations, models
+from django.db.models import Min, Count
+
+
+def delete_duplicate_favorites(apps, schema_editor):
+    Favorite = apps.get_model('shop', 'Favorite')
+    duplicates = Favorite.objects.values('user', 'item').annotate(first=Min('pk'), count=Count('pk')) \
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        Favorite.objects.filter(user=duplicate['user'], item=duplicate['item']) \
+            .exclude(pk=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_item_search_document'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_favorites, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='unique_user_favorite_item'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.6 on 2026-10-18 16:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_purchase_lines(apps, schema_editor):
+    Purchase = apps.get_model('shop', 'Purchase')
+    PurchaseLine = apps.get_model('shop', 'PurchaseLine')
+
+    rows = Purchase.item.through.objects.order_by('pk').values_list('purchase_id', 'item_id', 'item__title', 'item__price')
+    lines = []
+    for purchase_id, item_id, title, price in rows.iterator(chunk_size=BATCH_SIZE):
+        lines.append(PurchaseLine(purchase_id=purchase_id, item_id=item_id, title=title, unit_price=price))
+        if len(lines) >= BATCH_SIZE:
+            PurchaseLine.objects.bulk_create(lines)
+            lines = []
+    PurchaseLine.objects.bulk_create(lines)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_cart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=124, verbose_name='Title')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Unit price')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Quantity')),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchase_lines', to='shop.item', verbose_name='Item')),
+                ('purchase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shop.purchase', verbose_name='Purchase')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+        migrations.RunPython(fill_purchase_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.6 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_purchase_lines'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='shop_purchase_user_history'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1.6 on 2026-10-18 16:53
+
+from django.db import migrations, models
+from django.db.models import Case, When, Value, Count, IntegerField
+
+RATE_HISTOGRAM_STEP = 20
+RATE_HISTOGRAM_SIZE = 5
+
+
+def fill_rating_histogram(apps, schema_editor):
+    Item = apps.get_model('shop', 'Item')
+    Review = apps.get_model('shop', 'Review')
+
+    bucket = Case(
+        *[
+            When(rate__lt=(index + 1) * RATE_HISTOGRAM_STEP, then=Value(index))
+            for index in range(RATE_HISTOGRAM_SIZE - 1)
+        ],
+        default=Value(RATE_HISTOGRAM_SIZE - 1),
+        output_field=IntegerField()
+    )
+    rows = Review.objects.order_by().annotate(bucket=bucket).values('product_id', 'bucket') \
+        .annotate(count=Count('pk'))
+    histograms = {}
+    for row in rows:
+        histograms.setdefault(row['product_id'], [0] * RATE_HISTOGRAM_SIZE)[row['bucket']] = row['count']
+
+    Item.objects.update(rating_histogram=[0] * RATE_HISTOGRAM_SIZE)
+    Item.objects.bulk_update(
+        [Item(pk=pk, rating_histogram=histogram) for pk, histogram in histograms.items()],
+        ['rating_histogram'],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_purchase_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Rates histogram'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='shop_review_product_created'),
+        ),
+        migrations.RunPython(fill_rating_histogram, migrations.RunPython.noop),
+    ]
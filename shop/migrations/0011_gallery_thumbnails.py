@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_item_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productgallery',
+            name='has_thumbnails',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Has thumbnails'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.6 on 2026-10-18 16:58
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    Item = apps.get_model('shop', 'Item')
+    Item.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_gallery_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Updated'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_item_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='SKU'),
+        ),
+    ]
@@ -5,12 +5,14 @@ from mptt.models import MPTTModel
 from mptt.fields import TreeForeignKey, TreeManyToManyField
 
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Avg
 from django.db import models
 from django.urls import reverse
 
 from django_shop import settings
 
+RATE_HISTOGRAM_STEP = 20
+RATE_HISTOGRAM_SIZE = 5
+
 
 class Category(MPTTModel):
     """
@@ -53,6 +55,13 @@ class Item(models.Model):
     """
     Model to represent a product
     """
+    sku = models.CharField(
+        max_length=64,
+        verbose_name='SKU',
+        unique=True,
+        null=True,
+        blank=True
+    )
     title = models.CharField(
         max_length=124,
         verbose_name='Title'
@@ -81,6 +90,45 @@ class Item(models.Model):
         verbose_name='Created',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Updated',
+        auto_now=True
+    )
+    rating_avg = models.FloatField(
+        verbose_name='Average rate',
+        default=0,
+        db_index=True,
+        editable=False
+    )
+    rating_count = models.PositiveIntegerField(
+        verbose_name='Rates count',
+        default=0,
+        editable=False
+    )
+    review_count = models.PositiveIntegerField(
+        verbose_name='Reviews count',
+        default=0,
+        db_index=True,
+        editable=False
+    )
+    purchase_count = models.PositiveIntegerField(
+        verbose_name='Purchases count',
+        default=0,
+        db_index=True,
+        editable=False
+    )
+    rating_histogram = models.JSONField(
+        verbose_name='Rates histogram',
+        default=list,
+        blank=True,
+        editable=False
+    )
+    search_document = models.TextField(
+        verbose_name='Search document',
+        blank=True,
+        default='',
+        editable=False
+    )
 
     class Meta:
         """
@@ -97,11 +145,36 @@ class Item(models.Model):
         """
         return reverse('item_detail', kwargs={'pk': self.pk})
 
+    @property
+    def card_image(self):
+        """
+        Return the first gallery image of the item, using the prefetched `card_images` when available
+        """
+        if hasattr(self, 'card_images'):
+            return self.card_images[0] if self.card_images else None
+        return self.image.first()
+
     def get_avg_rate(self):
         """
-        Return the average rate of all reviews for the item
+        Return the average rate of all reviews for the item, or None if it has no rates
         """
-        return Review.objects.filter(product=self).aggregate(Avg('rate'))['rate__avg']
+        return self.rating_avg if self.rating_count else None
+
+    def get_rate_histogram(self):
+        """
+        Return the stored number of reviews per rate range, with the share of each range in percents
+        """
+        counts = self.rating_histogram or [0] * RATE_HISTOGRAM_SIZE
+        total = sum(counts)
+        return [
+            {
+                'min_rate': index * RATE_HISTOGRAM_STEP,
+                'max_rate': min((index + 1) * RATE_HISTOGRAM_STEP, 100),
+                'count': count,
+                'percent': round(count * 100 / total) if total else 0,
+            }
+            for index, count in enumerate(counts)
+        ]
 
 
 class ProductGallery(models.Model):
@@ -118,6 +191,11 @@ class ProductGallery(models.Model):
         verbose_name='Product',
         on_delete=models.CASCADE
     )
+    has_thumbnails = models.BooleanField(
+        verbose_name='Has thumbnails',
+        default=False,
+        editable=False
+    )
 
     def __str__(self):
         return f'{self.product}'
@@ -157,9 +235,12 @@ class Review(models.Model):
 
     class Meta:
         """
-        Metaclass to control the order of insertion of reviews
+        Metaclass to control the order of insertion of reviews and index the reviews of items in that order
         """
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'], name='shop_review_product_created'),
+        ]
 
     def __str__(self):
         return f'{self.product}'
@@ -182,6 +263,14 @@ class Favorite(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        """
+        Metaclass to forbid duplicate favorites of a user
+        """
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item'], name='unique_user_favorite_item'),
+        ]
+
     def __str__(self):
         return f'{self.item}'
 
@@ -243,9 +332,134 @@ class Purchase(models.Model):
 
     class Meta:
         """
-        Metaclass to control the order of insertion of purchases
+        Metaclass to control the order of insertion of purchases and index the purchase history of users
         """
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='shop_purchase_user_history'),
+        ]
 
     def __str__(self):
         return f'{self.email}'
+
+    @property
+    def items_count(self):
+        """
+        Return the number of items in the purchase, using the prefetched lines
+        """
+        return sum(line.quantity for line in self.lines.all())
+
+
+class PurchaseLine(models.Model):
+    """
+    Model for an item of a purchase with the title and the price at the time of the purchase
+    """
+    purchase = models.ForeignKey(
+        Purchase,
+        related_name='lines',
+        verbose_name='Purchase',
+        on_delete=models.CASCADE
+    )
+    item = models.ForeignKey(
+        Item,
+        related_name='purchase_lines',
+        verbose_name='Item',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    title = models.CharField(
+        max_length=124,
+        verbose_name='Title'
+    )
+    unit_price = models.DecimalField(
+        verbose_name='Unit price',
+        max_digits=8,
+        decimal_places=2
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name='Quantity',
+        default=1
+    )
+
+    class Meta:
+        """
+        Metaclass to keep the lines in the order of the basket
+        """
+        ordering = ['pk']
+
+    def __str__(self):
+        return f'{self.title} x {self.quantity}'
+
+    @property
+    def total_price(self):
+        """
+        Return the price of the line
+        """
+        return self.unit_price * self.quantity
+
+
+class Cart(models.Model):
+    """
+    Model for the basket of a user or of an anonymous session
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name='cart',
+        verbose_name='User',
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Created at',
+        auto_now_add=True
+    )
+
+    def __str__(self):
+        return f'{self.user or self.pk}'
+
+
+class CartLine(models.Model):
+    """
+    Model for an item in a basket with its quantity
+    """
+    cart = models.ForeignKey(
+        Cart,
+        related_name='lines',
+        verbose_name='Cart',
+        on_delete=models.CASCADE
+    )
+    item = models.ForeignKey(
+        Item,
+        related_name='cart_lines',
+        verbose_name='Item',
+        on_delete=models.CASCADE
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name='Quantity',
+        default=1
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Created at',
+        auto_now_add=True
+    )
+
+    class Meta:
+        """
+        Metaclass to keep the lines in the order of adding and forbid duplicate items in a cart
+        """
+        ordering = ['created_at', 'pk']
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'item'], name='unique_cart_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.item} x {self.quantity}'
+
+    @property
+    def total_price(self):
+        """
+        Return the price of the line
+        """
+        return self.item.price * self.quantity
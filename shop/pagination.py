@@ -0,0 +1,235 @@
+"""
+Import required libraries for the pagination of listings
+"""
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet, Q
+from django.utils.functional import cached_property
+
+from django_shop.db.router import use_primary
+from shop.cache import get_version, CATALOG_VERSION, record_cache_result
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CursorPage:
+    """
+    Page of a keyset (cursor) pagination, it knows only its neighbours and never counts the rows
+    """
+
+    def __init__(self, object_list: list, next_cursor: str = None, previous_cursor: str = None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+def encode_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values: list, direction: str) -> str:
+    data = json.dumps([direction, [encode_value(value) for value in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    Return the direction and the values of the cursor, or None if the cursor is malformed
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+def get_keyset_ordering(queryset: QuerySet) -> list:
+    """
+    Return the ordering of the queryset, ending with the primary key to make it total
+    """
+    ordering = [str(field) for field in queryset.query.order_by] or list(queryset.model._meta.ordering)
+    if not ordering or ordering[-1].lstrip('-') not in ('pk', 'id'):
+        ordering.append('pk')
+    return ordering
+
+
+def get_keyset_condition(ordering: list, values: list, direction: str) -> Q:
+    """
+    Return the condition selecting the rows after (or before) the values in the given ordering
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != (direction == PREVIOUS)
+        condition |= equal & Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def reverse_ordering(ordering: list) -> list:
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+def get_keyset_values(obj, ordering: list) -> list:
+    return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+
+def paginate_by_cursor(queryset: QuerySet, page_size: int, cursor: str = None) -> CursorPage:
+    """
+    Return the page of the queryset following the cursor, fetching one extra row to detect the next page
+    """
+    ordering = get_keyset_ordering(queryset)
+    decoded = decode_cursor(cursor) if cursor else None
+    direction, values = decoded if decoded and len(decoded[1]) == len(ordering) else (NEXT, None)
+
+    if values is not None:
+        queryset = queryset.filter(get_keyset_condition(ordering, values, direction))
+    if direction == PREVIOUS:
+        queryset = queryset.order_by(*reverse_ordering(ordering))
+    else:
+        queryset = queryset.order_by(*ordering)
+
+    object_list = list(queryset[:page_size + 1])
+    has_more = len(object_list) > page_size
+    object_list = object_list[:page_size]
+
+    if direction == PREVIOUS:
+        object_list.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, values is not None
+
+    if not object_list:
+        return CursorPage(object_list)
+
+    next_cursor = encode_cursor(get_keyset_values(object_list[-1], ordering), NEXT) if has_next else None
+    previous_cursor = encode_cursor(get_keyset_values(object_list[0], ordering), PREVIOUS) if has_previous else None
+    return CursorPage(object_list, next_cursor, previous_cursor)
+
+
+def get_count_key(params: dict) -> str:
+    data = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def estimate_count(queryset: QuerySet):
+    """
+    Return the row estimate of the optimizer for the queryset, or None if the database cannot provide it
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'mysql':
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columns = [column[0].lower() for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    estimate = 1
+    for row in rows:
+        if row.get('select_type') in ('SIMPLE', 'PRIMARY') and row.get('rows'):
+            estimate *= row['rows'] * float(row.get('filtered') or 100) / 100
+    return int(estimate)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator caching the number of rows per filter key and the ordered ids of every page per page key
+    until the catalog changes.
+    Above SHOP_APPROXIMATE_COUNT_THRESHOLD rows it trusts the estimate of the optimizer instead of counting
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, count_key=None,
+                 page_key=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.count_key = count_key
+        self.page_key = page_key
+        self._is_approximate = False
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return self.object_list.count()
+
+        key = f'shop:count:{get_version(CATALOG_VERSION)}:{self.count_key}'
+        cached = cache.get(key)
+        record_cache_result('count', cached is not None)
+        if cached is not None:
+            count, self._is_approximate = cached
+            return count
+
+        # Values cached under the current version are read from the primary, a lagging replica
+        # could miss the write that bumped the version and the stale count would be kept until the next one
+        with use_primary():
+            count = estimate_count(self.object_list)
+            self._is_approximate = count is not None and count > getattr(
+                settings, 'SHOP_APPROXIMATE_COUNT_THRESHOLD', 100000
+            )
+            if not self._is_approximate:
+                count = self.object_list.count()
+
+        cache.set(key, (count, self._is_approximate), getattr(settings, 'SHOP_COUNT_CACHE_TIMEOUT', 60))
+        return count
+
+    @property
+    def is_approximate(self) -> bool:
+        return self.count is not None and self._is_approximate
+
+    def get_page_ids(self, number: int) -> list:
+        key = f'shop:page:{get_version(CATALOG_VERSION)}:{self.page_key}:{self.per_page}:{self.orphans}:{number}'
+        ids = cache.get(key)
+        record_cache_result('page', ids is not None)
+        if ids is None:
+            bottom = (number - 1) * self.per_page
+            top = bottom + self.per_page
+            if top + self.orphans >= self.count:
+                top = self.count
+            with use_primary():
+                ids = list(self.object_list[bottom:top].values_list('pk', flat=True))
+            cache.set(key, ids, getattr(settings, 'SHOP_PAGE_CACHE_TIMEOUT', 300))
+        return ids
+
+    def page(self, number):
+        if self.page_key is None:
+            return super().page(number)
+
+        number = self.validate_number(number)
+        ids = self.get_page_ids(number)
+        items = self.object_list.model._default_manager.filter(pk__in=ids) \
+            .prefetch_related(*self.object_list._prefetch_related_lookups)
+        items = {item.pk: item for item in items}
+        return self._get_page([items[pk] for pk in ids if pk in items], number, self)
@@ -0,0 +1,158 @@
+"""
+Import required libraries for the full-text search of items
+"""
+import re
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import QuerySet, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from shop.models import Item
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile('[а-яё]')
+MIN_STEM_LENGTH = 3
+TITLE_WEIGHT = 2
+FTS_TABLE = 'shop_item_fts'
+FULLTEXT_INDEX = 'shop_item_search_document_ft'
+
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'иях', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их', 'ой', 'ей',
+    'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ов',
+    'ев', 'ия', 'ию', 'ии', 'ью', 'ать', 'ять', 'ить', 'еть', 'ешь', 'ет', 'ют', 'ут', 'ит', 'ат', 'ят',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+ENGLISH_ENDINGS = sorted([
+    'ational', 'ations', 'ation', 'ness', 'ment', 'ings', 'ing', 'edly', 'ies', 'ers', 'ed', 'es', 'er',
+    'ly', 's', 'e', 'y',
+], key=len, reverse=True)
+
+
+def stem(word: str) -> str:
+    word = word.lower().replace('ё', 'е')
+    endings = RUSSIAN_ENDINGS if CYRILLIC_RE.search(word) else ENGLISH_ENDINGS
+
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def get_stems(text: str) -> list:
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def build_search_document(title: str, description: str) -> str:
+    return ' '.join(get_stems(title) * TITLE_WEIGHT + get_stems(description))
+
+
+class BaseSearchBackend:
+    """
+    Base class for the search backends of the shop.
+    Each backend filters an Item queryset by a search phrase and annotates it with `search_rank`.
+    The index is written on the `using` database, the one the router picks for Item writes by default
+    """
+
+    def __init__(self, using: str = None):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using or router.db_for_write(Item)]
+
+    def index(self, items: Iterable[Item]) -> None:
+        """
+        Add or update the items in the search index
+        """
+
+    def remove(self, item_ids: Iterable[int]) -> None:
+        """
+        Remove the items from the search index
+        """
+
+    def rebuild(self) -> None:
+        """
+        Rebuild the search index from the stored search documents
+        """
+
+    def search(self, items: QuerySet, query: str) -> QuerySet:
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Search backend for databases without full-text support, it looks up the stems with LIKE
+    """
+
+    def search(self, items: QuerySet, query: str) -> QuerySet:
+        condition = Q()
+        for term in get_stems(query):
+            condition &= Q(search_document__contains=term)
+        return items.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class MySQLSearchBackend(BaseSearchBackend):
+    """
+    Search backend using the MySQL FULLTEXT index over `Item.search_document`
+    """
+
+    def search(self, items: QuerySet, query: str) -> QuerySet:
+        terms = ' '.join(f'+{term}*' for term in get_stems(query))
+        match = f'MATCH ({Item._meta.db_table}.search_document) AGAINST (%s IN BOOLEAN MODE)'
+        items = items.annotate(search_rank=RawSQL(match, (terms,), output_field=FloatField()))
+        return items.filter(search_rank__gt=0)
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    Search backend using an SQLite FTS5 table, ranked by its bm25() function
+    """
+
+    def index(self, items: Iterable[Item]) -> None:
+        rows = [(item.pk, item.search_document) for item in items]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk, _ in rows])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)', rows)
+
+    def remove(self, item_ids: Iterable[int]) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in item_ids])
+
+    def rebuild(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, document) SELECT id, search_document FROM {Item._meta.db_table}'
+            )
+
+    def search(self, items: QuerySet, query: str) -> QuerySet:
+        terms = ' '.join(f'"{term}"*' for term in get_stems(query))
+        matched = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (terms,))
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {Item._meta.db_table}.id',
+            (terms,),
+            output_field=FloatField()
+        )
+        return items.filter(pk__in=matched).annotate(search_rank=rank)
+
+
+VENDOR_BACKENDS = {
+    'mysql': MySQLSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend(using: str = None) -> BaseSearchBackend:
+    """
+    Return the backend from the SHOP_SEARCH_BACKEND setting or the one matching the vendor of the database
+    """
+    path = getattr(settings, 'SHOP_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)(using)
+    vendor = connections[using or router.db_for_read(Item)].vendor
+    return VENDOR_BACKENDS.get(vendor, SimpleSearchBackend)(using)
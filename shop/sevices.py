@@ -1,77 +1,423 @@
-from django.db.models import Sum, QuerySet
+import hashlib
+import json
 
-from shop.forms import PurchaseForm, ReviewForm
-from shop.models import Item, Favorite
-from users.models import CustomUser
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, QuerySet, F, OuterRef, Subquery, Avg, Count, FloatField, Value, Case, When, \
+    IntegerField
+from django.db.models.functions import Coalesce, Now
 
+from django_shop.db.router import use_primary
+from shop.cache import bump_version_on_commit, CATALOG_VERSION, POPULARITY_VERSION, get_version, aget_version, \
+    abump_version
+from shop.filters import prefetch_card_data, get_card_images_prefetch
+from shop.forms import PurchaseForm, ReviewForm
+from shop.models import Item, Favorite, Review, Purchase, PurchaseLine, Cart, CartLine, RATE_HISTOGRAM_STEP, \
+    RATE_HISTOGRAM_SIZE
 
-def get_items_by_list_ids(ids: list):
-    return Item.objects.filter(pk__in=ids).all()
+CART_SESSION_KEY = 'cart_id'
 
 
-def get_items_from_basket(request) -> QuerySet:
-    item_ids = request.session.get('basket', [])
-    return get_items_by_list_ids(item_ids)
+def get_items_by_list_ids(ids: list):
+    return prefetch_card_data(Item.objects.filter(pk__in=ids))
 
 
 def get_sum_of_products(products: QuerySet) -> int:
     return products.aggregate(Sum('price')).get('price__sum')
 
 
-def create_purchase(form: PurchaseForm, request) -> None:
+def get_item_detail_queryset() -> QuerySet:
+    return Item.objects.prefetch_related('image')
+
+
+def touch_items(item_ids: list) -> None:
+    Item.objects.filter(pk__in=item_ids).update(updated_at=Now())
+    bump_version_on_commit(CATALOG_VERSION)
+
+
+def get_item_updated_at(item_id: int):
+    return Item.objects.filter(pk=item_id).values_list('updated_at', flat=True).first()
+
+
+def get_item_reviews(item_id: int) -> QuerySet:
+    return Review.objects.filter(product_id=item_id).select_related('author')
+
+
+def serialize_review(review: Review) -> dict:
+    return {
+        'author': str(review.author),
+        'rate': review.rate,
+        'text': review.text,
+        'created_at': review.created_at.isoformat(),
+    }
+
+
+def get_review_stats_values() -> dict:
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    return {
+        'rating_avg': Coalesce(
+            Subquery(reviews.annotate(avg=Avg('rate')).values('avg')), Value(0.0), output_field=FloatField()
+        ),
+        'rating_count': Coalesce(Subquery(reviews.annotate(count=Count('rate')).values('count')), Value(0)),
+        'review_count': Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), Value(0)),
+    }
+
+
+def get_purchase_stats_values() -> dict:
+    purchases = Purchase.item.through.objects.filter(item=OuterRef('pk')).order_by().values('item')
+    return {
+        'purchase_count': Coalesce(Subquery(purchases.annotate(count=Count('pk')).values('count')), Value(0)),
+    }
+
+
+def get_rate_histograms(reviews: QuerySet) -> dict:
+    bucket = Case(
+        *[
+            When(rate__lt=(index + 1) * RATE_HISTOGRAM_STEP, then=Value(index))
+            for index in range(RATE_HISTOGRAM_SIZE - 1)
+        ],
+        default=Value(RATE_HISTOGRAM_SIZE - 1),
+        output_field=IntegerField()
+    )
+    rows = reviews.order_by().annotate(bucket=bucket).values('product_id', 'bucket').annotate(count=Count('pk'))
+
+    histograms = {}
+    for row in rows:
+        histograms.setdefault(row['product_id'], [0] * RATE_HISTOGRAM_SIZE)[row['bucket']] = row['count']
+    return histograms
+
+
+def update_review_stats(item_id: int) -> None:
+    with use_primary():
+        histogram = get_rate_histograms(Review.objects.filter(product_id=item_id)).get(item_id)
+    Item.objects.filter(pk=item_id).update(
+        **get_review_stats_values(), rating_histogram=histogram or [0] * RATE_HISTOGRAM_SIZE, updated_at=Now()
+    )
+    bump_version_on_commit(CATALOG_VERSION)
+
+
+def update_items_stats(items: QuerySet = None) -> int:
+    items = Item.objects.all() if items is None else items
+    with transaction.atomic():
+        count = items.update(
+            **get_review_stats_values(), **get_purchase_stats_values(), rating_histogram=[0] * RATE_HISTOGRAM_SIZE,
+            updated_at=Now()
+        )
+        histograms = get_rate_histograms(Review.objects.filter(product__in=items.values('pk')))
+        Item.objects.bulk_update(
+            [Item(pk=pk, rating_histogram=histogram) for pk, histogram in histograms.items()],
+            ['rating_histogram'],
+            batch_size=1000
+        )
+        bump_version_on_commit(CATALOG_VERSION)
+    return count
+
+
+def create_purchase(form: PurchaseForm, request):
+    """
+    Save the purchase of the lines in the basket and empty it, return None when the basket is empty
+    """
     purchase = form.save(commit=False)
-    products = get_items_from_basket(request)
-    total_price = get_sum_of_products(products)
     user = request.user
-    user = user if user.pk else None
+    purchase.user = user if user.pk else None
 
-    purchase.total_price = total_price
-    purchase.user = user
-    purchase = form.save()
-    purchase.item.add(*products)
+    with use_primary(), transaction.atomic():
+        # The lines are locked before they are read, a concurrent checkout of the same basket waits here
+        # and finds it empty instead of buying the lines twice. The items are read apart so they stay unlocked
+        line_ids = list(get_basket_lines_queryset(request).select_for_update().values_list('pk', flat=True))
+        cart_lines = list(CartLine.objects.filter(pk__in=line_ids).select_related('item').order_by('pk'))
+        if not cart_lines:
+            return None
+        purchase.total_price = get_basket_total(cart_lines)
+        purchase.save()
+        PurchaseLine.objects.bulk_create([
+            PurchaseLine(
+                purchase=purchase,
+                item_id=line.item_id,
+                title=line.item.title,
+                unit_price=line.item.price,
+                quantity=line.quantity
+            )
+            for line in cart_lines
+        ])
+        Purchase.item.through.objects.bulk_create(
+            [Purchase.item.through(purchase_id=purchase.pk, item_id=line.item_id) for line in cart_lines]
+        )
+        item_ids = [line.item_id for line in cart_lines]
+        Item.objects.filter(pk__in=item_ids).update(purchase_count=F('purchase_count') + 1)
+        # The update sends no signal, the listings sorted by popularity are invalidated here
+        bump_version_on_commit(POPULARITY_VERSION)
+        CartLine.objects.filter(pk__in=[line.pk for line in cart_lines]).delete()
+    return purchase
 
 
 def add_review(form: ReviewForm, user_id: int, item_id: int) -> None:
     review = form.save(commit=False)
     review.author_id = user_id
     review.product_id = item_id
-    review.save()
+    with transaction.atomic():
+        review.save()
+
+
+def get_favorites_version(user_id: int) -> str:
+    return f'favorites:{user_id}'
+
+
+def get_favorites_key(user_id: int, version: int) -> str:
+    return f'shop:favorites:{user_id}:{version}'
+
 
+def get_favorite_ids(user_id: int) -> set:
+    """
+    Return the favorite item ids of the user from the cache, loading them on a miss.
+    Every write bumps the version of the key, so a set loaded before a write is never read after it
+    """
+    if user_id is None:
+        return set()
 
-def add_favorite(item_id: int, user_id: int) -> None:
-    item = Item.objects.get(pk=item_id)
-    user = CustomUser.objects.get(pk=user_id)
-    Favorite.objects.create(user=user, item=item)
+    key = get_favorites_key(user_id, get_version(get_favorites_version(user_id)))
+    item_ids = cache.get(key)
+    if item_ids is None:
+        item_ids = set(Favorite.objects.filter(user_id=user_id).values_list('item_id', flat=True))
+        cache.set(key, item_ids, getattr(settings, 'SHOP_FAVORITES_CACHE_TIMEOUT', 60 * 60))
+    return item_ids
 
 
-def delete_favorite(item_id: int, user_id: int) -> None:
-    item = Item.objects.get(pk=item_id)
-    user = CustomUser.objects.get(pk=user_id)
-    Favorite.objects.get(user=user, item=item).delete()
+def reset_favorites_cache(user_id: int) -> None:
+    bump_version_on_commit(get_favorites_version(user_id))
+
+
+def add_favorites(item_ids: list, user_id: int) -> set:
+    favorites = get_favorite_ids(user_id)
+    new_ids = set(Item.objects.filter(pk__in=set(item_ids) - favorites).values_list('pk', flat=True))
+    if new_ids:
+        Favorite.objects.bulk_create(
+            [Favorite(user_id=user_id, item_id=item_id) for item_id in new_ids], ignore_conflicts=True
+        )
+        reset_favorites_cache(user_id)
+    return favorites | new_ids
+
+
+def delete_favorites(item_ids: list, user_id: int) -> set:
+    favorites = get_favorite_ids(user_id)
+    old_ids = favorites.intersection(item_ids)
+    if old_ids:
+        Favorite.objects.filter(user_id=user_id, item_id__in=old_ids).delete()
+        reset_favorites_cache(user_id)
+    return favorites - old_ids
+
+
+def toggle_favorites(item_ids: list, user_id: int) -> set:
+    favorites = get_favorite_ids(user_id)
+    delete_favorites([item_id for item_id in item_ids if item_id in favorites], user_id)
+    return add_favorites([item_id for item_id in item_ids if item_id not in favorites], user_id)
 
 
 def check_favorite(item_id: int, user_id: int) -> bool:
-    return bool(Favorite.objects.filter(user__pk=user_id, item__id=item_id))
+    return int(item_id) in get_favorite_ids(user_id)
+
+
+def get_items_status(request, item_ids: list) -> dict:
+    basket = get_basket_item_ids(request, item_ids)
+    favorites = get_favorite_ids(request.user.pk).intersection(item_ids)
+    return {'basket': basket, 'favorite': favorites}
+
+
+def get_user_state(request) -> str:
+    favorites = sorted(get_favorite_ids(request.user.pk))
+    basket = sorted(get_basket_item_ids(request))
+    data = json.dumps([request.user.pk, favorites, basket], separators=(',', ':'))
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def get_cart_id(request, create: bool = False):
+    cart_id = request.session.get(CART_SESSION_KEY)
+    user = request.user if request.user.is_authenticated else None
+    if cart_id is None and user is not None:
+        cart_id = Cart.objects.filter(user=user).values_list('pk', flat=True).first()
+    if cart_id is None and create:
+        cart_id = Cart.objects.create(user=user).pk
+    if cart_id is not None and request.session.get(CART_SESSION_KEY) != cart_id:
+        request.session[CART_SESSION_KEY] = cart_id
+    return cart_id
+
+
+def migrate_session_basket(request) -> None:
+    item_ids = request.session.pop('basket', None)
+    if item_ids:
+        add_basket_items(get_cart_id(request, create=True), {int(item_id): 1 for item_id in item_ids})
+
+
+def get_basket_lines_queryset(request) -> QuerySet:
+    migrate_session_basket(request)
+    cart_id = request.session.get(CART_SESSION_KEY)
+    if cart_id is not None:
+        return CartLine.objects.filter(cart_id=cart_id)
+    if request.user.is_authenticated:
+        return CartLine.objects.filter(cart__user=request.user)
+    return CartLine.objects.none()
+
+
+def get_basket_lines(request) -> QuerySet:
+    return get_basket_lines_queryset(request).select_related('item') \
+        .prefetch_related(get_card_images_prefetch('item__image'))
+
+
+def get_basket_item_ids(request, item_ids: list = None) -> set:
+    lines = get_basket_lines_queryset(request)
+    if item_ids is not None:
+        lines = lines.filter(item_id__in=item_ids)
+    return set(lines.values_list('item_id', flat=True))
+
+
+def get_basket_total(lines) -> int:
+    return sum(line.total_price for line in lines)
+
+
+def add_basket_items(cart_id: int, quantities: dict) -> None:
+    lines = list(CartLine.objects.filter(cart_id=cart_id, item_id__in=quantities))
+    for line in lines:
+        line.quantity += quantities[line.item_id]
+    CartLine.objects.bulk_update(lines, ['quantity'])
+
+    new_ids = Item.objects.filter(pk__in=set(quantities) - {line.item_id for line in lines}) \
+        .values_list('pk', flat=True)
+    CartLine.objects.bulk_create(
+        [CartLine(cart_id=cart_id, item_id=item_id, quantity=quantities[item_id]) for item_id in new_ids],
+        ignore_conflicts=True
+    )
+
+
+def add_to_basket(request, item_id: int, quantity: int = 1) -> bool:
+    """
+    Add the item to the basket or increase its quantity, return False when there is no such item.
+    The cart is created only for an existing item, so that bad requests leave no empty carts behind
+    """
+    if not Item.objects.filter(pk=item_id).exists():
+        return False
+
+    migrate_session_basket(request)
+    cart_id = get_cart_id(request, create=True)
+    updated = CartLine.objects.filter(cart_id=cart_id, item_id=item_id).update(quantity=F('quantity') + quantity)
+    if not updated:
+        CartLine.objects.bulk_create(
+            [CartLine(cart_id=cart_id, item_id=item_id, quantity=quantity)], ignore_conflicts=True
+        )
+    return True
+
+
+def delete_from_basket(request, item_id: int) -> None:
+    get_basket_lines_queryset(request).filter(item_id=item_id).delete()
+
+
+def update_basket_quantity(request, item_id: int, quantity: int) -> None:
+    if quantity > 0:
+        get_basket_lines_queryset(request).filter(item_id=item_id).update(quantity=quantity)
+    else:
+        delete_from_basket(request, item_id)
+
+
+def merge_basket(request, user) -> None:
+    cart_id = request.session.get(CART_SESSION_KEY)
+    user_cart_id = Cart.objects.filter(user=user).values_list('pk', flat=True).first()
+    if cart_id is None or cart_id == user_cart_id:
+        if user_cart_id is not None:
+            request.session[CART_SESSION_KEY] = user_cart_id
+        return
+
+    with transaction.atomic():
+        if user_cart_id is None:
+            if not Cart.objects.filter(pk=cart_id, user=None).update(user=user):
+                request.session.pop(CART_SESSION_KEY)
+            return
+
+        quantities = dict(CartLine.objects.filter(cart_id=cart_id, cart__user=None).values_list(
+            'item_id', 'quantity'
+        ))
+        add_basket_items(user_cart_id, quantities)
+        Cart.objects.filter(pk=cart_id, user=None).delete()
+    request.session[CART_SESSION_KEY] = user_cart_id
+
+
+def load_request_state(request) -> None:
+    # Resolve the lazy user and load the session, neither has an async API in this Django version
+    request.user.is_authenticated
+    migrate_session_basket(request)
+
+
+async def aload_request_state(request) -> None:
+    await sync_to_async(load_request_state)(request)
+
+
+async def aget_favorite_ids(user_id: int) -> set:
+    if user_id is None:
+        return set()
+
+    key = get_favorites_key(user_id, await aget_version(get_favorites_version(user_id)))
+    item_ids = await cache.aget(key)
+    if item_ids is None:
+        favorites = Favorite.objects.filter(user_id=user_id).values_list('item_id', flat=True)
+        item_ids = {item_id async for item_id in favorites}
+        await cache.aset(key, item_ids, getattr(settings, 'SHOP_FAVORITES_CACHE_TIMEOUT', 60 * 60))
+    return item_ids
+
+
+async def aadd_favorites(item_ids: list, user_id: int) -> set:
+    favorites = await aget_favorite_ids(user_id)
+    items = Item.objects.filter(pk__in=set(item_ids) - favorites).values_list('pk', flat=True)
+    new_ids = {pk async for pk in items}
+    if new_ids:
+        await Favorite.objects.abulk_create(
+            [Favorite(user_id=user_id, item_id=item_id) for item_id in new_ids], ignore_conflicts=True
+        )
+        await abump_version(get_favorites_version(user_id))
+    return favorites | new_ids
+
+
+async def adelete_favorites(item_ids: list, user_id: int) -> set:
+    favorites = await aget_favorite_ids(user_id)
+    old_ids = favorites.intersection(item_ids)
+    if old_ids:
+        await Favorite.objects.filter(user_id=user_id, item_id__in=old_ids).adelete()
+        await abump_version(get_favorites_version(user_id))
+    return favorites - old_ids
+
+
+async def acheck_favorite(item_id: int, user_id: int) -> bool:
+    return int(item_id) in await aget_favorite_ids(user_id)
 
 
-def add_to_basket(request, item_id) -> None:
-    if request.method == 'POST':
-        item_id = int(request.POST.get('item'))
+async def aget_cart_id(request, create: bool = False):
+    cart_id = request.session.get(CART_SESSION_KEY)
+    user = request.user if request.user.is_authenticated else None
+    if cart_id is None and user is not None:
+        cart_id = await Cart.objects.filter(user=user).values_list('pk', flat=True).afirst()
+    if cart_id is None and create:
+        cart_id = (await Cart.objects.acreate(user=user)).pk
+    if cart_id is not None and request.session.get(CART_SESSION_KEY) != cart_id:
+        request.session[CART_SESSION_KEY] = cart_id
+    return cart_id
 
-    basket = request.session.get('basket', [])
 
-    if item_id not in basket:
-        basket.append(item_id)
+async def aadd_to_basket(request, item_id: int, quantity: int = 1) -> bool:
+    if not await Item.objects.filter(pk=item_id).aexists():
+        return False
 
-    request.session['basket'] = basket
+    cart_id = await aget_cart_id(request, create=True)
+    updated = await CartLine.objects.filter(cart_id=cart_id, item_id=item_id) \
+        .aupdate(quantity=F('quantity') + quantity)
+    if not updated:
+        await CartLine.objects.abulk_create(
+            [CartLine(cart_id=cart_id, item_id=item_id, quantity=quantity)], ignore_conflicts=True
+        )
+    return True
 
 
-def delete_from_basket(request) -> None:
-    if request.method == 'POST':
-        item_id = int(request.POST.get('item'))
-        basket = request.session.get('basket', [])
+async def adelete_from_basket(request, item_id: int) -> None:
+    await get_basket_lines_queryset(request).filter(item_id=item_id).adelete()
 
-        if item_id in basket:
-            basket.remove(item_id)
 
-        request.session['basket'] = basket
+async def acheck_basket(request, item_id: int) -> bool:
+    return await get_basket_lines_queryset(request).filter(item_id=item_id).aexists()
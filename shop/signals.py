@@ -0,0 +1,118 @@
+"""
+Import required libraries for signals
+"""
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from shop.cache import bump_version, CATEGORY_VERSION, CATALOG_VERSION
+from shop.models import Review, Item, Category, ProductGallery
+from shop.search import build_search_document, get_search_backend
+from shop.sevices import update_review_stats, merge_basket, touch_items
+from shop.thumbnails import schedule_thumbnails
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_review_stats(sender, instance, **kwargs):
+    """
+    This function is a post_save/post_delete signal receiver for the `Review` model.
+    It recomputes the stored rating and review counters of the reviewed `Item`.
+    """
+    update_review_stats(instance.product_id)
+
+
+@receiver(pre_save, sender=Item)
+def fill_search_document(sender, instance, **kwargs):
+    """
+    This function is a pre_save signal receiver for the `Item` model.
+    It rebuilds the stemmed search document from the title and the description.
+    """
+    instance.search_document = build_search_document(instance.title, instance.description)
+
+
+@receiver(post_save, sender=Item)
+def index_item(sender, instance, using, **kwargs):
+    """
+    This function is a post_save signal receiver for the `Item` model.
+    It adds the saved item to the search index of the database it was saved to.
+    """
+    get_search_backend(using).index([instance])
+
+
+@receiver(post_delete, sender=Item)
+def remove_item_from_index(sender, instance, using, **kwargs):
+    """
+    This function is a post_delete signal receiver for the `Item` model.
+    It removes the deleted item from the search index of the database it was deleted from.
+    """
+    get_search_backend(using).remove([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def invalidate_categories(sender, **kwargs):
+    """
+    This function is a post_save/post_delete/node_moved signal receiver for the `Category` model.
+    It bumps the category and catalog versions so that cached category trees and listings are reloaded.
+    """
+    bump_version(CATEGORY_VERSION)
+    bump_version(CATALOG_VERSION)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(m2m_changed, sender=Item.category.through)
+@receiver(post_save, sender=ProductGallery)
+@receiver(post_delete, sender=ProductGallery)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog(sender, **kwargs):
+    """
+    This function is a signal receiver for changes of the `Item` model, its categories, its gallery and its reviews.
+    It bumps the catalog version so that cached item data and the ETags of listings are recomputed.
+    """
+    bump_version(CATALOG_VERSION)
+
+
+@receiver(post_save, sender=ProductGallery)
+@receiver(post_delete, sender=ProductGallery)
+def touch_gallery_item(sender, instance, **kwargs):
+    """
+    This function is a post_save/post_delete signal receiver for the `ProductGallery` model.
+    It bumps the `updated_at` of the item whose gallery changed.
+    """
+    touch_items([instance.product_id])
+
+
+@receiver(user_logged_in)
+def merge_anonymous_basket(sender, request, user, **kwargs):
+    """
+    This function is a user_logged_in signal receiver.
+    It moves the basket collected before signing in into the basket of the user.
+    """
+    if request is not None:
+        merge_basket(request, user)
+
+
+@receiver(pre_save, sender=ProductGallery)
+def reset_thumbnails(sender, instance, **kwargs):
+    """
+    This function is a pre_save signal receiver for the `ProductGallery` model.
+    It marks the thumbnails as missing when the image of an existing gallery entry is replaced.
+    """
+    if instance.pk and instance.has_thumbnails:
+        old_name = ProductGallery.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+        instance.has_thumbnails = old_name == instance.image.name
+
+
+@receiver(post_save, sender=ProductGallery)
+def generate_thumbnails(sender, instance, **kwargs):
+    """
+    This function is a post_save signal receiver for the `ProductGallery` model.
+    It schedules the generation of the thumbnails of a new or replaced image.
+    """
+    if not instance.has_thumbnails and instance.image:
+        schedule_thumbnails(instance)
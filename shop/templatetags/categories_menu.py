@@ -2,16 +2,16 @@
 Import required libraries for categories menu
 """
 from django import template
+from django.utils.safestring import mark_safe
 
-from shop.models import Category
+from shop.categories import get_category_menu_html
 
 register = template.Library()
 
 
-@register.inclusion_tag('categories_menu.html')
+@register.simple_tag
 def show_categories():
     """
-    Returns the categories for display in a menu
+    Returns the rendered categories menu, served from the cache while categories are unchanged
     """
-    categories = Category.objects.all()
-    return {'categories': categories}
+    return mark_safe(get_category_menu_html())
@@ -0,0 +1,35 @@
+"""
+Import required libraries for the responsive images of the product gallery
+"""
+from django import template
+from django.utils.html import format_html
+
+from shop.thumbnails import VARIANTS, get_srcset, get_variant_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(gallery, variant='card', css_class='', alt='', style='', sizes=None, loading='lazy'):
+    """
+    Returns the image of the gallery entry with WebP and JPEG `srcset` of its thumbnails,
+    or the original image while the thumbnails are not generated yet
+    """
+    if gallery is None:
+        return ''
+    if not gallery.has_thumbnails:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" style="{}" loading="{}">',
+            gallery.image.url, css_class, alt, style, loading
+        )
+
+    sizes = sizes or f'{VARIANTS[variant]}px'
+    return format_html(
+        '<picture style="display: contents;">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" style="{}" loading="{}">'
+        '</picture>',
+        get_srcset(gallery, variant, 'webp'), sizes,
+        get_variant_url(gallery, variant, 'jpg'), get_srcset(gallery, variant, 'jpg'), sizes,
+        css_class, alt, style, loading
+    )
@@ -1,3 +1,1306 @@
-from django.test import TestCase
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date
+from decimal import Decimal
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection, connections, transaction, router
+from django.http import HttpResponse, QueryDict
+from django.template import Template, Context
+from django.test import TestCase, TransactionTestCase, SimpleTestCase, AsyncRequestFactory, RequestFactory, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from django_shop.db.middleware import PrimaryPinMiddleware, PIN_COOKIE
+from django_shop.db.pool import ConnectionPool, PoolTimeout
+from django_shop.db.router import selector, use_primary
+from django_shop.metrics import get_registry, collect_metrics, get_empty_stats
+from django_shop.slow_queries import normalize_sql, get_fingerprint, SlowQueryFileHandler
+from shop import async_views
+from shop.management.commands.import_catalog import Command as ImportCatalogCommand
+from shop.filters import get_search_items, get_items_by_filter, SEARCH_SORT, SORT_ORDER
+from shop.models import Item, Category, ProductGallery, Review, Favorite, Cart, CartLine, Purchase, PurchaseLine
+from shop.pagination import paginate_by_cursor, encode_cursor, NEXT, CachedCountPaginator
+from shop.sevices import add_favorites, delete_favorites, get_favorite_ids, check_favorite, reset_favorites_cache, \
+    aadd_favorites, adelete_favorites, aget_favorite_ids
+from shop.views import ProductsList, MAX_STATUS_ITEMS, MAX_BASKET_QUANTITY
+from users.models import CustomUser
+
+# A second connection to the test database stands for a replica, the test runner sets it up as a mirror of default
+connections.settings.setdefault('replica', {
+    **connections.settings['default'], 'TEST': {**connections.settings['default']['TEST'], 'MIRROR': 'default'}
+})
+
+
+class ListingQueryCountTest(TestCase):
+    """
+    The number of queries of the listing pages must not depend on the number of items shown,
+    neither on a cold cache nor on a warm one
+    """
+    max_queries = 10
+    # A cold page also counts the items and loads the page ids, the facets and the category tree and menu
+    max_cold_queries = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_items(self, count):
+        for number in range(count):
+            item = Item.objects.create(
+                title=f'Phone {number}', description='Smartphone', price=100 + number, salesman=self.user
+            )
+            item.category.add(self.category)
+            ProductGallery.objects.create(product=item, image=f'gallery_product/{number}_1.jpg')
+            ProductGallery.objects.create(product=item, image=f'gallery_product/{number}_2.jpg')
+            Review.objects.create(author=self.user, product=item, text='Good', rate=80)
+            Favorite.objects.create(user=self.user, item=item)
+
+    def count_queries(self, url, warm=False, **kwargs):
+        # A cold request loads every cached part of the page, a warm one follows the same request
+        cache.clear()
+        if warm:
+            self.client.get(url, **kwargs)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url, prepare=None):
+        self.client.force_login(self.user)
+        self.create_items(2)
+        if prepare:
+            prepare()
+        few = (self.count_queries(url), self.count_queries(url, warm=True))
+
+        self.create_items(8)
+        if prepare:
+            prepare()
+        many = (self.count_queries(url), self.count_queries(url, warm=True))
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many[0], self.max_cold_queries)
+        self.assertLessEqual(many[1], self.max_queries)
+
+    def fill_basket(self):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartLine.objects.bulk_create(
+            [CartLine(cart=cart, item=item) for item in Item.objects.all()], ignore_conflicts=True
+        )
+
+    def test_products_list(self):
+        self.assert_constant_queries(reverse('product_list'))
+
+    def test_shop_category(self):
+        self.assert_constant_queries(reverse('shop_category', kwargs={'slug': 'phones'}))
+
+    def test_shop_search(self):
+        self.assert_constant_queries(reverse('search') + '?s=Phone')
+
+    def test_shop_favorite(self):
+        self.assert_constant_queries(reverse('favorite'))
+
+    def test_user_basket(self):
+        self.assert_constant_queries(reverse('basket'), prepare=self.fill_basket)
+
+    def test_item_detail(self):
+        self.client.force_login(self.user)
+        self.create_items(1)
+        item = Item.objects.first()
+        url = reverse('item_detail', kwargs={'pk': item.pk})
+        few = (self.count_queries(url), self.count_queries(url, warm=True))
+
+        for number in range(10):
+            author = CustomUser.objects.create_user(f'author{number}@example.com', 'password')
+            Review.objects.create(author=author, product=item, text='Nice', rate=number * 10)
+            ProductGallery.objects.create(product=item, image=f'gallery_product/extra_{number}.jpg')
+        many = (self.count_queries(url), self.count_queries(url, warm=True))
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many[0], self.max_cold_queries)
+        self.assertLessEqual(many[1], self.max_queries)
+
+
+class SearchTest(TransactionTestCase):
+    """
+    The search matches the stems of the words, ranks title matches first and follows the changes of items.
+    The index of MySQL is only updated on commit, so the items are committed
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('salesman@example.com', 'password')
+
+    def create_item(self, title, description=''):
+        return Item.objects.create(title=title, description=description, price=100, salesman=self.user)
+
+    def search(self, query, sort=None):
+        return list(get_search_items(Item.objects.order_by('pk'), query, sort).values_list('title', flat=True))
+
+    def test_stems(self):
+        self.create_item('Смартфоны Acme', 'Быстрая зарядка')
+        self.create_item('Wireless phones', 'Fast charging')
+        self.create_item('Kettle')
+        self.assertEqual(self.search('смартфона'), ['Смартфоны Acme'])
+        self.assertEqual(self.search('зарядкой'), ['Смартфоны Acme'])
+        self.assertEqual(self.search('phone charger'), ['Wireless phones'])
+        self.assertEqual(self.search('laptop'), [])
+
+    def test_relevance(self):
+        self.create_item('Lamp', 'Desk lamp with a wireless charger')
+        self.create_item('Wireless charger', 'Black')
+        response = self.client.get(reverse('search'), {'s': 'charger', 'sort': SEARCH_SORT})
+        self.assertEqual([item.title for item in response.context['products']], ['Wireless charger', 'Lamp'])
+
+    def test_index_follows_items(self):
+        item = self.create_item('Phone')
+        item.title = 'Tablet'
+        item.save()
+        self.assertEqual((self.search('phone'), self.search('tablet')), ([], ['Tablet']))
+
+        pk = item.pk
+        item.delete()
+        Item.objects.bulk_create([Item(pk=pk, title='Lamp', price=1, salesman=self.user)])
+        self.assertEqual(self.search('tablet'), [])
+
+    def test_rebuild(self):
+        item = self.create_item('Phone')
+        Item.objects.filter(pk=item.pk).update(title='Tablet')
+        self.assertEqual(self.search('tablet'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual((self.search('phone'), self.search('tablet')), ([], ['Tablet']))
+
+    @override_settings(SHOP_SEARCH_BACKEND='shop.search.SimpleSearchBackend')
+    def test_like_fallback(self):
+        self.create_item('Wireless phones')
+        self.create_item('Смартфоны')
+        self.assertEqual(self.search('phone wireless'), ['Wireless phones'])
+        self.assertEqual(self.search('смартфонов'), ['Смартфоны'])
+        self.assertEqual(self.search('?!'), [])
+
+
+class CategorySubtreeTest(TestCase):
+    """
+    A category lists the items of all its descendant categories
+    """
+
+    def test_descendants(self):
+        user = CustomUser.objects.create_user('salesman@example.com', 'password')
+        electronics = Category.objects.create(name='Electronics', slug='electronics')
+        phones = Category.objects.create(name='Phones', slug='phones', parent=electronics)
+        cases = Category.objects.create(name='Cases', slug='cases', parent=phones)
+        kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+        for title, category in [('Laptop', electronics), ('Phone', phones), ('Case', cases), ('Kettle', kitchen)]:
+            Item.objects.create(title=title, description=title, price=100, salesman=user).category.add(category)
+
+        def titles(slug):
+            response = self.client.get(reverse('shop_category', kwargs={'slug': slug}))
+            return sorted(item.title for item in response.context['products'])
+
+        self.assertEqual(titles('electronics'), ['Case', 'Laptop', 'Phone'])
+        self.assertEqual(titles('phones'), ['Case', 'Phone'])
+        self.assertEqual(titles('cases'), ['Case'])
+        self.assertEqual(titles('unknown'), [])
+
+        # Large subtrees are filtered by their MPTT interval instead of the list of ids
+        cache.clear()
+        with mock.patch('shop.filters.MAX_CATEGORY_IDS', 1):
+            self.assertEqual(titles('electronics'), ['Case', 'Laptop', 'Phone'])
+
+
+class CategoryMenuQueryCountTest(TestCase):
+    """
+    The categories menu must be served from the cache while categories are unchanged
+    """
+
+    def test_warm_menu_without_queries(self):
+        root = Category.objects.create(name='Electronics', slug='electronics')
+        Category.objects.create(name='Phones', slug='phones', parent=root)
+        template = Template('{% load categories_menu %}{% show_categories %}')
+        html = template.render(Context())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(template.render(Context()), html)
+
+        Category.objects.create(name='Laptops', slug='laptops', parent=root)
+        self.assertIn('/laptops', template.render(Context()))
+
+
+class CursorPaginationTest(TestCase):
+    """
+    Cursor pages walk every listing order forwards and backwards without skipping or repeating items,
+    also when items share the value of the sort key
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user('salesman@example.com', 'password')
+        values = [(100, 1, 2, 4.5), (100, 1, 2, 4.5), (200, 0, 5, 3.0), (200, 3, 0, 3.0), (200, 3, 5, 0.0),
+                  (50, 0, 0, 0.0), (300, 1, 2, 4.5)]
+        for number, (price, purchases, reviews, rating) in enumerate(values):
+            item = Item.objects.create(title=f'Item {number}', description='Item', price=price, salesman=user)
+            Item.objects.filter(pk=item.pk).update(purchase_count=purchases, review_count=reviews, rating_avg=rating)
+
+    def walk(self, queryset, page_size=2):
+        pages = [paginate_by_cursor(queryset, page_size)]
+        while pages[-1].has_next():
+            pages.append(paginate_by_cursor(queryset, page_size, pages[-1].next_cursor))
+        forward = [[item.pk for item in page] for page in pages]
+
+        backward = [[item.pk for item in pages[-1]]]
+        page = pages[-1]
+        while page.has_previous():
+            page = paginate_by_cursor(queryset, page_size, page.previous_cursor)
+            backward.insert(0, [item.pk for item in page])
+        return forward, backward
+
+    def test_every_sort_order(self):
+        for sort, ordering in SORT_ORDER.items():
+            with self.subTest(sort=sort):
+                queryset = get_items_by_filter({'sort': sort})
+                expected = list(Item.objects.order_by(ordering, 'pk').values_list('pk', flat=True))
+                forward, backward = self.walk(queryset)
+                self.assertEqual(forward, [expected[index:index + 2] for index in range(0, len(expected), 2)])
+                self.assertEqual(backward, forward)
+
+    def test_malformed_cursor(self):
+        queryset = get_items_by_filter({'sort': '1'})
+        first = [item.pk for item in paginate_by_cursor(queryset, 2)]
+        for cursor in ['garbage', encode_cursor([1], 'x'), encode_cursor([1, 2, 3], NEXT)]:
+            self.assertEqual([item.pk for item in paginate_by_cursor(queryset, 2, cursor)], first)
+
+    @override_settings(SHOP_CURSOR_PAGINATION=True)
+    @mock.patch.object(ProductsList, 'paginate_by', 3)
+    def test_listing_view(self):
+        expected = list(Item.objects.order_by('-purchase_count', 'pk').values_list('pk', flat=True))
+        response = self.client.get(reverse('product_list'), {'sort': '3'})
+        page = response.context['page_obj']
+        self.assertEqual([item.pk for item in page], expected[:3])
+        self.assertFalse(page.has_previous())
+        self.assertContains(response, f'?cursor={page.next_cursor}&amp;sort=3')
+
+        response = self.client.get(reverse('product_list'), {'sort': '3', 'cursor': page.next_cursor})
+        self.assertEqual([item.pk for item in response.context['products']], expected[3:6])
+
+
+class CachedCountTest(TestCase):
+    """
+    Listing counts are cached per filter until the catalog changes, and large results show the estimate
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('salesman@example.com', 'password')
+        for number in range(3):
+            Item.objects.create(title=f'Phone {number}', description='Phone', price=100, salesman=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_paginator(self, key='phones'):
+        return CachedCountPaginator(Item.objects.order_by('pk'), 2, count_key=key)
+
+    def test_hits_and_invalidation(self):
+        self.assertEqual(self.get_paginator().count, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_paginator().count, 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_paginator('laptops').count, 3)
+
+        Item.objects.create(title='Phone 3', description='Phone', price=100, salesman=self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_paginator().count, 4)
+        self.assertFalse(self.get_paginator().is_approximate)
+
+    @override_settings(SHOP_APPROXIMATE_COUNT_THRESHOLD=1000)
+    def test_approximate(self):
+        with mock.patch('shop.pagination.estimate_count', return_value=250000) as estimate:
+            paginator = self.get_paginator()
+            self.assertEqual((paginator.count, paginator.is_approximate), (250000, True))
+            self.assertEqual(self.get_paginator().count, 250000)
+        self.assertEqual(estimate.call_count, 1)
+
+        with mock.patch('shop.pagination.estimate_count', return_value=250000):
+            response = self.client.get(reverse('product_list'))
+        self.assertTrue(response.context['paginator'].is_approximate)
+        self.assertContains(response, 'Найдено около 250000')
+
+        with mock.patch('shop.pagination.estimate_count', return_value=500):
+            paginator = self.get_paginator('small')
+            self.assertEqual((paginator.count, paginator.is_approximate), (3, False))
+
+
+class FacetsTest(TestCase):
+    """
+    Facets count the items matching the category and search filters by price bucket and child category
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user('salesman@example.com', 'password')
+        electronics = Category.objects.create(name='Electronics', slug='electronics')
+        phones = Category.objects.create(name='Phones', slug='phones', parent=electronics)
+        cases = Category.objects.create(name='Cases', slug='cases', parent=phones)
+        laptops = Category.objects.create(name='Laptops', slug='laptops', parent=electronics)
+        kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+        for title, price, categories in [
+            ('Phone', 700, [phones]), ('Phone case', 20, [cases, phones]), ('Laptop', 60000, [laptops]),
+            ('Laptop phone stand', 3000, [laptops, cases]), ('Kettle', 2000, [kitchen]),
+        ]:
+            item = Item.objects.create(title=title, description=title, price=price, salesman=user)
+            item.category.add(*categories)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_facets(self, **params):
+        return self.client.get(reverse('facets'), params).json()['facets']
+
+    def get_counts(self, facets):
+        return {
+            'categories': {facet['slug']: facet['count'] for facet in facets['categories']},
+            'prices': [bucket['count'] for bucket in facets['histogram']],
+            'range': (Decimal(facets['min_price']), Decimal(facets['max_price'])),
+        }
+
+    def test_category(self):
+        self.assertEqual(self.get_counts(self.get_facets(category='electronics')), {
+            'categories': {'phones': 3, 'laptops': 2},
+            'prices': [2, 1, 0, 0, 0, 1, 0],
+            'range': (20, 60000),
+        })
+        self.assertEqual(self.get_counts(self.get_facets())['categories'], {'electronics': 4, 'kitchen': 1})
+
+    def test_category_and_search(self):
+        self.assertEqual(self.get_counts(self.get_facets(category='electronics', s='phone')), {
+            'categories': {'phones': 3, 'laptops': 1},
+            'prices': [2, 1, 0, 0, 0, 0, 0],
+            'range': (20, 3000),
+        })
+        self.assertEqual(self.get_counts(self.get_facets(category='phones', s='laptop')), {
+            'categories': {'cases': 1},
+            'prices': [0, 1, 0, 0, 0, 0, 0],
+            'range': (3000, 3000),
+        })
+
+    def test_listing_context(self):
+        response = self.client.get(reverse('shop_category', kwargs={'slug': 'phones'}))
+        self.assertEqual(self.get_counts(response.context['facets'])['categories'], {'cases': 2})
+        self.assertEqual(response.context['form'].fields['max_price'].widget.attrs['placeholder'], 3000)
+
+    def test_price_links(self):
+        user = CustomUser.objects.get(email='salesman@example.com')
+        Item.objects.create(title='Toaster', description='Toaster', price=1000, salesman=user)
+        Item.objects.create(title='Mixer', description='Mixer', price=Decimal('999.99'), salesman=user)
+        response = self.client.get(reverse('product_list'), {'sort': '2', 'page': '1'})
+        links = response.context['price_links']
+        self.assertEqual([bucket['count'] for bucket in links], [3, 3, 1])
+        for bucket in links:
+            params = QueryDict(bucket['query'])
+            self.assertEqual(params['sort'], '2')
+            self.assertNotIn('page', params)
+            listing = self.client.get(f"{reverse('product_list')}?{bucket['query']}")
+            self.assertEqual(len(listing.context['products']), bucket['count'])
+
+
+class ListingPageCacheTest(TestCase):
+    """
+    The cached ids of listing pages follow the counters that queryset updates change
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        cls.phone = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=cls.user)
+        cls.laptop = Item.objects.create(title='Laptop', description='Notebook', price=500, salesman=cls.user)
+        Item.objects.filter(pk=cls.phone.pk).update(purchase_count=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_popular(self):
+        response = self.client.get(reverse('product_list'), {'sort': '3'})
+        return [item.pk for item in response.context['products']]
+
+    def test_purchase_reorders_popular(self):
+        self.assertEqual(self.get_popular(), [self.phone.pk, self.laptop.pk])
+
+        for _ in range(2):
+            self.client.post(reverse('add_to_basket'), {'item': self.laptop.pk})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('basket'), {'is_delivery': False, 'email': 'buyer@example.com'})
+        self.assertEqual(self.get_popular(), [self.laptop.pk, self.phone.pk])
+
+    def test_recomputed_stats_reorder_popular(self):
+        self.assertEqual(self.get_popular(), [self.phone.pk, self.laptop.pk])
+
+        purchase = Purchase.objects.create(is_delivery=False, email='buyer@example.com', total_price=500)
+        purchase.item.add(self.laptop)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recompute_item_stats', stdout=StringIO())
+        self.assertEqual(self.get_popular(), [self.laptop.pk, self.phone.pk])
+
+
+class ItemsStatusTest(TestCase):
+    """
+    The status endpoint tells which of the listed items are in the basket and the favorites, for at most 100 ids
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        cls.phone, cls.laptop, cls.kettle = [
+            Item.objects.create(title=title, description=title, price=100, salesman=cls.user)
+            for title in ('Phone', 'Laptop', 'Kettle')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def get_status(self, ids):
+        response = self.client.get(reverse('items_status'), {'ids': ','.join(str(item_id) for item_id in ids)})
+        self.assertEqual(response.status_code, 200)
+        return {int(item_id): status for item_id, status in response.json()['items'].items()}
+
+    def test_membership(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_basket'), {'item': self.phone.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_favorite'), {'item': [self.phone.pk, self.laptop.pk]})
+
+        self.assertEqual(self.get_status([self.phone.pk, self.laptop.pk, self.kettle.pk, 0]), {
+            self.phone.pk: {'in_basket': True, 'is_favorite': True},
+            self.laptop.pk: {'in_basket': False, 'is_favorite': True},
+            self.kettle.pk: {'in_basket': False, 'is_favorite': False},
+            0: {'in_basket': False, 'is_favorite': False},
+        })
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.context['basket_ids'], {self.phone.pk})
+        self.assertEqual(response.context['favorite_ids'], {self.phone.pk, self.laptop.pk})
+
+        self.client.logout()
+        self.assertEqual(self.get_status([self.phone.pk]), {self.phone.pk: {'in_basket': False, 'is_favorite': False}})
+
+    def test_limit_and_errors(self):
+        ids = list(range(1, 151))
+        self.assertEqual(list(self.get_status(ids)), ids[:MAX_STATUS_ITEMS])
+        self.assertEqual(self.client.get(reverse('items_status'), {'ids': '1,a'}).status_code, 400)
+        self.assertEqual(self.get_status([]), {})
+
+
+class FavoritesTest(TestCase):
+    """
+    Favorite ids are cached per user under a version that every write bumps
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        cls.phone, cls.laptop = [
+            Item.objects.create(title=title, description=title, price=100, salesman=cls.user)
+            for title in ('Phone', 'Laptop')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_double_add(self):
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(add_favorites([self.phone.pk, self.phone.pk], self.user.pk), {self.phone.pk})
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(get_favorite_ids(self.user.pk), {self.phone.pk})
+
+    def test_cache(self):
+        self.assertFalse(check_favorite(self.phone.pk, self.user.pk))
+        with self.assertNumQueries(0):
+            self.assertFalse(check_favorite(self.phone.pk, self.user.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_favorites([self.phone.pk], self.user.pk)
+        self.assertTrue(check_favorite(self.phone.pk, self.user.pk))
+
+        # Rows written outside the services are read once the cache is reset
+        Favorite.objects.create(user=self.user, item=self.laptop)
+        self.assertEqual(get_favorite_ids(self.user.pk), {self.phone.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            reset_favorites_cache(self.user.pk)
+        self.assertEqual(get_favorite_ids(self.user.pk), {self.phone.pk, self.laptop.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(delete_favorites([self.phone.pk], self.user.pk), {self.laptop.pk})
+        self.assertEqual(get_favorite_ids(self.user.pk), {self.laptop.pk})
+
+    async def test_async_double_add(self):
+        for _ in range(2):
+            self.assertEqual(await aadd_favorites([self.phone.pk], self.user.pk), {self.phone.pk})
+        self.assertEqual(await Favorite.objects.filter(user=self.user).acount(), 1)
+        self.assertEqual(await aget_favorite_ids(self.user.pk), {self.phone.pk})
+        self.assertEqual(await adelete_favorites([self.phone.pk], self.user.pk), set())
+        self.assertEqual(await aget_favorite_ids(self.user.pk), set())
+
+
+class BasketTest(TestCase):
+    """
+    The basket keeps quantities and follows the user after signing in
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        cls.phone = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=cls.user)
+        cls.laptop = Item.objects.create(title='Laptop', description='Notebook', price=500, salesman=cls.user)
+
+    def add(self, item, times=1):
+        for _ in range(times):
+            self.client.post(reverse('add_to_basket'), {'item': item.pk})
+
+    def test_quantities_and_total(self):
+        self.add(self.phone, times=3)
+        self.add(self.laptop)
+        response = self.client.get(reverse('basket'))
+        self.assertEqual([line.quantity for line in response.context['lines']], [3, 1])
+        self.assertEqual(response.context['total_price'], 800)
+
+        self.client.post(reverse('update_basket_quantity'), {'item': self.phone.pk, 'quantity': 0})
+        self.assertEqual(self.client.get(reverse('basket')).context['total_price'], 500)
+
+    def test_merge_on_sign_in(self):
+        cart = Cart.objects.create(user=self.user)
+        CartLine.objects.create(cart=cart, item=self.phone, quantity=2)
+        self.add(self.phone)
+        self.add(self.laptop)
+
+        self.client.post(reverse('signin'), {'username': 'buyer@example.com', 'password': 'password'})
+        lines = CartLine.objects.filter(cart__user=self.user).values_list('item_id', 'quantity')
+        self.assertEqual(dict(lines), {self.phone.pk: 3, self.laptop.pk: 1})
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def checkout(self):
+        data = {'is_delivery': False, 'email': 'buyer@example.com'}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('basket'), data)
+        self.assertEqual(response.status_code, 302)
+        return len(context.captured_queries)
+
+    def test_checkout_queries(self):
+        self.add(self.phone)
+        few = self.checkout()
+
+        for number in range(5):
+            self.add(Item.objects.create(title=f'Tablet {number}', price=50, description='Tablet', salesman=self.user))
+        self.add(self.phone, times=2)
+        many = self.checkout()
+        self.assertEqual(few, many)
+
+        purchase = Purchase.objects.first()
+        self.assertEqual(purchase.total_price, 450)
+        self.assertEqual(purchase.lines.get(item=self.phone).quantity, 2)
+        self.assertFalse(CartLine.objects.exists())
+
+        Item.objects.filter(pk=self.phone.pk).update(title='Old phone', price=1)
+        self.assertEqual(purchase.lines.get(item=self.phone).unit_price, 100)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('add_to_basket')).status_code, 405)
+        self.assertEqual(self.client.post(reverse('add_to_basket'), {'item': 'x'}).status_code, 400)
+        response = self.client.post(reverse('add_to_basket'), {'item': 0})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+        self.assertFalse(Cart.objects.exists())
+
+        self.add(self.phone)
+        for data in ({'item': self.phone.pk, 'quantity': 'x'}, {'item': self.phone.pk}, {'quantity': 2},
+                     {'item': self.phone.pk, 'quantity': MAX_BASKET_QUANTITY + 1}):
+            self.assertEqual(self.client.post(reverse('update_basket_quantity'), data).status_code, 400)
+        self.assertEqual(self.client.post(reverse('delete_from_basket'), {}).status_code, 400)
+        self.assertEqual(CartLine.objects.get().quantity, 1)
+
+    def test_empty_basket(self):
+        self.checkout()
+        self.assertFalse(Purchase.objects.exists())
+        messages = [str(message) for message in self.client.get(reverse('basket')).context['messages']]
+        self.assertEqual(messages, ['Корзина пуста'])
+
+
+class ItemReviewsTest(TestCase):
+    """
+    Reviews of an item are served in pages and summarized by the stored histogram
+    """
+
+    def test_pages_and_histogram(self):
+        user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        item = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=user)
+        for number in range(25):
+            Review.objects.create(author=user, product=item, text=f'Review {number}', rate=number * 4)
+
+        response = self.client.get(reverse('item_detail', kwargs={'pk': item.pk}))
+        reviews = response.context['reviews']
+        self.assertEqual(len(reviews), 20)
+
+        data = self.client.get(reverse('item_reviews', kwargs={'pk': item.pk}), {'cursor': reviews.next_cursor}).json()
+        self.assertEqual([review['text'] for review in data['reviews']], [f'Review {number}' for number in range(20, 25)])
+        self.assertIsNone(data['next_cursor'])
+
+        item.refresh_from_db()
+        self.assertEqual(item.rating_histogram, [5, 5, 5, 5, 5])
+
+
+class ItemStatsTest(TestCase):
+    """
+    The stored rating and review counters of an item follow its reviews and are repaired by recompute_item_stats
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        cls.item = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=cls.user)
+
+    def assert_stats(self, rating_avg, count):
+        self.item.refresh_from_db()
+        self.assertAlmostEqual(self.item.rating_avg, rating_avg)
+        self.assertEqual((self.item.rating_count, self.item.review_count), (count, count))
+
+    def test_review_signals(self):
+        first = Review.objects.create(author=self.user, product=self.item, text='Good', rate=80)
+        self.assert_stats(80, 1)
+        second = Review.objects.create(author=self.user, product=self.item, text='Bad', rate=20)
+        self.assert_stats(50, 2)
+
+        second.rate = 60
+        second.save()
+        self.assert_stats(70, 2)
+
+        first.delete()
+        self.assert_stats(60, 1)
+        second.delete()
+        self.assert_stats(0, 0)
+
+    def test_recompute(self):
+        Review.objects.create(author=self.user, product=self.item, text='Good', rate=90)
+        Review.objects.create(author=self.user, product=self.item, text='Fine', rate=50)
+        other = Item.objects.create(title='Laptop', description='Notebook', price=500, salesman=self.user)
+        # Queryset updates send no signals, so the counters drift until they are recomputed
+        Item.objects.update(rating_avg=0, rating_count=0, review_count=0)
+
+        call_command('recompute_item_stats', batch_size=1, stdout=StringIO())
+        self.assert_stats(70, 2)
+        other.refresh_from_db()
+        self.assertEqual((other.rating_avg, other.rating_count, other.review_count), (0, 0, 0))
+
+
+class AsyncBasketViewsTest(TestCase):
+    """
+    The async basket endpoints share the cart with the sync views
+    """
+
+    async def test_add_and_check(self):
+        user = await CustomUser.objects.acreate(email='buyer@example.com')
+        item = await Item.objects.acreate(title='Phone', description='Smartphone', price=100, salesman=user)
+        factory = AsyncRequestFactory()
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+
+        def make_request(method, path, data=None):
+            if method == 'post':
+                request = factory.post(path, urlencode(data), content_type='application/x-www-form-urlencoded')
+            else:
+                request = factory.get(path)
+            request.session = session
+            request.user = AnonymousUser()
+            return request
+
+        await async_views.add_to_basket_view(make_request('post', '/', {'item': item.pk}))
+        await async_views.add_to_basket_view(make_request('post', '/', {'item': item.pk}))
+        response = await async_views.check_basket_view(make_request('get', '/'), item.pk)
+        self.assertJSONEqual(response.content, {'in_basket': True})
+        self.assertEqual((await CartLine.objects.aget(item=item)).quantity, 2)
+
+        await async_views.delete_from_basket_view(make_request('post', '/', {'item': item.pk}))
+        response = await async_views.check_basket_view(make_request('get', '/'), item.pk)
+        self.assertJSONEqual(response.content, {'in_basket': False})
+
+        response = await async_views.add_to_basket_view(make_request('post', '/', {'item': 0}))
+        self.assertEqual(response.status_code, 404)
+        response = await async_views.add_to_basket_view(make_request('get', '/'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(await Cart.objects.acount(), 1)
+
+
+class ThumbnailsTest(TestCase):
+    """
+    Uploaded gallery images get WebP and JPEG thumbnails that the templates reference through srcset
+    """
+
+    def test_generate_and_render(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        item = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=user)
+
+        uploads = []
+        for name, size, image_format in (('phone.jpg', (2000, 1000), 'JPEG'), ('phone.png', (1000, 1000), 'PNG')):
+            with tempfile.SpooledTemporaryFile() as file:
+                Image.new('RGB', size, 'red').save(file, image_format)
+                file.seek(0)
+                uploads.append(SimpleUploadedFile(name, file.read()))
+
+        with override_settings(MEDIA_ROOT=media_root, SHOP_THUMBNAIL_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                gallery, square = [ProductGallery.objects.create(product=item, image=upload) for upload in uploads]
+            gallery.refresh_from_db()
+            self.assertTrue(gallery.has_thumbnails)
+
+            # Images differing only by their extension get their own thumbnails
+            for entry, size in ((gallery, (300, 150)), (square, (300, 300))):
+                with Image.open(os.path.join(media_root, 'thumbnails', 'card', f'{entry.image.name}.webp')) as card:
+                    self.assertEqual(card.size, size)
+
+            name = gallery.image.name
+
+            html = Template("{% load gallery_images %}{% responsive_image gallery 'card' %}").render(
+                Context({'gallery': gallery})
+            )
+            self.assertIn(f'/media/thumbnails/card/{name}.webp 300w', html)
+            self.assertIn(f'/media/thumbnails/detail/{name}.jpg 800w', html)
+
+
+class ConditionalGetTest(TestCase):
+    """
+    Unchanged catalog pages are answered with 304 Not Modified without querying the items
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        cls.item = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_revalidation(self, url, change):
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        item_queries = [query for query in context.captured_queries if 'shop_item' in query['sql']]
+        self.assertLessEqual(len(item_queries), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_listing(self):
+        self.assert_revalidation(reverse('product_list'), lambda: Item.objects.create(
+            title='Laptop', description='Notebook', price=500, salesman=self.user
+        ))
+
+    def purchase(self):
+        buyer = self.client_class()
+        buyer.post(reverse('add_to_basket'), {'item': self.item.pk})
+        response = buyer.post(reverse('basket'), {'is_delivery': False, 'email': 'buyer@example.com'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_listing_after_purchase(self):
+        # The purchase updates the sort columns with a queryset update, which sends no signal
+        self.assert_revalidation(f"{reverse('product_list')}?sort=3", self.purchase)
+
+    def test_purchase_keeps_other_listings(self):
+        etag = self.client.get(reverse('product_list'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.purchase()
+        self.assertEqual(self.client.get(reverse('product_list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_item_detail(self):
+        self.assert_revalidation(reverse('item_detail', kwargs={'pk': self.item.pk}), lambda: Review.objects.create(
+            author=self.user, product=self.item, text='Good', rate=80
+        ))
+
+    def test_no_last_modified(self):
+        # The pages show the basket and the favorites, so only the ETag revalidates them
+        self.client.force_login(self.user)
+        url = reverse('item_detail', kwargs={'pk': self.item.pk})
+        self.assertNotIn('Last-Modified', self.client.get(url))
+        self.client.post(reverse('add_to_basket'), {'item': self.item.pk})
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['basket_ids'], {self.item.pk})
+
+    def test_user_state(self):
+        self.client.force_login(self.user)
+        self.assert_revalidation(reverse('product_list'), lambda: self.client.post(
+            reverse('add_favorite'), {'item': self.item.pk}
+        ))
+
+
+class ConnectionPoolTest(TestCase):
+    """
+    The connection pool reuses released connections, waits when full and replaces broken ones
+    """
+
+    def make_pool(self, **kwargs):
+        self.closed = []
+        self.broken = set()
+
+        def check(connection):
+            if connection in self.broken:
+                raise ConnectionError(connection)
+
+        options = {'size': 2, 'timeout': 0.05, 'health_check_interval': 0, 'max_age': 3600, **kwargs}
+        return ConnectionPool(
+            connect=lambda params: object(), close=self.closed.append, check=check, **options
+        )
+
+    def test_reuse_wait_and_reconnect(self):
+        pool = self.make_pool()
+        first = pool.checkout({})
+        second = pool.checkout({})
+        with self.assertRaises(PoolTimeout):
+            pool.checkout({})
+
+        pool.checkin(first)
+        self.assertIs(pool.checkout({}), first)
+        pool.checkin(first)
+
+        self.broken.add(first.connection)
+        replaced = pool.checkout({})
+        self.assertIsNot(replaced, first)
+        self.assertEqual(self.closed, [first.connection])
+
+        pool.checkin(second, reusable=False)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['reconnects'], stats['waits'], stats['timeouts']), (3, 1, 1, 1))
+        self.assertEqual((stats['in_use'], stats['idle'], stats['discarded']), (1, 0, 1))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class DatabaseRouterTest(SimpleTestCase):
+    """
+    Catalog reads are spread over the replicas unless the reads have to see the latest writes
+    """
+
+    def setUp(self):
+        selector.latencies.clear()
+
+    def test_catalog_reads_on_replicas(self):
+        aliases = {Item.objects.all().db for _ in range(4)} | {Review.objects.all().db for _ in range(4)}
+        self.assertEqual(aliases, {'replica_1', 'replica_2'})
+        self.assertEqual(Purchase.objects.all().db, 'default')
+        self.assertEqual(CartLine.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICA_SELECTION='least_latency')
+    def test_least_latency(self):
+        selector.record('replica_1', 0.02)
+        selector.record('replica_2', 0.005)
+        self.assertEqual(Item.objects.all().db, 'replica_2')
+        selector.record('replica_2', 0.2)
+        self.assertEqual(Item.objects.all().db, 'replica_1')
+
+    def test_writes_and_transactions_on_primary(self):
+        self.assertEqual(router.db_for_write(Item), 'default')
+        with use_primary():
+            self.assertEqual(Item.objects.all().db, 'default')
+
+    def test_pin_cookie(self):
+        seen = []
+        middleware = PrimaryPinMiddleware(lambda request: seen.append(Item.objects.all().db) or HttpResponse())
+        factory = RequestFactory()
+        middleware(factory.get('/'))
+        factory.cookies[PIN_COOKIE] = '9999999999'
+        middleware(factory.get('/'))
+        self.assertNotEqual(seen[0], 'default')
+        self.assertEqual(seen[1], 'default')
+
+
+class PrimaryPinTest(TestCase):
+    """
+    A request that writes pins the following reads of the user to the primary
+    """
+
+    def test_write_sets_pin(self):
+        user = CustomUser.objects.create_user('reader@example.com', 'password')
+        item = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=user)
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('check_favorite', kwargs={'item_pk': item.pk}))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response = self.client.post(reverse('add_favorite'), {'item': item.pk})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        with transaction.atomic(), override_settings(DATABASE_REPLICAS=['replica_1']):
+            self.assertEqual(Item.objects.all().db, 'default')
+
+    def test_basket_does_not_pin(self):
+        item = Item.objects.create(
+            title='Phone', description='Smartphone', price=100,
+            salesman=CustomUser.objects.create_user('seller@example.com', 'password')
+        )
+        response = self.client.post(reverse('add_to_basket'), {'item': item.pk})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaReadsTest(TransactionTestCase):
+    """
+    With a second connection mirroring the test database, catalog reads hit the replica until the user writes
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+        self.item = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=self.user)
+
+    def get_item_queries(self, url, table='shop_item'):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            len([query for query in context.captured_queries if table in query['sql']])
+            for context in (primary, replica)
+        ]
+
+    def test_reads_and_pinning(self):
+        # The counts, page ids, facets and category menu cached under the versions are built on the primary
+        primary, replica = self.get_item_queries(reverse('product_list'))
+        self.assertGreater(primary, 0)
+        Category.objects.create(name='Phones', slug='phones')
+        primary, replica = self.get_item_queries(reverse('product_list'), 'shop_category')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        primary, replica = self.get_item_queries(reverse('product_list'))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+        # Signing in writes the session and the last login, which the replicated reads do not depend on
+        response = self.client.post(reverse('signin'), {'username': 'buyer@example.com', 'password': 'password'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response = self.client.post(reverse('add_to_basket'), {'item': self.item.pk})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.get_item_queries(reverse('product_list'))[0], 0)
+
+        response = self.client.post(reverse('add_favorite'), {'item': self.item.pk})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        primary, replica = self.get_item_queries(reverse('favorite'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+
+class MetricsTest(TestCase):
+    """
+    The requests are counted by view with their SQL queries, and the metrics of all processes are summed
+    """
+
+    def get_stats(self, view):
+        return get_registry().snapshot().get(view, get_empty_stats())
+
+    def test_view_metrics(self):
+        before = self.get_stats('product_list')
+        self.client.get(reverse('product_list'))
+        after = self.get_stats('product_list')
+        self.assertEqual(after['count'], before['count'] + 1)
+        self.assertGreater(after['queries'], before['queries'])
+        self.assertEqual(after['statuses']['200'], before['statuses'].get('200', 0) + 1)
+
+        # Requests from loopback are not trusted unless the address is listed
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(SHOP_METRICS_ALLOWED_IPS=['127.0.0.1']):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'shop_request_duration_seconds_count{{view="product_list"}} {after["count"]}',
+                      response.content.decode())
+        staff = CustomUser.objects.create_user('staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_metrics_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = {**get_empty_stats(), 'count': 3, 'queries': 12, 'statuses': {'200': 3}}
+        with open(os.path.join(directory, '1.json'), 'w') as file:
+            json.dump({'product_list': other}, file)
+
+        with override_settings(SHOP_METRICS_DIR=directory):
+            own = self.get_stats('product_list')
+            totals = collect_metrics()
+        self.assertEqual(totals['product_list']['count'], own['count'] + 3)
+        self.assertEqual(totals['product_list']['queries'], own['queries'] + 12)
+        self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+
+
+class SlowQueryLogTest(TestCase):
+    """
+    Slow queries are logged with their view, call site, fingerprint and plan, and ranked by the report
+    """
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize_sql("SELECT *  FROM t WHERE a = 'x' AND b IN (%s, %s, %s) AND c > 10"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c > ?'
+        )
+        self.assertEqual(get_fingerprint('SELECT 1 FROM t WHERE id IN (%s)'),
+                         get_fingerprint('SELECT 2 FROM t WHERE id IN (%s, %s)'))
+
+    def setUp(self):
+        # Every query of the test is slow, the log goes to a temporary directory instead of logs/
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.log_path = os.path.join(directory, 'logs', 'slow_queries.jsonl')
+        handler = SlowQueryFileHandler(self.log_path, delay=True)
+        self.addCleanup(handler.close)
+        patcher = mock.patch.object(logging.getLogger('shop.slow_queries'), 'handlers', [handler])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = directory
+
+    @override_settings(SHOP_SLOW_QUERY_MS=1e-9)
+    def test_log_and_report(self):
+        user = CustomUser.objects.create_user('slow@example.com', 'password')
+        Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=user)
+        with self.assertLogs('shop.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('product_list'))
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        selects = [record for record in records if record['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        self.assertTrue(all(record['view'] == 'product_list' for record in records))
+        self.assertTrue(all(record['frame'] for record in selects))
+        self.assertTrue(all(record['explain'] for record in selects))
+        with open(self.log_path) as file:
+            self.assertTrue(any(json.loads(line)['sql'].startswith('INSERT') for line in file))
+
+        path = os.path.join(self.directory, 'slow_queries.jsonl')
+        with open(path, 'w') as file:
+            for duration, sql in [(5, 'SELECT 1 FROM a'), (300, 'SELECT 1 FROM b'), (7, 'SELECT 2 FROM a')]:
+                file.write(json.dumps({'duration_ms': duration, 'sql': normalize_sql(sql), 'view': 'search',
+                                       'frame': 'shop/filters.py:1 in f', 'fingerprint': get_fingerprint(sql)}) + '\n')
+        output = StringIO()
+        call_command('slow_query_report', path=path, json=True, stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual([(row['sql'], row['count'], row['total_ms']) for row in report],
+                         [('SELECT ? FROM b', 1, 300), ('SELECT ? FROM a', 2, 12)])
+
+
+class CatalogBenchmarkTest(TestCase):
+    """
+    The generated catalog is consistent and the benchmark reports every requested scenario
+    """
+
+    def test_generate_and_bench(self):
+        call_command(
+            'generate_catalog', users=20, categories=15, depth=3, items=50, reviews=200, purchases=30,
+            favorites=40, stdout=StringIO(), stderr=StringIO()
+        )
+        self.assertEqual(Item.objects.count(), 50)
+        self.assertEqual(Category.objects.filter(parent=None).count(), 2)
+        self.assertEqual(Category.objects.order_by('-level').values_list('level', flat=True).first(), 2)
+        self.assertEqual(sum(Item.objects.values_list('review_count', flat=True)), 200)
+        purchase = Purchase.objects.prefetch_related('lines').first()
+        self.assertEqual(purchase.total_price, sum(line.total_price for line in purchase.lines.all()))
+
+        output = StringIO()
+        call_command(
+            'bench_shop', requests=3, warmup=1, scenario=['product_list', 'item_detail', 'checkout'],
+            stdout=output, stderr=StringIO()
+        )
+        report = json.loads(output.getvalue())
+        self.assertEqual(list(report['scenarios']), ['product_list', 'item_detail', 'checkout'])
+        self.assertTrue(all(scenario['errors'] == 0 for scenario in report['scenarios'].values()))
+        self.assertEqual(report['scenarios']['checkout']['runs'], 3)
+
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that does not log the requests to stderr
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ImportCatalogTest(TestCase):
+    """
+    The import upserts items by SKU with their categories and images and resumes after its checkpoint
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        CustomUser.objects.create_user('supplier@example.com', 'password')
+        image = os.path.join(self.directory, 'phone.jpg')
+        Image.new('RGB', (40, 30), 'red').save(image)
+
+        # The images are served over HTTP from the temporary directory
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietRequestHandler, directory=self.directory))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+
+        self.rows = [
+            {'sku': 'A-1', 'title': 'Phone', 'price': '100.50', 'categories': 'electronics/phones',
+             'images': f'http://{host}:{port}/phone.jpg'},
+            {'sku': 'A-2', 'title': 'Laptop', 'price': '900', 'categories': ['electronics/laptops', 'sale']},
+            {'sku': '', 'title': 'No SKU'},
+            {'sku': 'A-3', 'title': 'Case', 'price': '5', 'categories': 'electronics/phones/cases',
+             'images': f'file://{image}'},
+        ]
+
+    def write_feed(self, rows):
+        path = os.path.join(self.directory, 'feed.jsonl')
+        with open(path, 'w') as file:
+            file.writelines(json.dumps(row) + '\n' for row in rows)
+        return path
+
+    def import_feed(self, path, **options):
+        output = StringIO()
+        with override_settings(MEDIA_ROOT=self.directory):
+            call_command('import_catalog', path, salesman='supplier@example.com', batch_size=2, stdout=output,
+                         stderr=StringIO(), **options)
+        return json.loads(output.getvalue())
+
+    def test_import_and_upsert(self):
+        path = self.write_feed(self.rows)
+        report = self.import_feed(path)
+        self.assertEqual((report['created'], report['errors'], report['categories'], report['images']), (3, 1, 5, 1))
+        # Local files are not read through the feed
+        self.assertEqual(report['image_errors'], 1)
+        self.assertEqual(Item.objects.get(sku='A-3').image.count(), 0)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+        phones = Category.objects.get(slug='phones')
+        self.assertEqual(phones.parent.slug, 'electronics')
+        self.assertEqual(list(phones.get_descendants().values_list('slug', flat=True)), ['cases'])
+        laptop = Item.objects.get(sku='A-2')
+        self.assertEqual(sorted(laptop.category.values_list('slug', flat=True)), ['laptops', 'sale'])
+        self.assertEqual(Item.objects.get(sku='A-1').image.count(), 1)
+
+        self.rows[0]['price'] = '120'
+        report = self.import_feed(self.write_feed(self.rows))
+        self.assertEqual((report['created'], report['updated'], report['images']), (0, 3, 0))
+        self.assertEqual(Item.objects.get(sku='A-1').price, 120)
+        self.assertEqual(Item.objects.count(), 3)
+
+    def test_thumbnails(self):
+        with override_settings(MEDIA_ROOT=self.directory, SHOP_THUMBNAIL_WORKERS=0), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.import_feed(self.write_feed(self.rows[:1]))
+        gallery = ProductGallery.objects.get(product__sku='A-1')
+        self.assertTrue(gallery.has_thumbnails)
+        card = os.path.join(self.directory, 'thumbnails', 'card', f'{gallery.image.name}.webp')
+        self.assertTrue(os.path.exists(card))
+
+    def test_failed_batch_removes_images(self):
+        with mock.patch.object(ImportCatalogCommand, 'set_categories', side_effect=RuntimeError('failed')), \
+                self.assertRaises(RuntimeError):
+            self.import_feed(self.write_feed(self.rows[:1]))
+        self.assertFalse(ProductGallery.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'gallery_product')), [])
+
+    def test_resume_after_checkpoint(self):
+        path = self.write_feed(self.rows)
+        stat = os.stat(path)
+        with open(f'{path}.checkpoint', 'w') as file:
+            json.dump({'rows': 2, 'rebuild_tree': False, 'feed': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}},
+                      file)
+
+        # A feed rewritten with the same size is not resumed
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        with self.assertRaises(CommandError):
+            self.import_feed(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        report = self.import_feed(path)
+        self.assertEqual((report['rows'], report['errors']), (1, 1))
+        self.assertEqual(list(Item.objects.values_list('sku', flat=True)), ['A-3'])
+
+
+class ExportTest(TestCase):
+    """
+    The exports stream the rows by chunks with their related rows and resume after the last exported id
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('accountant@example.com', 'password', is_staff=True)
+        cls.phone = Item.objects.create(title='Phone', description='Smartphone', price=100, salesman=cls.user)
+        cls.case = Item.objects.create(title='Case', description='Phone case', price=10, salesman=cls.user)
+
+    def create_purchases(self, count):
+        for _ in range(count):
+            purchase = Purchase.objects.create(
+                user=self.user, is_delivery=False, email='buyer@example.com', total_price=210
+            )
+            PurchaseLine.objects.create(purchase=purchase, item=self.phone, title='Phone', unit_price=100, quantity=2)
+            PurchaseLine.objects.create(purchase=purchase, item=self.case, title='Case', unit_price=10)
+
+    def export(self, name, **options):
+        output = StringIO()
+        call_command('export_data', name, stdout=output, stderr=StringIO(), **options)
+        return output.getvalue()
+
+    def test_csv_lines_and_constant_queries(self):
+        self.create_purchases(2)
+        with CaptureQueriesContext(connection) as few:
+            rows = list(csv.DictReader(StringIO(self.export('purchases', format='csv'))))
+        self.assertEqual([(row['line_title'], row['line_quantity']) for row in rows],
+                         [('Phone', '2'), ('Case', '1'), ('Phone', '2'), ('Case', '1')])
+
+        self.create_purchases(10)
+        with CaptureQueriesContext(connection) as many:
+            self.export('purchases', format='csv')
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_incremental_state(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        state = os.path.join(directory, 'state.json')
+        self.create_purchases(3)
+        first = [json.loads(line) for line in self.export('purchases', state=state, chunk_size=2).splitlines()]
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(first[0]['lines']), 2)
+        self.assertEqual(self.export('purchases', state=state), '')
+
+        self.create_purchases(1)
+        last = [json.loads(line) for line in self.export('purchases', state=state).splitlines()]
+        self.assertEqual([purchase['id'] for purchase in last], [Purchase.objects.order_by('pk').last().pk])
+
+    def test_view(self):
+        response = self.client.get(reverse('export', args=['items']))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.user)
+        today = date.today().isoformat()
+        response = self.client.get(reverse('export', args=['items']), {'format': 'csv', 'from': today, 'to': today})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['title'] for row in rows], ['Phone', 'Case'])
+
+        response = self.client.get(reverse('export', args=['items']), {'since_id': self.phone.pk})
+        documents = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([document['title'] for document in documents], ['Case'])
+        self.assertEqual(self.client.get(reverse('export', args=['items']), {'from': 'May'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export', args=['users'])).status_code, 404)
@@ -0,0 +1,118 @@
+"""
+Import required libraries for the thumbnails of the product gallery
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor, Future
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from shop.models import ProductGallery
+from shop.sevices import touch_items
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = 'thumbnails'
+VARIANTS = {
+    'card': 300,
+    'detail': 800,
+    'zoom': 1600,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+SRCSET_VARIANTS = {
+    'card': ['card', 'detail'],
+    'detail': ['detail', 'zoom'],
+    'zoom': ['zoom'],
+}
+
+_pool = None
+
+
+def get_variant_name(name: str, variant: str, extension: str) -> str:
+    # The source extension is kept, so that a.png and a.jpg do not share their thumbnails
+    return f'{THUMBNAILS_DIR}/{variant}/{name}.{extension}'
+
+
+def generate_variants(name: str) -> list:
+    """
+    Write every size and format of the stored image to the default storage and return the names of the written files.
+    It runs in the worker processes, so it does not touch the database
+    """
+    with default_storage.open(name) as file, Image.open(file) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        names = []
+        for variant, size in VARIANTS.items():
+            image = original.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            for extension, (image_format, options) in FORMATS.items():
+                content = BytesIO()
+                image.save(content, image_format, **options)
+                variant_name = get_variant_name(name, variant, extension)
+                # Storages add a suffix to taken names, the variant of a replaced image overwrites the old one
+                default_storage.delete(variant_name)
+                names.append(default_storage.save(variant_name, ContentFile(content.getvalue())))
+    return names
+
+
+def set_generated(gallery_ids: list) -> None:
+    """
+    Flag the gallery entries as having thumbnails and mark their items and the catalog as changed
+    """
+    ProductGallery.objects.filter(pk__in=gallery_ids).update(has_thumbnails=True)
+    touch_items(list(ProductGallery.objects.filter(pk__in=gallery_ids).values_list('product_id', flat=True)))
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'SHOP_THUMBNAIL_WORKERS', 2))
+    return _pool
+
+
+def mark_generated(gallery_id: int, future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error('Cannot generate the thumbnails of the gallery image %s: %s', gallery_id, error)
+        return
+    try:
+        set_generated([gallery_id])
+    finally:
+        connection.close()
+
+
+def submit_thumbnails(gallery_id: int, name: str) -> Future:
+    future = get_pool().submit(generate_variants, name)
+    future.add_done_callback(lambda done: mark_generated(gallery_id, done))
+    return future
+
+
+def schedule_thumbnails(gallery: ProductGallery) -> None:
+    """
+    Generate the thumbnails of the gallery image in the process pool once the transaction is committed.
+    With SHOP_THUMBNAIL_WORKERS set to 0 they are generated in the current process instead
+    """
+    gallery_id, name = gallery.pk, gallery.image.name
+    if not getattr(settings, 'SHOP_THUMBNAIL_WORKERS', 2):
+        def generate():
+            generate_variants(name)
+            set_generated([gallery_id])
+        transaction.on_commit(generate)
+        return
+    transaction.on_commit(lambda: submit_thumbnails(gallery_id, name))
+
+
+def get_variant_url(gallery: ProductGallery, variant: str, extension: str) -> str:
+    return default_storage.url(get_variant_name(gallery.image.name, variant, extension))
+
+
+def get_srcset(gallery: ProductGallery, variant: str, extension: str) -> str:
+    return ', '.join(
+        f'{get_variant_url(gallery, name, extension)} {VARIANTS[name]}w' for name in SRCSET_VARIANTS[variant]
+    )
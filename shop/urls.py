@@ -1,20 +1,37 @@
+from django.conf import settings
 from django.urls import path
 
 from shop.views import ProductsList, ItemDetail, ShopCategory, ShopSearch, ShopFavorite, \
     UserBasket, add_favorite_view, delete_favorite_view, check_favorite_view, add_to_basket_view, \
-    delete_from_basket_view, check_basket_view
+    delete_from_basket_view, update_basket_quantity_view, check_basket_view, category_tree_view, facets_view, \
+    cache_stats_view, items_status_view, toggle_favorite_view, item_reviews_view, db_pool_stats_view, \
+    metrics_view, export_view
+
+if settings.SHOP_ASYNC_VIEWS:
+    from shop.async_views import add_favorite_view, delete_favorite_view, check_favorite_view, add_to_basket_view, \
+        delete_from_basket_view, check_basket_view
 
 urlpatterns = [
     path('', ProductsList.as_view(), name='product_list'),
     path('<str:slug>', ShopCategory.as_view(), name='shop_category'),
+    path('categories/', category_tree_view, name='category_tree'),
+    path('facets/', facets_view, name='facets'),
+    path('cache-stats/', cache_stats_view, name='cache_stats'),
+    path('db-pool-stats/', db_pool_stats_view, name='db_pool_stats'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('export/<str:name>/', export_view, name='export'),
     path('search/', ShopSearch.as_view(), name='search'),
     path('favorite/', ShopFavorite.as_view(), name='favorite'),
     path('basket/', UserBasket.as_view(), name='basket'),
     path('product/<int:pk>/', ItemDetail.as_view(), name='item_detail'),
+    path('product/<int:pk>/reviews/', item_reviews_view, name='item_reviews'),
     path('product/add-favorite/', add_favorite_view, name='add_favorite'),
     path('product/delete-favorite/', delete_favorite_view, name='delete_favorite'),
+    path('product/toggle-favorite/', toggle_favorite_view, name='toggle_favorite'),
     path('product/check-favorite/<int:item_pk>/', check_favorite_view, name='check_favorite'),
     path('product/add-to-baket', add_to_basket_view, name='add_to_basket'),
     path('product/delete-from-baket', delete_from_basket_view, name='delete_from_basket'),
+    path('product/basket-quantity/', update_basket_quantity_view, name='update_basket_quantity'),
     path('product/check-basket/<int:item_pk>/', check_basket_view, name='check_basket'),
+    path('product/status/', items_status_view, name='items_status'),
 ]
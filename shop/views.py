@@ -1,22 +1,99 @@
 """
 The necessary imports for the shop view module
 """
+import hashlib
+import json
+from datetime import date
+
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseRedirect, JsonResponse
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.http import HttpResponseRedirect, JsonResponse, HttpResponse, HttpResponseForbidden, Http404, \
+    HttpResponseBadRequest, HttpResponseNotAllowed, StreamingHttpResponse
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from django.views.generic import ListView, DetailView, FormView, CreateView
 
+from django_shop.db.pool import get_pools_stats
+from django_shop.metrics import collect_metrics, render_metrics
+from shop.cache import get_cache_stats, get_version, CATALOG_VERSION, CATEGORY_VERSION, POPULARITY_VERSION
+from shop.categories import get_category_menu_tree
+from shop.exports import EXPORTS, get_export_queryset, iter_documents, iter_export
+from shop.facets import get_facets, get_bucket_filter
 from shop.filters import get_item_filter, get_items_by_filter, get_items_by_category, get_search_items, \
-    get_favorite_items
+    get_favorite_items, POPULARITY_SORT
 from shop.forms import FilterProducts, ReviewForm, PurchaseForm
 from shop.models import Item
-from shop.sevices import get_items_from_basket, create_purchase, add_review, add_favorite, delete_favorite, \
-    check_favorite, add_to_basket, delete_from_basket
+from shop.pagination import paginate_by_cursor, CachedCountPaginator, get_count_key
+from shop.sevices import get_basket_lines, create_purchase, add_review, add_favorites, delete_favorites, \
+    toggle_favorites, check_favorite, add_to_basket, delete_from_basket, get_item_detail_queryset, get_items_status, \
+    get_basket_item_ids, get_basket_total, update_basket_quantity, get_item_reviews, serialize_review, \
+    get_user_state, get_item_updated_at
+
+
+MAX_STATUS_ITEMS = 100
+MAX_BASKET_QUANTITY = 999
+REVIEWS_PAGE_SIZE = 20
+
+
+class ItemsStatusMixin:
+    """
+    Mixin adds the basket and favorite membership of the shown items to the context
+    """
 
+    def get_status_item_ids(self, context):
+        return [item.pk for item in context[self.context_object_name]]
 
-class BaseShop(ListView, FormView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        status = get_items_status(self.request, self.get_status_item_ids(context))
+        context['basket_ids'] = status['basket']
+        context['favorite_ids'] = status['favorite']
+        return context
+
+
+def has_pending_messages(request) -> bool:
+    return bool(request.COOKIES.get(CookieStorage.cookie_name)) or SessionStorage.session_key in request.session
+
+
+class ConditionalViewMixin:
+    """
+    Mixin answers GET requests with 304 Not Modified when the ETag or Last-Modified of the page is unchanged,
+    before the page is queried or rendered, and applies the Cache-Control policy of the view.
+    The ETag covers the category and user state of the page layout, subclasses add their own parts.
+    Pages showing the user state must not set Last-Modified, If-Modified-Since alone would skip the user state
+    """
+    cache_policy = {'private': True, 'max_age': 0, 'must_revalidate': True}
+
+    def get_etag_parts(self, request, *args, **kwargs):
+        return []
+
+    def get_etag(self, request, *args, **kwargs):
+        parts = self.get_etag_parts(request, *args, **kwargs)
+        if parts is None or has_pending_messages(request):
+            return None
+        data = [get_version(CATEGORY_VERSION), request.get_full_path(), get_user_state(request), *parts]
+        return hashlib.md5(json.dumps(data, default=str).encode()).hexdigest()
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        view = condition(etag_func=self.get_etag, last_modified_func=self.get_last_modified)(super().dispatch)
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, **self.cache_policy)
+        return response
+
+
+class BaseShop(ConditionalViewMixin, ItemsStatusMixin, ListView, FormView):
     """
     The base view for other list views
     """
@@ -24,24 +101,94 @@ class BaseShop(ListView, FormView):
     template_name = 'shop/products.html'
     context_object_name = 'products'
     paginate_by = 10
+    paginator_class = CachedCountPaginator
     allow_empty = True
     form_class = FilterProducts
 
     def get_initial(self):
         return get_item_filter(self.request)
 
+    def get_sort_version(self) -> int:
+        # Purchases bump only the version of the order by popularity
+        return get_version(POPULARITY_VERSION) if self.get_initial()['sort'] == POPULARITY_SORT else 0
+
+    def get_etag_parts(self, request, *args, **kwargs):
+        return [get_version(CATALOG_VERSION), self.get_sort_version()]
+
+    def get_filter_params(self):
+        return {}
+
+    def get_count_params(self):
+        params = self.get_filter_params()
+        if params is None:
+            return None
+        item_filter = self.get_initial()
+        return {**params, 'min_price': item_filter['min_price'], 'max_price': item_filter['max_price']}
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        params = self.get_count_params()
+        count_key = page_key = None
+        if params is not None:
+            count_key = get_count_key(params)
+            page_key = get_count_key({**params, 'sort': self.get_initial()['sort'], 'version': self.get_sort_version()})
+        return super().get_paginator(
+            queryset, per_page, orphans, allow_empty_first_page, count_key=count_key, page_key=page_key, **kwargs
+        )
+
+    def filter_items(self, items):
+        return items
+
     def get_queryset(self):
         sort = self.get_initial()
-        return get_items_by_filter(sort)
+        return self.filter_items(get_items_by_filter(sort))
+
+    def get_facets(self):
+        params = self.get_filter_params()
+        key = get_count_key(params) if params is not None else None
+        return get_facets(self.filter_items(Item.objects.all()), self.kwargs.get('slug'), key)
+
+    def use_cursor_pagination(self):
+        return getattr(settings, 'SHOP_CURSOR_PAGINATION', False)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        page = paginate_by_cursor(queryset, page_size, self.request.GET.get('cursor'))
+        return None, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(**kwargs)
         params = self.request.GET.items()
-        params_str = ''.join([f'&{key}={value}' for key, value in params if key != 'page'])
+        params_str = ''.join([f'&{key}={value}' for key, value in params if key not in ('page', 'cursor')])
         context['params'] = params_str
+        context['cursor_pagination'] = self.use_cursor_pagination()
+        context['facets'] = self.get_facets()
+        context['price_links'] = self.get_price_links(context['facets']['histogram'])
+        if context['facets']['max_price'] is not None:
+            context['form'].fields['max_price'].widget.attrs['placeholder'] = context['facets']['max_price']
         return context
 
 
+    def get_price_links(self, histogram: list) -> list:
+        """
+        Return the non-empty price buckets with the query string of the listing filtered by their prices,
+        keeping the search, the sort and the other parameters of the current request
+        """
+        links = []
+        for bucket in histogram:
+            if not bucket['count']:
+                continue
+            query = self.request.GET.copy()
+            for key in ('page', 'cursor', 'min_price', 'max_price'):
+                query.pop(key, None)
+            for key, value in get_bucket_filter(bucket).items():
+                if value is not None:
+                    query[key] = value
+            links.append({**bucket, 'query': query.urlencode()})
+        return links
+
+
 class ProductsList(BaseShop):
     """
     View displays the entire list of items for sale
@@ -53,20 +200,24 @@ class ShopCategory(BaseShop):
     View filters the items based on a specific category
     """
 
-    def get_queryset(self):
-        items = super().get_queryset()
+    def filter_items(self, items):
         return get_items_by_category(items, category=self.kwargs['slug'])
 
+    def get_filter_params(self):
+        return {'category': self.kwargs['slug']}
+
 
 class ShopSearch(BaseShop):
     """
     View filters the items based on a search term
     """
 
-    def get_queryset(self):
+    def filter_items(self, items):
         search = self.request.GET.get('s', '')
-        items = super().get_queryset()
-        return get_search_items(items, search=search)
+        return get_search_items(items, search=search, sort=self.get_initial().get('sort'))
+
+    def get_filter_params(self):
+        return {'search': self.request.GET.get('s', '')}
 
 
 class ShopFavorite(LoginRequiredMixin, BaseShop):
@@ -74,34 +225,49 @@ class ShopFavorite(LoginRequiredMixin, BaseShop):
     View displays the list of favorite items for the logged-in user
     """
 
-    def get_queryset(self):
-        items = super().get_queryset()
+    def filter_items(self, items):
         return get_favorite_items(items, self.request.user.pk)
 
+    def get_filter_params(self):
+        return None
+
 
 class UserBasket(CreateView, ListView):
     """
-    View displays the items in the user's basket and allows the user to purchase it
+    View displays the lines of the user's basket and allows the user to purchase it
     """
+    cache_policy = {'private': True, 'no_cache': True, 'no_store': True}
     model = Item
     template_name = 'shop/basket.html'
-    context_object_name = 'products'
+    context_object_name = 'lines'
     allow_empty = True
 
     form_class = PurchaseForm
     success_url = reverse_lazy('basket')
 
     def get_queryset(self):
-        return get_items_from_basket(self.request)
+        return get_basket_lines(self.request)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['total_price'] = get_basket_total(context['lines'])
+        return context
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        patch_cache_control(response, **self.cache_policy)
+        return response
 
     def form_valid(self, form):
-        create_purchase(form, self.request)
-        self.request.session['basket'] = []
+        self.object = create_purchase(form, self.request)
+        if self.object is None:
+            messages.error(self.request, 'Корзина пуста')
+            return HttpResponseRedirect(self.success_url)
         messages.success(self.request, 'Ваш заказ успешно оформлен!')
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
 
 
-class ItemDetail(DetailView, CreateView):
+class ItemDetail(ConditionalViewMixin, ItemsStatusMixin, DetailView, CreateView):
     """
     View for a specific Item instance with adding a review for the item
     """
@@ -110,6 +276,26 @@ class ItemDetail(DetailView, CreateView):
     context_object_name = 'product'
     form_class = ReviewForm
 
+    def get_status_item_ids(self, context):
+        return [self.object.pk]
+
+    def get_updated_at(self):
+        if not hasattr(self, '_updated_at'):
+            self._updated_at = get_item_updated_at(self.kwargs['pk'])
+        return self._updated_at
+
+    def get_etag_parts(self, request, *args, **kwargs):
+        updated_at = self.get_updated_at()
+        return None if updated_at is None else [updated_at.isoformat()]
+
+    def get_queryset(self):
+        return get_item_detail_queryset()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['reviews'] = paginate_by_cursor(get_item_reviews(self.object.pk), REVIEWS_PAGE_SIZE)
+        return context
+
     def form_invalid(self, form):
         messages.error(self.request, 'Ошибка при добавлении комментария')
         return HttpResponseRedirect(self.request.META.get('HTTP_REFERER', '/'))
@@ -119,26 +305,41 @@ class ItemDetail(DetailView, CreateView):
         return HttpResponseRedirect(self.request.META.get('HTTP_REFERER', '/'))
 
 
+def get_posted_item_ids(request) -> list:
+    return [int(item_id) for item_id in request.POST.getlist('item') if item_id.isdigit()]
+
+
 @login_required
 def add_favorite_view(request):
     """
-    Add an Item to the user's favorite list
+    Add one or several Items (repeated `item` fields) to the user's favorite list
     """
     if request.method == 'POST':
-        add_favorite(item_id=request.POST.get('item'), user_id=request.user.pk)
+        add_favorites(get_posted_item_ids(request), user_id=request.user.pk)
         return JsonResponse({'success': True})
 
 
 @login_required
 def delete_favorite_view(request):
     """
-    Delete an Item from the user's favorite list
+    Delete one or several Items (repeated `item` fields) from the user's favorite list
     """
     if request.method == 'POST':
-        delete_favorite(item_id=request.POST.get('item'), user_id=request.user.pk)
+        delete_favorites(get_posted_item_ids(request), user_id=request.user.pk)
         return JsonResponse({'success': True})
 
 
+@login_required
+def toggle_favorite_view(request):
+    """
+    Toggle one or several Items (repeated `item` fields) in the user's favorite list
+    """
+    if request.method == 'POST':
+        item_ids = get_posted_item_ids(request)
+        favorites = toggle_favorites(item_ids, user_id=request.user.pk)
+        return JsonResponse({'success': True, 'favorites': [item_id for item_id in item_ids if item_id in favorites]})
+
+
 def check_favorite_view(request, item_pk):
     """
     Check if an Item is in the user's favorite list
@@ -147,27 +348,170 @@ def check_favorite_view(request, item_pk):
         return JsonResponse({'is_favorite': check_favorite(item_pk, request.user.pk)})
 
 
-def add_to_basket_view(request, item_id=None):
+def get_posted_int(request, name: str):
+    try:
+        return int(request.POST.get(name, ''))
+    except ValueError:
+        return None
+
+
+def add_to_basket_view(request):
     """
-    Add an Item to the user's basket (stored in the session)
+    Add an Item to the user's basket or increase its quantity
     """
-    add_to_basket(request, item_id)
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    item_id = get_posted_int(request, 'item')
+    if item_id is None:
+        return JsonResponse({'error': 'item must be an integer'}, status=400)
+    if not add_to_basket(request, item_id):
+        return JsonResponse({'error': f'There is no item {item_id}'}, status=404)
     return JsonResponse({'success': True})
 
 
 def delete_from_basket_view(request):
     """
-    Remove an item from the basket (stored in the session)
+    Remove an item from the basket
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    item_id = get_posted_int(request, 'item')
+    if item_id is None:
+        return JsonResponse({'error': 'item must be an integer'}, status=400)
+    delete_from_basket(request, item_id)
+    return JsonResponse({'success': True})
+
+
+def update_basket_quantity_view(request):
+    """
+    Set the quantity of an item in the basket, a quantity below one removes the item
     """
-    delete_from_basket(request)
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    item_id, quantity = get_posted_int(request, 'item'), get_posted_int(request, 'quantity')
+    if item_id is None:
+        return JsonResponse({'error': 'item must be an integer'}, status=400)
+    if quantity is None or quantity > MAX_BASKET_QUANTITY:
+        return JsonResponse({'error': f'quantity must be an integer up to {MAX_BASKET_QUANTITY}'}, status=400)
+    update_basket_quantity(request, item_id, quantity)
     return JsonResponse({'success': True})
 
 
 def check_basket_view(request, item_pk):
     """
-    Check if an item is in the basket (stored in the session)
+    Check if an item is in the basket
     """
     if request.method == 'GET':
-        basket = request.session.get('basket', [])
-        in_basket = bool(item_pk in basket)
+        in_basket = item_pk in get_basket_item_ids(request, [item_pk])
         return JsonResponse({'in_basket': in_basket})
+
+
+def items_status_view(request):
+    """
+    Check which of the listed items (?ids=1,2,3) are in the basket and in the user's favorite list
+    """
+    if request.method == 'GET':
+        try:
+            item_ids = [int(item_id) for item_id in request.GET.get('ids', '').split(',') if item_id]
+        except ValueError:
+            return JsonResponse({'error': 'ids must be a comma separated list of integers'}, status=400)
+
+        item_ids = item_ids[:MAX_STATUS_ITEMS]
+        status = get_items_status(request, item_ids)
+        return JsonResponse({'items': {
+            item_id: {'in_basket': item_id in status['basket'], 'is_favorite': item_id in status['favorite']}
+            for item_id in item_ids
+        }})
+
+
+def item_reviews_view(request, pk):
+    """
+    Return a page of the reviews of an item following the cursor
+    """
+    if request.method == 'GET':
+        page = paginate_by_cursor(get_item_reviews(pk), REVIEWS_PAGE_SIZE, request.GET.get('cursor'))
+        return JsonResponse({
+            'reviews': [serialize_review(review) for review in page],
+            'next_cursor': page.next_cursor,
+        })
+
+
+def facets_view(request):
+    """
+    Return the price and category facets of the items in a category and/or matching a search term
+    """
+    if request.method == 'GET':
+        category = request.GET.get('category') or None
+        search = request.GET.get('s', '')
+        items = Item.objects.all()
+        if category:
+            items = get_items_by_category(items, category=category)
+        items = get_search_items(items, search=search)
+        key = get_count_key({'category': category, 'search': search})
+        return JsonResponse({'facets': get_facets(items, category, key)})
+
+
+def category_tree_view(request):
+    """
+    Return the categories menu as a JSON tree
+    """
+    if request.method == 'GET':
+        return JsonResponse({'categories': get_category_menu_tree()})
+
+
+@staff_member_required
+def cache_stats_view(request):
+    """
+    Return the hit and miss counters of the listing caches
+    """
+    if request.method == 'GET':
+        return JsonResponse({'cache': get_cache_stats(['page', 'count', 'facets', 'category_menu'])})
+
+
+@staff_member_required
+def db_pool_stats_view(request):
+    """
+    Return the statistics of the database connection pools of the worker process serving the request
+    """
+    if request.method == 'GET':
+        return JsonResponse({'pools': get_pools_stats()})
+
+
+def metrics_view(request):
+    """
+    Return the request metrics of all the worker processes in the Prometheus text format,
+    to staff users and to the scrapers of SHOP_METRICS_ALLOWED_IPS (none by default)
+    """
+    allowed_ips = getattr(settings, 'SHOP_METRICS_ALLOWED_IPS', [])
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(collect_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def export_view(request, name):
+    """
+    Stream the items, the purchases or the reviews as CSV or JSON lines (?format=csv|jsonl),
+    filtered by creation dates (?from=YYYY-MM-DD&to=YYYY-MM-DD) and by the last exported id (?since_id=)
+    """
+    if name not in EXPORTS:
+        raise Http404
+    export_format = request.GET.get('format', 'jsonl')
+    try:
+        since_id = int(request.GET.get('since_id') or 0)
+        date_from, date_to = (
+            date.fromisoformat(request.GET[key]) if request.GET.get(key) else None for key in ('from', 'to')
+        )
+    except ValueError:
+        return HttpResponseBadRequest('since_id must be a number and the dates YYYY-MM-DD')
+    if export_format not in ('csv', 'jsonl'):
+        return HttpResponseBadRequest('format must be csv or jsonl')
+
+    documents = iter_documents(name, get_export_queryset(name, since_id, date_from, date_to))
+    response = StreamingHttpResponse(
+        iter_export(name, export_format, documents),
+        content_type='text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    patch_cache_control(response, private=True, no_store=True)
+    return response
@@ -13,4 +13,4 @@ def get_user(user_id: int) -> CustomUser:
 
 
 def get_user_purchases(user_id: int) -> QuerySet:
-    return Purchase.objects.filter(user=user_id).all()
+    return Purchase.objects.filter(user=user_id).order_by('-created_at', '-pk').prefetch_related('lines')
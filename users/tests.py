@@ -1,3 +1,54 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from shop.models import Purchase, PurchaseLine
+from users.models import CustomUser
+
+
+class PurchaseHistoryTest(TestCase):
+    """
+    The purchase history is paginated and its number of queries does not depend on the number of orders
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer@example.com', 'password')
+
+    def create_purchases(self, count):
+        for number in range(count):
+            purchase = Purchase.objects.create(
+                user=self.user, is_delivery=False, email='buyer@example.com', total_price=300
+            )
+            PurchaseLine.objects.create(purchase=purchase, title=f'Phone {number}', unit_price=100, quantity=2)
+            PurchaseLine.objects.create(purchase=purchase, title=f'Case {number}', unit_price=100)
+
+    def count_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_constant_queries(self):
+        self.client.force_login(self.user)
+        self.create_purchases(2)
+        few, _ = self.count_queries(reverse('purchases'))
+
+        self.create_purchases(25)
+        many, response = self.count_queries(reverse('purchases'))
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.context['purchases']), 10)
+        self.assertEqual(response.context['purchases'][0].items_count, 3)
+
+    def test_pages_cover_all_purchases(self):
+        self.client.force_login(self.user)
+        self.create_purchases(25)
+        seen = []
+        url = reverse('purchases')
+        while url:
+            page = self.client.get(url).context['page_obj']
+            seen.extend(purchase.pk for purchase in page)
+            url = f"{reverse('purchases')}?cursor={page.next_cursor}" if page.has_next() else None
+        self.assertEqual(seen, list(Purchase.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)))
@@ -10,6 +10,7 @@ from django.urls import reverse
 from django.views.generic import CreateView, FormView, DetailView, UpdateView, ListView
 
 from shop.models import Purchase
+from shop.pagination import paginate_by_cursor
 from users.forms import UserLoginForm, UserRegisterForm, ProfileForm, EmailForm
 from users.serices import get_user_profile, get_user, get_user_purchases
 
@@ -104,10 +105,15 @@ class PurchaseView(LoginRequiredMixin, ListView):
     model = Purchase
     template_name = 'user/history_purchases.html'
     context_object_name = 'purchases'
+    paginate_by = 10
 
     def get_queryset(self):
         return get_user_purchases(self.request.user.pk)
 
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_by_cursor(queryset, page_size, self.request.GET.get('cursor'))
+        return None, page, page.object_list, page.has_other_pages()
+
 
 @login_required
 def logout_view(request):